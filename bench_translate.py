@@ -0,0 +1,624 @@
+#! /usr/bin/env python3
+
+"""Benchmarks for the public functions of `translate`.
+
+Times `translate_sequence`, `get_all_translations`, `reverse_and_complement`
+and `get_longest_peptide` on seeded synthetic sequences of growing size,
+records their peak memory with `tracemalloc`, and writes the results as JSON
+together with how time and memory scale with the input size. With
+`--compare`, the results are checked against a saved baseline and
+regressions are reported. With `--cache`, the throughput of
+`get_longest_peptide` on duplicated reads is measured with and without a
+`translate.TranslationCache` instead. With `--server`, a load generator
+measures the throughput and latency of a `translate.py --serve` process
+against running `translate.py` once per sequence.
+
+    $ python3 bench_translate.py --max-size 1e7 --output bench.json
+    $ python3 bench_translate.py --compare bench.json
+    $ python3 bench_translate.py --cache --duplication 0.7
+    $ python3 bench_translate.py --server --reads 50000 --connections 16
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import translate
+
+# The genetic code used by every benchmark, as a dict like callers pass it.
+GENETIC_CODE = translate.GeneticCode.from_ncbi_table(1).as_dict()
+
+# Spacing (in bases) of the reading frames planted in sparse sequences.
+SPARSE_ORF_SPACING = 50000
+
+DEFAULT_SEED = 1
+DEFAULT_MIN_SIZE = 1000
+DEFAULT_MAX_SIZE = 1000000
+# A benchmark is a time regression when it is this many times slower than
+# the baseline, or a memory regression when it needs this many times more
+# memory.
+DEFAULT_TIME_THRESHOLD = 1.25
+DEFAULT_MEMORY_THRESHOLD = 1.25
+# Scaling exponents that grow by more than this are regressions.
+DEFAULT_EXPONENT_THRESHOLD = 0.15
+# Timings shorter than this are too noisy to flag.
+DEFAULT_MIN_SECONDS = 0.001
+# Reads for the cache benchmark: about 70% of the reads of an amplicon or
+# highly expressed transcript library repeat an earlier read.
+DEFAULT_READS = 20000
+DEFAULT_READ_LENGTH = 150
+DEFAULT_DUPLICATION = 0.7
+
+_RANDOM_BASE_TABLE = bytes(b"ACGU"[index % 4] for index in range(256))
+# No U, so no start or stop codons
+_CODING_BASE_TABLE = bytes(b"ACG"[index % 3] for index in range(256))
+_DNA_TABLE = bytes.maketrans(b"U", b"T")
+
+
+def dense_sequence(size, rng):
+    """Get `size` random bases with a start codon about every 30 bases.
+
+    Start and stop codons are common in all six frames, so there are many
+    short, nested reading frames.
+    """
+    bases = rng.randbytes(size).translate(_RANDOM_BASE_TABLE)
+    pieces = []
+    for position in range(0, size, 30):
+        piece = bases[position: position + 30]
+        if len(piece) == 30:
+            piece = piece[:27] + b"AUG"
+        pieces.append(piece)
+    return b"".join(pieces).decode("ascii")
+
+def sparse_sequence(size, rng):
+    """Get `size` bases with a long reading frame every so often.
+
+    The bases between reading frames hold no start or stop codons, so there
+    are few reading frames, each a few thousand codons long.
+    """
+    bases = bytearray(rng.randbytes(size).translate(_CODING_BASE_TABLE))
+    for position in range(0, size - 3, SPARSE_ORF_SPACING):
+        bases[position: position + 3] = b"AUG"
+        stop = position + 3 * rng.randint(100, SPARSE_ORF_SPACING // 4)
+        if stop + 3 <= size:
+            bases[stop: stop + 3] = b"UAA"
+    return bases.decode("ascii")
+
+def coding_sequence(size, rng):
+    """Get a single reading frame of `size` bases, with no stop codon."""
+    bases = rng.randbytes(max(size - 3, 0)).translate(_CODING_BASE_TABLE)
+    return ("AUG" + bases.decode("ascii"))[:size]
+
+PROFILES = {
+    "dense": dense_sequence,
+    "sparse": sparse_sequence,
+    "coding": coding_sequence,
+}
+
+def make_sequence(profile, size, alphabet, seed = DEFAULT_SEED):
+    """Get the synthetic sequence for `profile`, `size` and `alphabet`.
+
+    The same arguments always give the same sequence.
+    """
+    rng = random.Random("{0}-{1}-{2}".format(seed, profile, size))
+    sequence = PROFILES[profile](size, rng)
+    if alphabet == "dna":
+        sequence = sequence.translate(_DNA_TABLE)
+    return sequence
+
+def make_reads(count, length, duplication, seed = DEFAULT_SEED):
+    """Get `count` dense reads of `length` bases, a `duplication` fraction
+    of which repeat an earlier read.
+
+    Repeated reads are drawn with a skewed distribution, so a few reads are
+    repeated many times, like adapters or highly expressed transcripts.
+    """
+    rng = random.Random("{0}-reads-{1}-{2}".format(seed, length,
+            duplication))
+    reads = []
+    unique = []
+    for index in range(count):
+        if unique and rng.random() < duplication:
+            reads.append(unique[int(len(unique) * rng.random() ** 3)])
+        else:
+            read = dense_sequence(length, rng)
+            unique.append(read)
+            reads.append(read)
+    return reads
+
+def run_cache_benchmark(count = DEFAULT_READS, length = DEFAULT_READ_LENGTH,
+        duplication = DEFAULT_DUPLICATION,
+        cache_entries = translate.DEFAULT_CACHE_ENTRIES, seed = DEFAULT_SEED):
+    """Time `get_longest_peptide` over duplicated reads with and without a
+    cache, and return the throughputs and cache counters as a dict.
+    """
+    reads = make_reads(count, length, duplication, seed)
+    function = BENCHMARKS["get_longest_peptide"][0]
+    function(reads[0])
+    result = {
+        "reads": count,
+        "read_length": length,
+        "duplication": duplication,
+        "cache_entries": cache_entries,
+    }
+    previous = translate.disable_cache()
+    try:
+        start = time.perf_counter()
+        for read in reads:
+            function(read)
+        result["uncached_reads_per_second"] = count / (
+                time.perf_counter() - start)
+        cache = translate.enable_cache(max_entries = cache_entries)
+        start = time.perf_counter()
+        for read in reads:
+            function(read)
+        result["cached_reads_per_second"] = count / (
+                time.perf_counter() - start)
+        result["cache"] = cache.as_dict()
+    finally:
+        translate.disable_cache()
+        if previous is not None:
+            translate.enable_cache(previous.max_entries, previous.max_bytes)
+    return result
+
+def format_cache_result(result):
+    """Format the result of `run_cache_benchmark` as lines of text."""
+    return [
+        "{0:,} reads of {1} bases, {2:.0%} duplicated".format(
+                result["reads"], result["read_length"],
+                result["duplication"]),
+        "{0:<24} {1:>10,.0f} reads/s".format("no cache",
+                result["uncached_reads_per_second"]),
+        "{0:<24} {1:>10,.0f} reads/s, {2:.1f}x, "
+                "{3:,} hits, {4:,} misses".format(
+                "cache ({0:,} entries)".format(result["cache_entries"]),
+                result["cached_reads_per_second"],
+                result["cached_reads_per_second"] /
+                        result["uncached_reads_per_second"],
+                result["cache"]["hits"], result["cache"]["misses"]),
+    ]
+
+
+# Defaults of `run_server_benchmark`
+DEFAULT_SERVER_REQUESTS = 20000
+DEFAULT_CONNECTIONS = 8
+DEFAULT_CLI_SAMPLES = 20
+# Seconds to wait for a server to start listening
+SERVER_START_TIMEOUT = 30
+
+def run_server_benchmark(count = DEFAULT_SERVER_REQUESTS,
+        length = DEFAULT_READ_LENGTH, connections = DEFAULT_CONNECTIONS,
+        processes = None, cli_samples = DEFAULT_CLI_SAMPLES,
+        seed = DEFAULT_SEED, server_options = ()):
+    """Measure the throughput of "orfs" requests to a `translate.py --serve`
+    process, and of running `translate.py` once per sequence like a workflow
+    engine would, and return both as a dict.
+
+    `count` reads of `length` bases are sent over `connections` concurrent
+    connections, each with as many requests in flight as the server allows.
+    The per-process CLI is timed on the first `cli_samples` reads.
+    `server_options` are extra command line options for the server.
+    """
+    reads = make_reads(count, length, 0.0, seed)
+    script = os.path.abspath(translate.__file__)
+    result = {
+        "requests": count,
+        "read_length": length,
+        "connections": connections,
+        "processes": processes,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "translate.sock")
+        command = [sys.executable, script, "--serve", "--socket", path]
+        if processes is not None:
+            command += ["--processes", str(processes)]
+        server = subprocess.Popen(command + list(server_options),
+                stderr = subprocess.PIPE)
+        try:
+            deadline = time.perf_counter() + SERVER_START_TIMEOUT
+            while not os.path.exists(path):
+                if (server.poll() is not None or
+                        time.perf_counter() > deadline):
+                    raise RuntimeError("The server did not start: {0}".format(
+                            server.stderr.read().decode("utf-8", "replace")))
+                time.sleep(0.01)
+            seconds, stats = asyncio.run(_send_requests(path, reads,
+                    connections))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.communicate()
+        result["server_requests_per_second"] = count / seconds
+        result["server"] = stats
+        fasta_path = os.path.join(directory, "read.fasta")
+        start = time.perf_counter()
+        for index, read in enumerate(reads[:cli_samples]):
+            with open(fasta_path, "w") as fasta_file:
+                fasta_file.write(">read{0}\n{1}\n".format(index, read))
+            subprocess.run([sys.executable, script, "--format", "tsv",
+                    fasta_path], stdout = subprocess.DEVNULL, check = True)
+        samples = min(cli_samples, count)
+        result["cli_samples"] = samples
+        result["cli_requests_per_second"] = samples / (
+                time.perf_counter() - start) if samples else None
+    return result
+
+async def _send_requests(path, reads, connections):
+    # Seconds taken to get the ORFs of all `reads`, and the server stats
+    clients = [await translate.TranslationClient.connect(path)
+            for index in range(connections)]
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(client.find_orfs(read) for client, read in
+                zip(itertools.cycle(clients), reads)))
+        seconds = time.perf_counter() - start
+        return seconds, await clients[0].stats()
+    finally:
+        for client in clients:
+            await client.close()
+
+def format_server_result(result):
+    """Format the result of `run_server_benchmark` as lines of text."""
+    lines = [
+        "{0:,} reads of {1} bases over {2} connections".format(
+                result["requests"], result["read_length"],
+                result["connections"]),
+        "{0:<24} {1:>10,.0f} requests/s, mean batch of {2:.1f}".format(
+                "server", result["server_requests_per_second"],
+                result["server"]["mean_batch_size"]),
+    ]
+    latencies = result["server"]["latency_seconds"]
+    lines.append("{0:<24} {1}".format("server latency", ", ".join(
+            "{0} {1:.2f} ms".format(percentile, 1000 * seconds)
+            for percentile, seconds in latencies.items()
+            if seconds is not None)))
+    if result["cli_requests_per_second"]:
+        lines.append("{0:<24} {1:>10,.1f} requests/s, server is "
+                "{2:,.0f}x faster".format("process per sequence",
+                        result["cli_requests_per_second"],
+                        result["server_requests_per_second"] /
+                                result["cli_requests_per_second"]))
+    return lines
+
+# name: (function of a sequence, profiles, alphabets)
+BENCHMARKS = {
+    "translate_sequence": (
+            lambda sequence: translate.translate_sequence(sequence,
+                    GENETIC_CODE),
+            ("coding",), ("rna", "dna")),
+    "translate_sequence[by codon]": (
+            lambda sequence: translate._translate_by_codon(sequence,
+                    translate.compile_genetic_code(GENETIC_CODE)),
+            ("coding",), ("rna",)),
+    "get_all_translations": (
+            lambda sequence: translate.get_all_translations(sequence,
+                    GENETIC_CODE),
+            ("dense", "sparse"), ("rna", "dna")),
+    "reverse_and_complement": (
+            translate.reverse_and_complement,
+            ("dense", "sparse"), ("rna", "dna")),
+    "get_longest_peptide": (
+            lambda sequence: translate.get_longest_peptide(sequence,
+                    GENETIC_CODE),
+            ("dense", "sparse"), ("rna", "dna")),
+}
+
+def get_sizes(min_size, max_size):
+    """Get the input sizes from `min_size` to `max_size`, ten times apart."""
+    sizes = []
+    size = int(min_size)
+    while size <= max_size:
+        sizes.append(size)
+        size *= 10
+    return sizes
+
+def time_call(function, argument, repeat):
+    """Get the shortest of `repeat` timings of `function(argument)`."""
+    best = None
+    for index in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def peak_memory(function, argument):
+    """Get the peak memory (in bytes) allocated by `function(argument)`."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        function(argument)
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+def scaling_exponent(sizes, values):
+    """Get the slope of log(`values`) against log(`sizes`).
+
+    An exponent of 1 means linear scaling, 2 quadratic. Returns `None` if
+    there are fewer than two usable points.
+    """
+    points = [(math.log(size), math.log(value)) for size, value in
+            zip(sizes, values) if size > 0 and value and value > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, y in points)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+def run_benchmarks(sizes, names = None, repeat = 3, memory = True,
+        seed = DEFAULT_SEED, log = None):
+    """Run the benchmarks and return the results as a JSON-ready dict."""
+    if names is None:
+        names = list(BENCHMARKS)
+    results = []
+    for name in names:
+        function, profiles, alphabets = BENCHMARKS[name]
+        for profile in profiles:
+            for alphabet in alphabets:
+                # Warm up caches (compiled genetic code, lookup tables)
+                function(make_sequence(profile, min(sizes), alphabet, seed))
+                for size in sizes:
+                    sequence = make_sequence(profile, size, alphabet, seed)
+                    # One run is enough for large inputs
+                    runs = repeat if size <= 1000000 else 1
+                    result = {
+                        "benchmark": name,
+                        "profile": profile,
+                        "alphabet": alphabet,
+                        "size": size,
+                        "seconds": time_call(function, sequence, runs),
+                        "peak_bytes": None,
+                    }
+                    if memory:
+                        result["peak_bytes"] = peak_memory(function, sequence)
+                    results.append(result)
+                    if log is not None:
+                        log.write(format_result(result) + "\n")
+                        log.flush()
+    return {
+        "metadata": {
+            "date": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": None if translate.numpy is None else
+                    translate.numpy.__version__,
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+        "scaling": get_scaling(results),
+    }
+
+def get_scaling(results):
+    """Get the time and memory scaling exponents of each benchmark series."""
+    scaling = []
+    for (name, profile, alphabet), points in _series(results).items():
+        sizes = sorted(points)
+        points = [points[size] for size in sizes]
+        scaling.append({
+            "benchmark": name,
+            "profile": profile,
+            "alphabet": alphabet,
+            "time_exponent": scaling_exponent(sizes,
+                    [point["seconds"] for point in points]),
+            "memory_exponent": scaling_exponent(sizes,
+                    [point["peak_bytes"] for point in points]),
+        })
+    return scaling
+
+def compare(report, baseline,
+        time_threshold = DEFAULT_TIME_THRESHOLD,
+        memory_threshold = DEFAULT_MEMORY_THRESHOLD,
+        exponent_threshold = DEFAULT_EXPONENT_THRESHOLD,
+        min_seconds = DEFAULT_MIN_SECONDS):
+    """Get a list of messages describing regressions from `baseline`.
+
+    `report` and `baseline` are dicts returned by `run_benchmarks`. Results
+    are matched by benchmark, profile, alphabet and size; results missing
+    from either side are ignored.
+    """
+    regressions = []
+    baseline_results = dict((_result_key(result), result) for result in
+            baseline["results"])
+    for result in report["results"]:
+        old = baseline_results.get(_result_key(result))
+        if old is None:
+            continue
+        label = "{0} [{1}, {2}, {3} bases]".format(*_result_key(result))
+        if (result["seconds"] >= min_seconds and
+                result["seconds"] > old["seconds"] * time_threshold):
+            regressions.append("{0}: {1:.4g} s, was {2:.4g} s".format(label,
+                    result["seconds"], old["seconds"]))
+        if (result["peak_bytes"] is not None and old["peak_bytes"] and
+                result["peak_bytes"] > old["peak_bytes"] * memory_threshold):
+            regressions.append("{0}: peak {1} bytes, was {2} bytes".format(
+                    label, result["peak_bytes"], old["peak_bytes"]))
+    # Exponents are only comparable over the same sizes, so they are
+    # recomputed from the sizes both reports have.
+    for key, points in _series(report["results"]).items():
+        old_points = _series(baseline["results"]).get(key, {})
+        sizes = sorted(set(points) & set(old_points))
+        if len(sizes) < 2:
+            continue
+        label = "{0} [{1}, {2}]".format(*key)
+        for field, name in (("seconds", "time"), ("peak_bytes", "memory")):
+            exponent = scaling_exponent(sizes,
+                    [points[size][field] for size in sizes])
+            old_exponent = scaling_exponent(sizes,
+                    [old_points[size][field] for size in sizes])
+            if exponent is None or old_exponent is None:
+                continue
+            if (exponent > old_exponent + exponent_threshold and
+                    points[sizes[-1]]["seconds"] >= min_seconds):
+                regressions.append(
+                        "{0}: {1} exponent {2:.2f}, was {3:.2f}".format(
+                                label, name, exponent, old_exponent))
+    return regressions
+
+def _series(results):
+    # Results by (benchmark, profile, alphabet), then by size
+    series = {}
+    for result in results:
+        series.setdefault(_result_key(result)[:3], {})[result["size"]] = result
+    return series
+
+def _result_key(result):
+    return (result["benchmark"], result["profile"], result["alphabet"],
+            result["size"])
+
+def format_result(result):
+    """Format one benchmark result as a line of text."""
+    line = "{0:<30} {1:<7} {2:<4} {3:>11,} {4:>10.4f} s".format(
+            result["benchmark"], result["profile"], result["alphabet"],
+            result["size"], result["seconds"])
+    if result["peak_bytes"] is not None:
+        line += " {0:>14,} bytes".format(result["peak_bytes"])
+    return line
+
+def format_scaling(scaling):
+    """Format the scaling exponents of a report as lines of text."""
+    lines = []
+    for item in scaling:
+        exponents = []
+        for field in ("time_exponent", "memory_exponent"):
+            if item[field] is None:
+                exponents.append("   -")
+            else:
+                exponents.append("{0:4.2f}".format(item[field]))
+        lines.append("{0:<30} {1:<7} {2:<4} time n^{3}  memory n^{4}".format(
+                item["benchmark"], item["profile"], item["alphabet"],
+                *exponents))
+    return lines
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--min-size", type = float,
+            default = DEFAULT_MIN_SIZE,
+            help = "smallest input, in bases (default: %(default)d)")
+    parser.add_argument("--max-size", type = float,
+            default = DEFAULT_MAX_SIZE,
+            help = "largest input, in bases (default: %(default)d)")
+    parser.add_argument("--benchmark", action = "append",
+            choices = sorted(BENCHMARKS), dest = "benchmarks",
+            help = "benchmark to run (default: all); can be repeated")
+    parser.add_argument("--repeat", type = int, default = 3,
+            help = "timings per input up to 1 Mb, best one kept "
+                    "(default: %(default)d)")
+    parser.add_argument("--no-memory", action = "store_true",
+            help = "do not measure peak memory")
+    parser.add_argument("--seed", type = int, default = DEFAULT_SEED)
+    parser.add_argument("--output",
+            help = "write the results as JSON to this file")
+    parser.add_argument("--compare", metavar = "BASELINE",
+            help = "JSON results to check for regressions against")
+    parser.add_argument("--time-threshold", type = float,
+            default = DEFAULT_TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type = float,
+            default = DEFAULT_MEMORY_THRESHOLD)
+    parser.add_argument("--exponent-threshold", type = float,
+            default = DEFAULT_EXPONENT_THRESHOLD)
+    parser.add_argument("--cache", action = "store_true",
+            help = "measure the throughput of cached get_longest_peptide on "
+                    "duplicated reads instead")
+    parser.add_argument("--reads", type = int,
+            help = "reads for --cache (default: {0}) or --server (default: "
+                    "{1})".format(DEFAULT_READS, DEFAULT_SERVER_REQUESTS))
+    parser.add_argument("--read-length", type = int,
+            default = DEFAULT_READ_LENGTH,
+            help = "read length for --cache and --server "
+                    "(default: %(default)d)")
+    parser.add_argument("--duplication", type = float,
+            default = DEFAULT_DUPLICATION,
+            help = "fraction of repeated reads for --cache "
+                    "(default: %(default)s)")
+    parser.add_argument("--cache-entries", type = int,
+            default = translate.DEFAULT_CACHE_ENTRIES,
+            help = "cache size for --cache (default: %(default)d)")
+    parser.add_argument("--server", action = "store_true",
+            help = "measure the throughput of a translate.py server against "
+                    "a translate.py process per sequence instead")
+    parser.add_argument("--connections", type = int,
+            default = DEFAULT_CONNECTIONS,
+            help = "concurrent connections for --server "
+                    "(default: %(default)d)")
+    parser.add_argument("--processes", type = int,
+            help = "server worker processes for --server (default: one per "
+                    "CPU)")
+    parser.add_argument("--cli-samples", type = int,
+            default = DEFAULT_CLI_SAMPLES,
+            help = "sequences to run translate.py on for --server "
+                    "(default: %(default)d)")
+    args = parser.parse_args(argv)
+
+    if args.server:
+        result = run_server_benchmark(
+                count = args.reads or DEFAULT_SERVER_REQUESTS,
+                length = args.read_length,
+                connections = args.connections,
+                processes = args.processes,
+                cli_samples = args.cli_samples,
+                seed = args.seed)
+        sys.stdout.write("\n".join(format_server_result(result)) + "\n")
+        if args.output:
+            with open(args.output, "w") as out:
+                json.dump(result, out, indent = 2)
+        return 0
+
+    if args.cache:
+        result = run_cache_benchmark(
+                count = args.reads or DEFAULT_READS,
+                length = args.read_length,
+                duplication = args.duplication,
+                cache_entries = args.cache_entries,
+                seed = args.seed)
+        sys.stdout.write("\n".join(format_cache_result(result)) + "\n")
+        if args.output:
+            with open(args.output, "w") as out:
+                json.dump(result, out, indent = 2)
+        return 0
+
+    report = run_benchmarks(
+            sizes = get_sizes(args.min_size, args.max_size),
+            names = args.benchmarks,
+            repeat = args.repeat,
+            memory = not args.no_memory,
+            seed = args.seed,
+            log = sys.stdout)
+    sys.stdout.write("\n".join(format_scaling(report["scaling"])) + "\n")
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent = 2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report, baseline,
+                time_threshold = args.time_threshold,
+                memory_threshold = args.memory_threshold,
+                exponent_threshold = args.exponent_threshold)
+        for message in regressions:
+            sys.stdout.write("REGRESSION: {0}\n".format(message))
+        if regressions:
+            return 1
+        sys.stdout.write("No regressions against {0}\n".format(args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+
+import unittest
+
+import bench_translate
+import translate
+
+class TestBenchTranslate(unittest.TestCase):
+
+    def test_sequences_are_seeded(self):
+        for profile in bench_translate.PROFILES:
+            seq = bench_translate.make_sequence(profile, 1000, "rna")
+            self.assertEqual(len(seq), 1000)
+            self.assertEqual(seq,
+                    bench_translate.make_sequence(profile, 1000, "rna"))
+            self.assertEqual(
+                    bench_translate.make_sequence(profile, 1000, "dna"),
+                    seq.replace("U", "T"))
+
+    def test_profiles(self):
+        code = bench_translate.GENETIC_CODE
+        dense = bench_translate.make_sequence("dense", 30000, "rna")
+        sparse = bench_translate.make_sequence("sparse", 30000, "rna")
+        self.assertGreater(
+                len(translate.get_all_translations(dense, code)),
+                10 * len(translate.get_all_translations(sparse, code)))
+        coding = bench_translate.make_sequence("coding", 3000, "rna")
+        self.assertEqual(len(translate.translate_sequence(coding, code)),
+                1000)
+
+    def test_scaling_exponent(self):
+        sizes = [10, 100, 1000]
+        self.assertAlmostEqual(
+                bench_translate.scaling_exponent(sizes, [1, 10, 100]), 1.0)
+        self.assertAlmostEqual(
+                bench_translate.scaling_exponent(sizes, [1, 100, 10000]), 2.0)
+        self.assertIsNone(bench_translate.scaling_exponent([10], [1]))
+
+    def test_compare(self):
+        report = bench_translate.run_benchmarks(
+                sizes = [1000, 10000],
+                names = ["reverse_and_complement"],
+                repeat = 1)
+        self.assertEqual(len(report["results"]), 8)
+        self.assertEqual(bench_translate.compare(report, report), [])
+        slower = {
+            "results": [dict(result, seconds = result["seconds"] * 10 + 1,
+                    peak_bytes = result["peak_bytes"] * 2)
+                    for result in report["results"]],
+            "scaling": report["scaling"],
+        }
+        regressions = bench_translate.compare(slower, report)
+        self.assertEqual(len(regressions), 16)
+
+    def test_cache_benchmark(self):
+        reads = bench_translate.make_reads(1000, 60, 0.7)
+        self.assertEqual(len(reads), 1000)
+        self.assertLess(len(set(reads)), 400)
+        result = bench_translate.run_cache_benchmark(count = 1000,
+                length = 60, duplication = 0.7)
+        self.assertEqual(result["cache"]["misses"], len(set(reads)))
+        self.assertEqual(result["cache"]["hits"], 1000 - len(set(reads)))
+        self.assertIsNone(translate.get_cache())
+
+    def test_server_benchmark(self):
+        result = bench_translate.run_server_benchmark(count = 200,
+                length = 60, connections = 2, processes = 1,
+                cli_samples = 1)
+        self.assertEqual(result["server"]["requests"], 200)
+        self.assertEqual(result["server"]["errors"], 0)
+        self.assertGreater(result["server_requests_per_second"], 0)
+        self.assertGreater(result["cli_requests_per_second"], 0)
+        self.assertEqual(len(bench_translate.format_server_result(result)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
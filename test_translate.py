@@ -1,7 +1,22 @@
 #! /usr/bin/env python3
 
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
 
+import bench_translate
 import translate
 
 class TestTranslateBaseClass(unittest.TestCase):
@@ -112,6 +127,77 @@ class TestTranslateBaseClass(unittest.TestCase):
         self.assertEqual(amino_acid_seq, expected_result, message)
 
 
+class TestGeneticCode(TestTranslateBaseClass):
+
+    def test_standard_ncbi_table(self):
+        code = translate.GeneticCode.from_ncbi_table(1)
+        self.assertEqual(code.as_dict(), self.genetic_code)
+        self.assertEqual(code, translate.GeneticCode(self.genetic_code))
+        self.assertEqual(code.stop_codons, frozenset(["UAA", "UAG", "UGA"]))
+        self.assertEqual(code.start_codons, frozenset(["AUG"]))
+
+    def test_vertebrate_mitochondrial_table(self):
+        self.run_translate_sequence(
+                rna_seq = "AUGUGAAGA",
+                expected_amino_acid_seq = "MW",
+                gen_code = 2)
+
+    def test_dna_codons(self):
+        dna_code = {"ATG": "M", "AAA": "K", "TAA": "*"}
+        for seq in ("ATGAAATAA", "AUGAAAUAA", "atgaaataa"):
+            self.assertEqual(translate.translate_sequence(seq, dna_code),
+                    "MK")
+        code = translate.GeneticCode(dna_code, start_codons = ("ATG",))
+        self.assertEqual(code.stop_codons, frozenset(["UAA"]))
+        self.assertEqual(code.start_codons, frozenset(["AUG"]))
+        self.assertEqual(code, translate.GeneticCode(
+                {"AUG": "M", "AAA": "K", "UAA": "*"}))
+        self.assertEqual(translate.get_longest_peptide("CCATGAAATAA",
+                dna_code), "MK")
+
+    def test_unknown_ncbi_table(self):
+        self.assertRaises(ValueError,
+                translate.GeneticCode.from_ncbi_table, 999)
+
+    def test_dicts_are_compiled_once(self):
+        code = translate.compile_genetic_code(self.genetic_code)
+        self.assertIs(code,
+                translate.compile_genetic_code(dict(self.genetic_code)))
+        self.assertIs(translate.compile_genetic_code(code), code)
+
+    def test_compiled_code_translates(self):
+        code = translate.compile_genetic_code(self.genetic_code)
+        self.run_translate_sequence(
+                rna_seq = "GUCGAAUAACGA",
+                expected_amino_acid_seq = "VE",
+                gen_code = code)
+        self.run_get_all_translations(
+                rna_seq = "CCUGAAUGACGUACGUAUGACUGCAGUACGUUACGUACG",
+                expected_results = ["MTYV", "MTAVRYV"],
+                gen_code = code)
+
+    def test_invalid_codon(self):
+        self.assertRaises(KeyError, translate.translate_sequence,
+                "AUGXYZ", self.genetic_code)
+
+    def test_dicodon_table(self):
+        code = translate.compile_genetic_code(self.genetic_code)
+        table = code.dicodon_table()
+        self.assertEqual(len(table), 61 * 61)
+        self.assertEqual(table[bytes([2, 3, 1, 2, 0, 0])], "VE")
+        self.assertIs(code.dicodon_table(), table)
+
+    def test_dicodon_translation_matches_codon_translation(self):
+        code = translate.compile_genetic_code(self.genetic_code)
+        rng = random.Random(15)
+        for trial in range(200):
+            rna_seq = "".join(rng.choice("ACGU") for i in range(
+                    rng.randint(0, 80)))
+            self.assertEqual(
+                    translate._translate_by_dicodon(rna_seq, code),
+                    translate._translate_by_codon(rna_seq, code))
+
+
 class TestTranslateSequence(TestTranslateBaseClass):
 
     def test_empty_rna_sequence(self):
@@ -197,6 +283,22 @@ class TestTranslateSequence(TestTranslateBaseClass):
                 expected_amino_acid_seq = expected_amino_acid_seq)
 
 
+class TestIterCodons(TestTranslateBaseClass):
+
+    def test_empty_sequence(self):
+        self.assertEqual(list(translate.iter_codons("")), [])
+
+    def test_partial_codon_skipped(self):
+        self.assertEqual(list(translate.iter_codons("AUGCCGU")),
+                ["AUG", "CCG"])
+
+    def test_frame(self):
+        self.assertEqual(list(translate.iter_codons("AUGCCGU", frame = 1)),
+                ["UGC", "CGU"])
+        self.assertEqual(list(translate.iter_codons("AUGCCGU", frame = 2)),
+                ["GCC"])
+
+
 class TestGetAllTranslations(TestTranslateBaseClass):
 
     def test_no_translations(self):
@@ -244,6 +346,133 @@ class TestGetAllTranslations(TestTranslateBaseClass):
                 expected_results = expected_amino_acid_seqs)
 
 
+class TestScanReadingFrame(TestTranslateBaseClass):
+
+    def naive_all_translations(self, rna_seq):
+        rna_seq = rna_seq.upper()
+        peptides = []
+        for base_index in range(len(rna_seq) - 2):
+            if rna_seq[base_index: base_index + 3] == "AUG":
+                aa_seq = translate.translate_sequence(
+                        rna_sequence = rna_seq[base_index:],
+                        genetic_code = self.genetic_code)
+                if aa_seq:
+                    peptides.append(aa_seq)
+        return peptides
+
+    def test_nested_starts(self):
+        rna_seq = "AUGAAAAUGCCCUAAAUG"
+        orfs = list(translate.scan_reading_frame(
+                rna_sequence = rna_seq,
+                frame = 0,
+                genetic_code = self.genetic_code))
+        self.assertEqual(orfs, [
+                (0, 15, "MKMP"),
+                (6, 15, "MP"),
+                (15, 18, "M"),
+                ])
+
+    def test_other_frames(self):
+        rna_seq = "GAUGAAAUAGG"
+        for frame, expected in ((0, []), (1, [(1, 10, "MK")]), (2, [])):
+            orfs = list(translate.scan_reading_frame(
+                    rna_sequence = rna_seq,
+                    frame = frame,
+                    genetic_code = self.genetic_code))
+            self.assertEqual(orfs, expected)
+
+    def test_matches_naive_translation(self):
+        rng = random.Random(1)
+        for length in range(0, 300, 7):
+            rna_seq = "".join(rng.choice("ACGU") for i in range(length))
+            # plant some start codons so nested frames are common
+            rna_seq = rna_seq.replace("GA", "AUG")
+            self.assertEqual(
+                    translate.get_all_translations(
+                            rna_sequence = rna_seq,
+                            genetic_code = self.genetic_code),
+                    self.naive_all_translations(rna_seq))
+
+
+def random_rna(rng, length, stop_free = False):
+    """Get a random RNA sequence of about `length` bases, with extra start
+    codons planted so that nested reading frames are common.
+
+    With `stop_free`, a stretch of up to 60 codons without stop codons is
+    inserted somewhere, to make long reading frames.
+    """
+    rna_seq = "".join(rng.choice("ACGU") for i in range(length))
+    rna_seq = rna_seq.replace("GA", "AUG")
+    if not stop_free:
+        return rna_seq
+    stretch = "".join(rng.choice(["GCU", "AUG", "CCA", "GGG"])
+            for i in range(rng.randint(0, 60)))
+    middle = rng.randint(0, len(rna_seq))
+    return rna_seq[:middle] + stretch + rna_seq[middle:]
+
+
+@unittest.skipIf(translate.numpy is None, "NumPy is not installed")
+class TestNumpyEngine(TestTranslateBaseClass):
+
+    def scan(self, rna_seq, engine):
+        return sorted(translate.scan_reading_frames(
+                rna_sequence = rna_seq,
+                genetic_code = self.genetic_code,
+                engine = engine))
+
+    def test_matches_python_engine(self):
+        rng = random.Random(2)
+        for length in list(range(0, 40)) + [500, 2000]:
+            rna_seq = random_rna(rng, length)
+            self.assertEqual(self.scan(rna_seq, "numpy"),
+                    self.scan(rna_seq, "python"))
+
+    def test_lower_case(self):
+        rna_seq = "ccugaaugacguacguaugacugcaguacguuacguacg"
+        self.assertEqual(self.scan(rna_seq, "numpy"),
+                self.scan(rna_seq.upper(), "python"))
+
+    def test_invalid_codon_in_reading_frame(self):
+        self.assertRaises(KeyError, self.scan, "AUGAAANNN", "numpy")
+        self.assertEqual(self.scan("NNNAUGUAA", "numpy"),
+                [(3, 9, "M")])
+
+    def test_large_input_uses_same_results(self):
+        rng = random.Random(3)
+        rna_seq = random_rna(rng, translate.NUMPY_THRESHOLD + 100)
+        self.assertEqual(
+                translate.get_all_translations(rna_seq, self.genetic_code),
+                [peptide for start, end, peptide in sorted(self.scan(
+                        rna_seq, "python"))])
+        orf_seq = "AUG" + "GCU" * translate.NUMPY_THRESHOLD
+        self.run_translate_sequence(
+                rna_seq = orf_seq + "UAA",
+                expected_amino_acid_seq = "M" + "A" *
+                        translate.NUMPY_THRESHOLD)
+
+    def test_translation_stops_early(self):
+        code = translate.compile_genetic_code(self.genetic_code)
+        length = 3 * translate.NUMPY_THRESHOLD
+        body = "GCU" * (length // 3)
+        # Stops in the first block, on block boundaries, and never
+        for stop in (0, 1, 4095, 4096, 12287, 12288, length // 3):
+            rna_seq = "AUG" + body[:3 * stop] + "UAA" + body[3 * stop:]
+            self.assertEqual(translate._numpy_translate_sequence(rna_seq,
+                    code), translate._translate_by_dicodon(rna_seq, code))
+        self.assertRaises(KeyError, translate._numpy_translate_sequence,
+                "AUG" + body + "NNN", code)
+        # Bases after an early stop codon are not even encoded
+        rna_seq = "AUGUAA" + body * 20
+        tracemalloc.start()
+        try:
+            self.assertEqual(translate.translate_sequence(rna_seq, code,
+                    normalize = False), "M")
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1 << 20)
+
+
 class TestGetReverse(TestTranslateBaseClass):
     def test_empty_string(self):
         seq = ""
@@ -287,6 +516,32 @@ class TestGetComplement(TestTranslateBaseClass):
         expected_result = "UACG"
         self.run_get_complement(seq, expected_result)
 
+    def test_dna(self):
+        seq = "ATGC"
+        expected_result = "UACG"
+        self.run_get_complement(seq, expected_result)
+        self.assertEqual(translate.get_complement(seq, alphabet = "dna"),
+                "TACG")
+
+    def test_ambiguity_codes(self):
+        seq = "NRYKMSWBDHV-n"
+        expected_result = "NYRMKSWVHDB-N"
+        self.run_get_complement(seq, expected_result)
+
+    def test_bytes(self):
+        self.assertEqual(translate.get_complement(b"augc"), b"UACG")
+        self.assertEqual(translate.get_complement(bytearray(b"augc")),
+                bytearray(b"UACG"))
+
+    def test_invalid_character(self):
+        self.assertRaises(KeyError, translate.get_complement, "AUXG")
+        self.assertRaises(KeyError, translate.get_complement, "AU\u00e9G")
+        self.assertRaises(KeyError, translate.get_complement, b"AUXG")
+
+    def test_unknown_alphabet(self):
+        self.assertRaises(ValueError, translate.get_complement, "AUGC",
+                alphabet = "protein")
+
 
 class TestReverseAndComplement(TestTranslateBaseClass):
     def test_empty_string(self):
@@ -309,6 +564,23 @@ class TestReverseAndComplement(TestTranslateBaseClass):
         expected_result = "GCAU"
         self.run_reverse_and_complement(seq, expected_result)
 
+    def test_dna_and_ambiguity_codes(self):
+        seq = "ATGCNR"
+        expected_result = "YNGCAU"
+        self.run_reverse_and_complement(seq, expected_result)
+
+    def test_in_place(self):
+        buffer = bytearray(b"augcNNRAAA")
+        result = translate.reverse_and_complement_in_place(buffer)
+        self.assertIs(result, buffer)
+        self.assertEqual(buffer, bytearray(b"UUUYNNGCAU"))
+
+    def test_in_place_invalid_character(self):
+        buffer = bytearray(b"AUGX")
+        self.assertRaises(KeyError,
+                translate.reverse_and_complement_in_place, buffer)
+        self.assertEqual(buffer, bytearray(b"AUGX"))
+
 
 class TestGetLongestPeptide(TestTranslateBaseClass):
 
@@ -353,5 +625,1312 @@ class TestGetLongestPeptide(TestTranslateBaseClass):
                 expected_result = expected_amino_acid_seq)
 
 
+class TestFindOrfs(TestTranslateBaseClass):
+
+    def test_coordinates(self):
+        rna_seq = "GAAAAAUGACAUGAAAUAAAUG"
+        # reverse complement: CAUUUAUUUCAUGUCAUUUUUC
+        orfs = translate.find_orfs(rna_seq, self.genetic_code)
+        self.assertEqual(len(orfs), 4)
+        self.assertEqual(
+                [(orf.strand, orf.frame, orf.start, orf.end, orf.length)
+                        for orf in orfs],
+                [("+", 2, 5, 14, 2),
+                        ("+", 1, 10, 19, 2),
+                        ("+", 1, 19, 22, 1),
+                        ("-", 0, 0, 12, 4)])
+        self.assertEqual([orf.peptide for orf in orfs],
+                ["MT", "MK", "M", "MSFF"])
+        self.assertEqual(orfs[-1].as_orf("seq1"),
+                translate.Orf("seq1", "-", 0, 0, 12, "MSFF"))
+
+    def test_peptides_match_scan(self):
+        rng = random.Random(12)
+        engines = ["python"]
+        if translate.numpy is not None:
+            engines.append("numpy")
+        for trial in range(50):
+            rna_seq = "".join(rng.choice("ACGU") for i in range(
+                    rng.randint(0, 300)))
+            rna_seq = rna_seq.replace("GA", "AUG").replace("UC", "CAU")
+            rev_comp_seq = translate.reverse_and_complement(rna_seq)
+            expected = [(0, start, end, peptide) for start, end, peptide in
+                    sorted(translate.scan_reading_frames(rna_seq,
+                            self.genetic_code))]
+            expected += [(1, start, end, peptide) for start, end, peptide in
+                    sorted(translate.scan_reading_frames(rev_comp_seq,
+                            self.genetic_code))]
+            for engine in engines:
+                orfs = translate.find_orfs(rna_seq, self.genetic_code,
+                        engine = engine)
+                length = len(rna_seq)
+                coordinates = []
+                for orf in orfs:
+                    if orf.strand == "+":
+                        coordinates.append((0, orf.start, orf.end))
+                    else:
+                        coordinates.append((1, length - orf.end,
+                                length - orf.start))
+                self.assertEqual(coordinates,
+                        [orf[:3] for orf in expected])
+                self.assertEqual(list(orfs.peptides()),
+                        [orf[3] for orf in expected])
+                self.assertEqual(list(orfs.lengths),
+                        [len(orf[3]) for orf in expected])
+
+    def test_invalid_codon_raised_on_translation(self):
+        genetic_code = dict(self.genetic_code)
+        del genetic_code["GCU"]
+        orfs = translate.find_orfs("AUGGCUUAA", genetic_code,
+                strands = "+")
+        self.assertEqual(len(orfs), 1)
+        self.assertRaises(KeyError, lambda: orfs[0].peptide)
+        engines = ["python"] + ["numpy"] * (translate.numpy is not None)
+        for engine in engines:
+            self.assertRaises(KeyError, translate.find_orfs, "AUGNNNUAA",
+                    self.genetic_code, engine = engine)
+            self.assertEqual(len(translate.find_orfs("NNNAUGUAA",
+                    self.genetic_code, strands = "+", engine = engine)), 1)
+
+
+class TestPackedSequence(TestTranslateBaseClass):
+
+    def test_round_trip(self):
+        for seq in ("", "A", "acgu", "ACGUA", "NNACGTNRYAN", "GGGGnnnnCC"):
+            packed = translate.PackedSequence(seq)
+            self.assertEqual(len(packed), len(seq))
+            self.assertEqual(str(packed), seq.upper().replace("T", "U"))
+
+    def test_packed_size(self):
+        packed = translate.PackedSequence("ACGU" * 1000)
+        self.assertEqual(len(packed._data), 1000)
+
+    def test_slices_and_reverse_complement(self):
+        rng = random.Random(13)
+        seq = "".join(rng.choice("ACGUNNR") for i in range(300))
+        packed = translate.PackedSequence(seq)
+        rev_comp_seq = translate.reverse_and_complement(seq)
+        rev_comp = packed.reverse_complement()
+        self.assertEqual(str(rev_comp), rev_comp_seq)
+        self.assertIs(rev_comp._data, packed._data)
+        for trial in range(100):
+            start = rng.randint(-10, 310)
+            stop = rng.randint(-10, 310)
+            self.assertEqual(str(packed[start: stop]), seq[start: stop])
+            self.assertEqual(str(rev_comp[start: stop]),
+                    rev_comp_seq[start: stop])
+            self.assertEqual(str(rev_comp[start: stop].reverse_complement()),
+                    translate.reverse_and_complement(
+                            rev_comp_seq[start: stop]))
+        self.assertEqual(packed[5], seq[5])
+        self.assertEqual(rev_comp[-1], rev_comp_seq[-1])
+
+    def test_translation(self):
+        rng = random.Random(14)
+        for trial in range(30):
+            seq = "".join(rng.choice("ACGU") for i in range(
+                    rng.randint(0, 400)))
+            seq = seq.replace("GA", "AUG").replace("UC", "CAU")
+            packed = translate.PackedSequence(seq)
+            self.assertEqual(
+                    translate.translate_sequence(packed, self.genetic_code),
+                    translate.translate_sequence(seq, self.genetic_code))
+            self.assertEqual(
+                    translate.get_all_translations(packed, self.genetic_code),
+                    translate.get_all_translations(seq, self.genetic_code))
+            self.assertEqual(
+                    translate.get_longest_peptides(packed, self.genetic_code),
+                    translate.get_longest_peptides(seq, self.genetic_code))
+
+    def test_invalid_codon(self):
+        packed = translate.PackedSequence("AUGNNNUAA")
+        self.assertRaises(KeyError, translate.translate_sequence, packed,
+                self.genetic_code)
+        self.assertEqual(translate.get_all_translations(packed[3:],
+                self.genetic_code), [])
+
+
+class TestGetLongestPeptides(TestTranslateBaseClass):
+
+    def all_peptides(self, rna_seq):
+        # (peptide, strand index, start) of every reading frame, best first
+        peptides = []
+        rev_comp_seq = translate.reverse_and_complement(rna_seq)
+        for strand_index, seq in enumerate((rna_seq, rev_comp_seq)):
+            for start, end, peptide in translate.scan_reading_frames(
+                    seq, self.genetic_code):
+                peptides.append((-len(peptide), strand_index, start, peptide))
+        return [peptide for key in sorted(peptides) for peptide in key[3:]]
+
+    def test_matches_sorting_all_peptides(self):
+        rng = random.Random(9)
+        for trial in range(100):
+            rna_seq = "".join(rng.choice("ACGU") for i in range(
+                    rng.randint(0, 300)))
+            rna_seq = rna_seq.replace("GA", "AUG")
+            expected = self.all_peptides(rna_seq)
+            for top_k in (1, 3, 50):
+                self.assertEqual(translate.get_longest_peptides(rna_seq,
+                                self.genetic_code,
+                                top_k = top_k),
+                        expected[:top_k])
+            self.assertEqual(translate.get_longest_peptides(rna_seq,
+                            self.genetic_code,
+                            top_k = 1000,
+                            min_length = 5),
+                    [peptide for peptide in expected if len(peptide) >= 5])
+
+    def test_top_k_in_shards(self):
+        rng = random.Random(10)
+        rna_seq = "".join(rng.choice("ACGU") for i in range(3000))
+        self.assertEqual(translate.get_longest_peptides(rna_seq,
+                        self.genetic_code,
+                        top_k = 5,
+                        processes = 2),
+                self.all_peptides(rna_seq)[:5])
+
+    def test_min_length_scan(self):
+        rng = random.Random(11)
+        rna_seq = "".join(rng.choice("ACGU") for i in range(2000))
+        rna_seq = rna_seq.replace("GA", "AUG")
+        engines = ["python"]
+        if translate.numpy is not None:
+            engines.append("numpy")
+        all_orfs = list(translate.scan_reading_frames(rna_seq,
+                self.genetic_code))
+        for min_length in (1, 4, 20, 10000):
+            expected = sorted(orf for orf in all_orfs
+                    if len(orf[2]) >= min_length)
+            for engine in engines:
+                self.assertEqual(sorted(translate.scan_reading_frames(
+                                rna_seq, self.genetic_code,
+                                engine = engine,
+                                min_length = min_length)),
+                        expected)
+
+
+class TestBatchTranslation(TestTranslateBaseClass):
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(6)
+        self.sequences = []
+        for index in range(50):
+            rna_seq = "".join(rng.choice("ACGU") for i in range(
+                    rng.randint(0, 300)))
+            self.sequences.append(rna_seq.replace("GA", "AUG"))
+
+    def test_translate_many(self):
+        expected = [translate.translate_sequence(rna_seq, self.genetic_code)
+                for rna_seq in self.sequences]
+        for processes in (1, 2):
+            self.assertEqual(translate.translate_many(self.sequences,
+                    self.genetic_code,
+                    processes = processes,
+                    batch_size = 7), expected)
+
+    def test_longest_peptides_many(self):
+        expected = [translate.get_longest_peptide(rna_seq, self.genetic_code)
+                for rna_seq in self.sequences]
+        results = translate.iter_longest_peptides_many(
+                iter(self.sequences),
+                self.genetic_code,
+                processes = 2,
+                batch_size = 3)
+        self.assertEqual(next(results), expected[0])
+        self.assertEqual(list(results), expected[1:])
+
+    def test_interleaved_genetic_codes(self):
+        # UGA is a stop codon in table 1, and tryptophan in table 2
+        standard = translate.iter_translate_many(["AUGUGAAGA"] * 3, 1,
+                processes = 1)
+        mitochondrial = translate.iter_translate_many(["AUGUGAAGA"] * 3, 2,
+                processes = 1)
+        self.assertEqual([next(standard), next(mitochondrial),
+                next(standard), next(mitochondrial)],
+                ["M", "MW", "M", "MW"])
+        standard = translate.scan_reading_frames_parallel("AUGUGAAGAUAA",
+                1, processes = 1, shard_size = 3)
+        mitochondrial = translate.scan_reading_frames_parallel(
+                "AUGUGAAGAUAA", 2, processes = 1, shard_size = 3)
+        self.assertEqual(next(standard), (0, 6, "M"))
+        self.assertEqual(next(mitochondrial), (0, 9, "MW"))
+        self.assertEqual(list(standard), [])
+        self.assertIsNone(translate._worker_genetic_code)
+
+
+class TestShardedScan(TestTranslateBaseClass):
+
+    def test_matches_serial_scan(self):
+        rng = random.Random(7)
+        for trial in range(60):
+            # long stretches without stop codons make reading frames that
+            # straddle several shards
+            rna_seq = random_rna(rng, rng.randint(0, 400), stop_free = True)
+            expected = sorted(translate.scan_reading_frames(
+                    rna_seq, self.genetic_code))
+            for shard_size in (1, 2, 3, 7, 16, 50, 1000):
+                self.assertEqual(sorted(
+                        translate.scan_reading_frames_parallel(
+                                rna_seq, self.genetic_code,
+                                processes = 1,
+                                shard_size = shard_size)),
+                        expected)
+
+    def test_with_worker_processes(self):
+        rng = random.Random(8)
+        rna_seqs = [random_rna(rng, 5000, stop_free = True) for i in range(3)]
+        for rna_seq in rna_seqs:
+            self.assertEqual(sorted(translate.scan_reading_frames_parallel(
+                            rna_seq, self.genetic_code,
+                            processes = 2,
+                            shard_size = 97)),
+                    sorted(translate.scan_reading_frames(
+                            rna_seq, self.genetic_code)))
+            self.assertEqual(
+                    translate.get_all_translations(rna_seq,
+                            self.genetic_code,
+                            processes = 2),
+                    translate.get_all_translations(rna_seq,
+                            self.genetic_code))
+            self.assertEqual(
+                    translate.get_longest_peptide(rna_seq,
+                            self.genetic_code,
+                            processes = 2),
+                    translate.get_longest_peptide(rna_seq,
+                            self.genetic_code))
+
+    def test_invalid_codon_in_carried_reading_frame(self):
+        rna_seq = "AUGGCUGCUGCUNNNGCUUAA"
+        self.assertRaises(KeyError, list,
+                translate.scan_reading_frames_parallel(rna_seq,
+                        self.genetic_code,
+                        processes = 1,
+                        shard_size = 6))
+
+    def test_invalid_codon_in_losing_reading_frame(self):
+        rna_seq = "AUGNNNUAA" + "AUG" + "GCU" * 20 + "UAA"
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        orf_index = translate.OrfIndex(directory.name)
+        for engine_threshold in (translate.NUMPY_THRESHOLD, 1):
+            threshold = translate.NUMPY_THRESHOLD
+            translate.NUMPY_THRESHOLD = engine_threshold
+            try:
+                for options in ({}, {"processes": 2},
+                        {"orf_index": orf_index}):
+                    with self.assertRaises(KeyError) as context:
+                        translate.get_longest_peptide(rna_seq,
+                                self.genetic_code, **options)
+                    self.assertEqual(context.exception.args, ("NNN",))
+            finally:
+                translate.NUMPY_THRESHOLD = threshold
+        self.assertEqual(translate.get_longest_peptide(
+                rna_seq.replace("NNN", "GCU"), self.genetic_code),
+                "M" + "A" * 20)
+
+
+class TestStreamingOrfs(TestTranslateBaseClass):
+
+    def batch_orfs(self, rna_seq):
+        length = len(rna_seq)
+        orfs = set()
+        for start, end, peptide in translate.scan_reading_frames(
+                rna_seq, self.genetic_code, engine = "python"):
+            orfs.add(("+", start, end, peptide))
+        rev_comp_seq = translate.reverse_and_complement(rna_seq)
+        for start, end, peptide in translate.scan_reading_frames(
+                rev_comp_seq, self.genetic_code, engine = "python"):
+            orfs.add(("-", length - end, length - start, peptide))
+        return orfs
+
+    def streamed_orfs(self, rna_seq, chunk_size):
+        scanner = translate.ChunkedOrfScanner(self.genetic_code)
+        orfs = []
+        for index in range(0, len(rna_seq), chunk_size):
+            orfs.extend(scanner.feed(rna_seq[index: index + chunk_size]))
+        orfs.extend(scanner.finish())
+        for orf in orfs:
+            self.assertEqual(orf.frame, orf.start % 3)
+        return set((orf.strand, orf.start, orf.end, orf.peptide)
+                for orf in orfs)
+
+    def test_matches_batch_scan(self):
+        rng = random.Random(4)
+        for length in list(range(0, 30)) + [200, 1000]:
+            rna_seq = "".join(rng.choice("ACGU") for i in range(length))
+            rna_seq = rna_seq.replace("GA", "AUG").replace("UC", "CAU")
+            expected = self.batch_orfs(rna_seq)
+            for chunk_size in (1, 2, 5, 64, 100000):
+                self.assertEqual(self.streamed_orfs(rna_seq, chunk_size),
+                        expected)
+
+    def test_reverse_strand(self):
+        # reverse complement: AUGAAAUAG
+        orfs = self.streamed_orfs("CUAUUUCAU", 4)
+        self.assertEqual(orfs, set([("-", 0, 9, "MK")]))
+
+    def test_ambiguous_codons(self):
+        # Reading frames through an ambiguous codon end next to it
+        self.assertEqual(self.streamed_orfs("NNNCAU", 2),
+                set([("-", 3, 6, "M")]))
+        self.assertEqual(self.streamed_orfs("NNNUUACAU", 2),
+                set([("-", 3, 9, "M")]))
+        self.assertEqual(self.streamed_orfs("AUGAAANNNGCUAUGUAA", 4),
+                set([("+", 0, 6, "MK"), ("+", 12, 18, "M")]))
+        self.assertEqual(self.streamed_orfs("AUGNNAGCU", 1),
+                set([("+", 0, 3, "M")]))
+        partial_code = dict(self.genetic_code)
+        del partial_code["AAA"]
+        scanner = translate.ChunkedOrfScanner(partial_code)
+        self.assertRaises(KeyError, scanner.feed, "AUGAAAUAA")
+
+    def test_read_fasta(self):
+        fasta = io.BytesIO(
+                b">seq1 first\nAUGAAA\nUAG\n>empty\n>seq2\r\nGGG  CCC\n")
+        self.assertEqual(list(translate.read_fasta(fasta, chunk_size = 3)),
+                [("seq1 first", "AUGAAAUAG"), ("empty", ""),
+                        ("seq2", "GGGCCC")])
+
+    def test_sequence_before_header(self):
+        fasta = io.BytesIO(b"AUG\n>seq1\nAUG\n")
+        self.assertRaises(ValueError, list, translate.read_fasta(fasta))
+
+    def test_gzip_fasta_orfs(self):
+        rng = random.Random(5)
+        records = []
+        for record in range(3):
+            rna_seq = "".join(rng.choice("ACGU") for i in range(500))
+            records.append(("seq{0}".format(record), rna_seq))
+        fasta = "".join(">{0}\n{1}\n".format(name, rna_seq)
+                for name, rna_seq in records)
+        handle, path = tempfile.mkstemp(suffix = ".fa.gz")
+        os.close(handle)
+        try:
+            with gzip.open(path, "wt") as out:
+                out.write(fasta)
+            orfs = list(translate.iter_fasta_orfs(path, self.genetic_code,
+                    chunk_size = 37))
+        finally:
+            os.remove(path)
+        for name, rna_seq in records:
+            self.assertEqual(
+                    set((orf.strand, orf.start, orf.end, orf.peptide)
+                            for orf in orfs if orf.record == name),
+                    self.batch_orfs(rna_seq))
+
+
+class TestNormalizeSequence(TestTranslateBaseClass):
+
+    def test_normalize(self):
+        for seq in ("acgtNNnu-ry", b"acgtNNnu-ry", bytearray(b"acgtNNnu-ry"),
+                memoryview(b"acgtNNnu-ry")):
+            normalized = translate.normalize_sequence(seq)
+            self.assertIsInstance(normalized, translate.NormalizedSequence)
+            self.assertEqual(normalized, b"ACGUNNNU-RY")
+        self.assertIs(translate.normalize_sequence(normalized), normalized)
+        self.assertEqual(translate.normalize_sequence(
+                translate.PackedSequence("AUGNN")), b"AUGNN")
+        self.assertEqual(translate.normalize_sequence(""), b"")
+
+    def test_invalid_characters(self):
+        for seq, character in (("ACGX", "X"), ("AC G", " "), (b"AC*", "*"),
+                ("AC\u00e9", "\u00e9")):
+            with self.assertRaises(KeyError) as context:
+                translate.normalize_sequence(seq)
+            self.assertEqual(context.exception.args, (character,))
+        self.assertRaises(KeyError, translate.get_all_translations, "XAUGUAA",
+                self.genetic_code)
+        self.assertRaises(KeyError, translate.translate_sequence, "AUGXUAA",
+                self.genetic_code)
+        # Characters are checked as their block is encoded, so blocks after
+        # the first stop codon are not looked at
+        for length in (translate._BLOCK_SIZE, translate.NUMPY_THRESHOLD):
+            self.assertEqual(translate.translate_sequence(
+                    "AUGUAA" + "G" * length + "X", self.genetic_code), "M")
+
+    def test_dna_input(self):
+        seq = "AUGUACUGGCACGCUACUGCUCCAUAUACUCACCAGAAUAUCAGUACAGCG"
+        dna = seq.replace("U", "t").lower()
+        self.assertEqual(translate.translate_sequence(dna, self.genetic_code),
+                "MYWHATAPYTHQNISTA")
+        self.assertEqual(translate.get_longest_peptide(dna, self.genetic_code),
+                "MYWHATAPYTHQNISTA")
+        self.assertEqual(
+                translate.get_all_translations(dna, self.genetic_code),
+                translate.get_all_translations(seq, self.genetic_code))
+        self.assertEqual(translate.translate_sequence(dna, self.genetic_code,
+                normalize = False), "MYWHATAPYTHQNISTA")
+        model = translate.OrfModel(dna, self.genetic_code)
+        self.assertEqual(model.substitute(5, "t").longest_peptide,
+                "MYWHATAPYTHQNISTA")
+
+    def test_normalized_fasta(self):
+        fasta = io.BytesIO(b">a\natgGCC\ntaa\n>b\nATGX\n")
+        chunks = translate.iter_fasta_chunks(fasta, normalize = True)
+        self.assertEqual([next(chunks), next(chunks)],
+                [("a", None), ("a", "AUGGCCUAA")])
+        fasta.seek(0)
+        self.assertRaises(KeyError, list, translate.iter_fasta_orfs(fasta,
+                self.genetic_code))
+        fasta.seek(0)
+        orfs = translate.iter_fasta_orfs(fasta, self.genetic_code)
+        self.assertEqual(next(orfs).peptide, "MA")
+
+
+class TestTranslationStats(TestTranslateBaseClass):
+
+    def tearDown(self):
+        translate.disable_stats()
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(translate.get_stats())
+        translate.translate_sequence("AUGUAA", self.genetic_code)
+        self.assertIsNone(translate.get_stats())
+
+    def test_translate_counters(self):
+        with translate.collect_stats() as stats:
+            self.assertIs(translate.get_stats(), stats)
+            translate.translate_sequence("AUGGCCUAAGG", self.genetic_code)
+            translate.translate_sequence("AUGGCC", self.genetic_code)
+        self.assertIsNone(translate.get_stats())
+        self.assertEqual(stats.codons_translated, 5)
+        self.assertEqual(stats.stage_calls, {"translate": 2})
+        self.assertGreater(stats.bytes_copied, 0)
+
+    def test_scan_counters(self):
+        seq = "AUGAUGCCCUAAGGGAUGCCC"
+        with translate.collect_stats() as stats:
+            orfs = translate.get_all_translations(seq, self.genetic_code)
+        self.assertEqual(orfs, ["MMP", "MP", "MP"])
+        self.assertEqual(stats.orfs, 3)
+        self.assertEqual(stats.start_codons, 3)
+        self.assertEqual(stats.codons_scanned, 7 + 6 + 6)
+        self.assertEqual(set(stats.stage_calls),
+                set(["all_translations", "scan", "translate"]))
+
+    def test_longest_peptide_stages(self):
+        seq = "AUGUACUGGCACGCUACUGCUCCAUAUACUCACCAGAAUAUCAGUACAGCG"
+        with translate.collect_stats() as stats:
+            translate.get_longest_peptide(seq, self.genetic_code)
+        self.assertEqual(stats.stage_calls["longest_peptides"], 1)
+        self.assertEqual(stats.stage_calls["reverse_complement"], 1)
+        self.assertEqual(stats.stage_calls["scan"], 1)
+        self.assertEqual(stats.stage_calls["translate"], 1)
+        self.assertEqual(stats.orfs, 1)
+        for seconds in stats.stage_seconds.values():
+            self.assertGreaterEqual(seconds, 0.0)
+        report = stats.report()
+        self.assertIn("longest_peptides", report)
+        self.assertIn("orfs", report)
+        self.assertEqual(stats.as_dict()["orfs"], 1)
+
+    def test_callback(self):
+        calls = []
+        translate.enable_stats(
+                lambda stage, seconds, stats: calls.append(stage))
+        translate.reverse_and_complement("AUGC")
+        translate.translate_sequence("AUGC", self.genetic_code)
+        self.assertEqual(calls, ["reverse_complement", "translate"])
+        stats = translate.disable_stats()
+        self.assertEqual(stats.stage_calls["translate"], 1)
+
+
+class TestTranslationCache(TestTranslateBaseClass):
+
+    def tearDown(self):
+        translate.disable_cache()
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(translate.get_cache())
+
+    def test_hits_and_misses(self):
+        cache = translate.enable_cache()
+        seq = "AUGUACUGGCACGCUACUGCUCCAUAUACUCACCAGAAUAUCAGUACAGCG"
+        for i in range(3):
+            self.assertEqual(
+                    translate.get_longest_peptide(seq, self.genetic_code),
+                    "MYWHATAPYTHQNISTA")
+            self.assertEqual(
+                    translate.translate_sequence(seq, self.genetic_code),
+                    "MYWHATAPYTHQNISTA")
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(len(cache), 2)
+        # Same bases, other types
+        translate.translate_sequence(seq.encode("ascii"), self.genetic_code)
+        translate.translate_sequence(translate.PackedSequence(seq),
+                self.genetic_code)
+        self.assertEqual(cache.hits, 6)
+
+    def test_keyed_on_genetic_code(self):
+        cache = translate.enable_cache()
+        self.assertEqual(
+                translate.translate_sequence("AUGUGA", self.genetic_code),
+                "M")
+        mito = translate.GeneticCode.from_ncbi_table(2)
+        self.assertEqual(translate.translate_sequence("AUGUGA", mito), "MW")
+        self.assertEqual(cache.misses, 2)
+
+    def test_max_entries(self):
+        cache = translate.enable_cache(max_entries = 2)
+        for seq in ("AUGAAA", "AUGCCC", "AUGAAA", "AUGGGG"):
+            translate.translate_sequence(seq, self.genetic_code)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        # "AUGCCC" was the least recently used
+        translate.translate_sequence("AUGAAA", self.genetic_code)
+        self.assertEqual(cache.hits, 2)
+        translate.translate_sequence("AUGCCC", self.genetic_code)
+        self.assertEqual(cache.misses, 4)
+
+    def test_max_bytes(self):
+        cache = translate.enable_cache(max_entries = None, max_bytes = 500)
+        for i in range(50):
+            translate.translate_sequence("AUG" + "GCC" * i,
+                    self.genetic_code)
+        self.assertLessEqual(cache.size_bytes, 500)
+        self.assertGreater(cache.evictions, 0)
+        self.assertEqual(cache.as_dict()["size_bytes"], cache.size_bytes)
+
+    def test_threads(self):
+        cache = translate.enable_cache(max_entries = 8)
+        rng = random.Random(5)
+        seqs = ["AUG" + "".join(rng.choice("ACG") for i in range(30))
+                for j in range(16)]
+        expected = [translate.translate_sequence(seq, self.genetic_code)
+                for seq in seqs]
+        errors = []
+        def work():
+            for k in range(200):
+                j = rng.randrange(len(seqs))
+                if translate.translate_sequence(seqs[j],
+                        self.genetic_code) != expected[j]:
+                    errors.append(j)
+        threads = [threading.Thread(target = work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(cache), 8)
+        self.assertEqual(cache.hits + cache.misses, 16 + 800)
+
+
+class TestOrfIndex(TestTranslateBaseClass):
+
+    def setUp(self):
+        TestTranslateBaseClass.setUp(self)
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = translate.OrfIndex(self.directory.name)
+        rng = random.Random(11)
+        self.seqs = ["".join(rng.choice("ACGU") for i in range(n))
+                for n in (0, 5, 200, 1000)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_same_results(self):
+        for seq in self.seqs:
+            for i in range(2):
+                self.assertEqual(
+                        translate.get_all_translations(seq,
+                                self.genetic_code, orf_index = self.index),
+                        translate.get_all_translations(seq,
+                                self.genetic_code))
+                self.assertEqual(
+                        translate.get_longest_peptide(seq, self.genetic_code,
+                                orf_index = self.index),
+                        translate.get_longest_peptide(seq, self.genetic_code))
+                self.assertEqual(
+                        translate.get_longest_peptides(seq, self.genetic_code,
+                                top_k = 5, min_length = 3,
+                                orf_index = self.index),
+                        translate.get_longest_peptides(seq, self.genetic_code,
+                                top_k = 5, min_length = 3))
+        self.assertTrue(all(name.endswith(".orfs") for name in
+                os.listdir(self.directory.name)))
+
+    def test_save_and_load(self):
+        seq = self.seqs[-1]
+        self.assertIsNone(self.index.load(seq, self.genetic_code))
+        table = self.index.find_orfs(seq, self.genetic_code)
+        loaded = self.index.load(seq, self.genetic_code)
+        self.assertIsNotNone(loaded)
+        for column in ("strands", "frames", "starts", "ends", "lengths"):
+            self.assertEqual(getattr(loaded, column), getattr(table, column))
+        self.assertEqual(list(loaded.peptides()), list(table.peptides()))
+
+    def test_invalidation(self):
+        seq = self.seqs[-1]
+        self.index.find_orfs(seq, self.genetic_code)
+        changed = ("C" if seq[500] != "C" else "G").join(
+                (seq[:500], seq[501:]))
+        self.assertIsNone(self.index.load(changed, self.genetic_code))
+        mito = translate.GeneticCode.from_ncbi_table(2)
+        self.assertIsNone(self.index.load(seq, mito))
+        self.assertIsNone(self.index.load(seq, self.genetic_code,
+                strands = "+"))
+        self.assertIsNone(self.index.load(seq, self.genetic_code,
+                min_length = 2))
+        # A damaged file is not loaded, and is replaced by a new scan
+        path = self.index.path(translate.sequence_digest(seq),
+                self.genetic_code)
+        with open(path, "r+b") as index_file:
+            index_file.truncate(50)
+        self.assertIsNone(self.index.load(seq, self.genetic_code))
+        self.index.find_orfs(seq, self.genetic_code)
+        self.assertIsNotNone(self.index.load(seq, self.genetic_code))
+
+
+class TestOrfModel(TestTranslateBaseClass):
+
+    def all_orfs(self, seq):
+        return set(translate.Orf(None, orf.strand, orf.frame, orf.start,
+                orf.end, orf.peptide) for orf in translate.find_orfs(seq,
+                        self.genetic_code))
+
+    def test_longest_peptide(self):
+        seq = "AUGUACUGGCACGCUACUGCUCCAUAUACUCACCAGAAUAUCAGUACAGCG"
+        model = translate.OrfModel(seq, self.genetic_code)
+        self.assertEqual(model.longest_peptide, "MYWHATAPYTHQNISTA")
+        self.assertEqual(translate.OrfModel("", self.genetic_code
+                ).longest_peptide, "")
+
+    def test_edits(self):
+        seq = "AUGUACUGGCACGCUACUGCUCCAUAUACUCACCAGAAUAUCAGUACAGCG"
+        model = translate.OrfModel(seq, self.genetic_code)
+        # UAC -> UAA makes a stop codon
+        effect = model.substitute(5, "A")
+        self.assertEqual(effect.longest_peptide, "MARYCSIYSPEYQYS")
+        self.assertEqual([orf.peptide for orf in effect.removed],
+                ["MYWHATAPYTHQNISTA"])
+        self.assertEqual(effect.added,
+                [translate.Orf(None, "+", 0, 0, 6, "M"),
+                # and AUG at 5 makes a start codon
+                translate.Orf(None, "+", 2, 5, 50, "MARYCSIYSPEYQYS")])
+        # A synonymous change changes nothing
+        effect = model.substitute(5, "U")
+        self.assertEqual(effect, ("MYWHATAPYTHQNISTA", [], []))
+        effect = model.delete(0, 1)
+        self.assertEqual(effect.added, [])
+        self.assertEqual(effect.longest_peptide, translate.get_longest_peptide(
+                seq[1:], self.genetic_code))
+        effect = model.insert(9, "G")
+        self.assertEqual(effect.longest_peptide, translate.get_longest_peptide(
+                seq[:9] + "G" + seq[9:], self.genetic_code))
+        self.assertEqual([orf.start for orf in effect.removed], [0])
+        self.assertEqual(model.sequence, seq)
+        self.assertRaises(ValueError, model.edit, 10, 5, "")
+        self.assertRaises(ValueError, model.delete, 50, len(seq) + 1)
+
+    def test_matches_rescan(self):
+        rng = random.Random(23)
+        for trial in range(100):
+            seq = "".join(rng.choice("ACGU") for i in range(
+                    rng.randint(0, 90)))
+            model = translate.OrfModel(seq, self.genetic_code)
+            orfs = self.all_orfs(seq)
+            for edit in range(5):
+                start = rng.randint(0, len(seq))
+                end = min(len(seq), start + rng.choice([0, 1, 1, 3, 4]))
+                bases = "".join(rng.choice("ACGU") for i in range(
+                        rng.choice([0, 1, 1, 2, 3])))
+                edited = seq[:start] + bases + seq[end:]
+                effect = model.edit(start, end, bases)
+                self.assertEqual(effect.longest_peptide,
+                        translate.get_longest_peptide(edited,
+                                self.genetic_code))
+                delta = len(bases) - (end - start)
+                kept = set(translate._moved_orf(orf, start, end, delta) for
+                        orf in orfs.difference(effect.removed))
+                self.assertEqual(kept.union(effect.added),
+                        self.all_orfs(edited))
+                self.assertFalse(kept.intersection(effect.added))
+
+
+class TestOrfWriter(TestTranslateBaseClass):
+
+    def setUp(self):
+        TestTranslateBaseClass.setUp(self)
+        self.orfs = [
+            translate.Orf("chr1 first", "+", 0, 3, 12, "MA"),
+            translate.Orf(None, "-", 2, 5, 200, "M" + "A" * 64),
+        ]
+
+    def write(self, format, **kwargs):
+        out = io.BytesIO()
+        with translate.OrfWriter(out, format, **kwargs) as writer:
+            self.assertEqual(writer.write_all(self.orfs), 2)
+        return out.getvalue()
+
+    def test_formats(self):
+        self.assertEqual(self.write("tsv").decode(),
+                "name\trecord\tstrand\tframe\tstart\tend\tlength\n"
+                "orf1\tchr1\t+\t0\t3\t12\t2\n"
+                "orf2\tsequence\t-\t2\t5\t200\t65\n")
+        self.assertEqual(self.write("bed").decode(),
+                "chr1\t3\t12\torf1\t0\t+\n"
+                "sequence\t5\t200\torf2\t0\t-\n")
+        self.assertEqual(self.write("fasta").decode(),
+                ">orf1 chr1:3-12(+) frame=0 length=2\nMA\n"
+                ">orf2 sequence:5-200(-) frame=2 length=65\n"
+                "M" + "A" * 59 + "\n" + "A" * 5 + "\n")
+        self.assertRaises(ValueError, translate.OrfWriter, io.BytesIO(),
+                "gff")
+        # BED scores are at most 1000, whatever the length of the peptide
+        self.orfs = [translate.Orf("chr1", "+", 0, 0, 3003, "M" * 1000)] * 2
+        self.assertEqual(self.write("bed").decode().split("\t")[4], "0")
+
+    def test_buffering(self):
+        out = io.BytesIO()
+        writer = translate.OrfWriter(out, "bed", buffer_size = 100)
+        writer.write(self.orfs[0])
+        self.assertEqual(out.getvalue(), b"")
+        for i in range(10):
+            writer.write(self.orfs[1])
+        self.assertGreater(len(out.getvalue()), 0)
+        writer.close()
+        self.assertEqual(out.getvalue().count(b"\n"), 11)
+
+    def test_gzip(self):
+        self.assertEqual(gzip.decompress(self.write("bed", compress = True)),
+                self.write("bed"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "orfs.bed.gz")
+            with translate.OrfWriter(path, "bed") as writer:
+                writer.write_all(self.orfs)
+            with gzip.open(path) as orf_file:
+                self.assertEqual(orf_file.read(), self.write("bed"))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fasta_path = os.path.join(directory, "genome.fa")
+            with open(fasta_path, "w") as fasta_file:
+                fasta_file.write(">chr1\nccATGGCCTAAGG\n>chr2\nATGTTT\n")
+            out_path = os.path.join(directory, "orfs.bed")
+            self.assertEqual(translate.main([fasta_path, "--format", "bed",
+                    "--output", out_path, "--min-length", "2"]), 0)
+            with open(out_path) as bed_file:
+                self.assertEqual(bed_file.read(),
+                        "chr1\t2\t11\torf1\t0\t+\n"
+                        "chr2\t0\t6\torf2\t0\t+\n")
+            report = io.StringIO()
+            with contextlib.redirect_stderr(report):
+                self.assertEqual(translate.main([fasta_path, "--output",
+                        out_path, "--profile"]), 0)
+            self.assertRegex(report.getvalue(), r"orfs +3\n")
+            with translate.collect_stats() as stats:
+                for seq in ("CCAUGGCCUAAGG", "AUGUUU"):
+                    translate.find_orfs(seq, self.genetic_code)
+            self.assertRegex(report.getvalue(), r"codons scanned +{0}\n"
+                    .format(stats.codons_scanned))
+            self.assertRegex(report.getvalue(), r"start codons +3\n")
+            self.assertRegex(report.getvalue(), r"\nscan +[0-9.]+ s")
+            self.assertIsNone(translate.get_stats())
+
+    def test_main_ambiguous_bases(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fasta_path = os.path.join(directory, "genome.fa")
+            with open(fasta_path, "w") as fasta_file:
+                fasta_file.write(">chr1\nATGAAACCCNNNNNNGGGTAAATGCCC\n"
+                        ">chr2\nTTAGGGNNNTTTCAT\n")
+            out_path = os.path.join(directory, "orfs.bed")
+            self.assertEqual(translate.main([fasta_path, "--format", "bed",
+                    "--output", out_path]), 0)
+            with open(out_path) as bed_file:
+                self.assertEqual(bed_file.read(),
+                        "chr1\t0\t9\torf1\t0\t+\n"
+                        "chr1\t21\t27\torf2\t0\t+\n"
+                        "chr2\t9\t15\torf3\t0\t-\n")
+            with open(fasta_path, "w") as fasta_file:
+                fasta_file.write(">chr1\nATGAAAXCC\n")
+            report = io.StringIO()
+            with contextlib.redirect_stderr(report):
+                self.assertEqual(translate.main([fasta_path, "--output",
+                        out_path]), 1)
+            self.assertIn("error: {0}: not a base or codon: 'X'".format(
+                    fasta_path), report.getvalue())
+
+
+def write_two_bit(path, records):
+    """Write `records`, a list of (name, bases) tuples, as a 2bit file.
+
+    N and lower case bases are written as N blocks and mask blocks.
+    """
+    index = b""
+    data = b""
+    offset = 16 + sum(1 + len(name) + 4 for name, bases in records)
+    for name, bases in records:
+        index += struct.pack("<B", len(name)) + name.encode() + struct.pack(
+                "<I", offset + len(data))
+        blocks = {}
+        for kind, pattern in (("N", "[Nn]+"), ("mask", "[a-z]+")):
+            blocks[kind] = [(m.start(), m.end() - m.start()) for m in
+                    re.finditer(pattern, bases)]
+        record = struct.pack("<I", len(bases))
+        for kind in ("N", "mask"):
+            record += struct.pack("<I", len(blocks[kind]))
+            record += b"".join(struct.pack("<I", start) for start, size in
+                    blocks[kind])
+            record += b"".join(struct.pack("<I", size) for start, size in
+                    blocks[kind])
+        record += struct.pack("<I", 0)
+        digits = [max("TCAG".find(base), 0) for base in bases.upper()]
+        digits += [0] * (-len(digits) % 4)
+        record += bytes(digits[i] << 6 | digits[i + 1] << 4 |
+                digits[i + 2] << 2 | digits[i + 3] for i in
+                range(0, len(digits), 4))
+        data += record
+    with open(path, "wb") as two_bit_file:
+        two_bit_file.write(struct.pack("<IIII", 0x1A412743, 0, len(records),
+                0) + index + data)
+
+
+class TestMappedFiles(TestTranslateBaseClass):
+
+    def setUp(self):
+        TestTranslateBaseClass.setUp(self)
+        self.directory = tempfile.TemporaryDirectory()
+        rng = random.Random(17)
+        self.records = [
+            ("chr1", "".join(rng.choice("ACGU") for i in range(1000))),
+            ("chr2", "".join(rng.choice("ACGU") for i in range(61))),
+            ("empty", ""),
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_fasta(self, width = 60, newline = "\n"):
+        path = os.path.join(self.directory.name, "seqs.fa")
+        with open(path, "w", newline = "") as fasta_file:
+            for name, seq in self.records:
+                fasta_file.write(">" + name + " description" + newline)
+                for i in range(0, len(seq), width):
+                    fasta_file.write(seq[i: i + width] + newline)
+        return path
+
+    def test_fasta_fetch(self):
+        for newline in ("\n", "\r\n"):
+            path = self.write_fasta(newline = newline)
+            with translate.FastaFile(path) as fasta:
+                self.assertEqual(fasta.names, ["chr1", "chr2", "empty"])
+                for name, seq in self.records:
+                    self.assertEqual(fasta.length(name), len(seq))
+                    self.assertEqual(bytes(fasta.fetch(name)), seq.encode())
+                seq = self.records[0][1]
+                for start, end in ((0, 0), (5, 50), (55, 65), (59, 60),
+                        (60, 181), (999, 1000)):
+                    region = fasta.fetch("chr1", start, end)
+                    self.assertIsInstance(region, memoryview)
+                    self.assertEqual(bytes(region), seq[start: end].encode())
+                self.assertRaises(ValueError, fasta.fetch, "chr2", 10, 62)
+                self.assertRaises(KeyError, fasta.fetch, "chr3")
+            os.remove(path + ".fai")
+
+    def test_fasta_index_file(self):
+        path = self.write_fasta()
+        translate.FastaFile(path).close()
+        with open(path + ".fai") as index_file:
+            self.assertEqual(index_file.readline(),
+                    "chr1\t1000\t18\t60\t61\n")
+        with translate.FastaFile(path) as fasta:
+            self.assertEqual(bytes(fasta.fetch("chr2", 58)),
+                    self.records[1][1][58:].encode())
+
+    def test_fasta_uneven_lines(self):
+        path = os.path.join(self.directory.name, "uneven.fa")
+        with open(path, "w") as fasta_file:
+            fasta_file.write(">a\nACG\nACGUACGU\nACGUACGU\nA\n")
+        self.assertRaises(ValueError, translate.FastaFile, path)
+        # Right number of lines, but a short line inside the record
+        cases = [(">a\nACGU\nAC\nGUAC\n", None), (">a\nACGU\nACGUA\n", None),
+                (">a\r\nACGU\r\nAC\r\nGUAC\r\n", None),
+                (">a\nACGU\nAC\n\n", None), (">a\nACGU\nACGU\nAC", 10),
+                (">a\r\nACGU\r\nAC\r\n", 6), (">a\n>b\nAC\n", 0)]
+        for number, (text, length) in enumerate(cases):
+            path = os.path.join(self.directory.name,
+                    "case{0}.fa".format(number))
+            with open(path, "w", newline = "") as fasta_file:
+                fasta_file.write(text)
+            if length is None:
+                self.assertRaises(ValueError, translate.FastaFile, path)
+                continue
+            with translate.FastaFile(path) as fasta:
+                self.assertEqual(fasta.length("a"), length)
+                self.assertEqual(bytes(fasta.fetch("a")),
+                        text.split("\n", 1)[1].split(">")[0].replace("\r",
+                                "").replace("\n", "").encode("ascii"))
+
+    def test_translate_fasta_regions(self):
+        path = self.write_fasta()
+        seq = self.records[0][1]
+        with translate.FastaFile(path) as fasta:
+            region = fasta.fetch("chr1", 100, 700)
+            self.assertEqual(
+                    translate.get_longest_peptide(region, self.genetic_code),
+                    translate.get_longest_peptide(seq[100: 700],
+                            self.genetic_code))
+            self.assertEqual(
+                    translate.get_all_translations(region, self.genetic_code),
+                    translate.get_all_translations(seq[100: 700],
+                            self.genetic_code))
+            region = fasta.fetch("chr1", 121, 160)
+            self.assertEqual(
+                    translate.translate_sequence(region, self.genetic_code),
+                    translate.translate_sequence(seq[121: 160],
+                            self.genetic_code))
+
+    def test_two_bit_fetch(self):
+        path = os.path.join(self.directory.name, "seqs.2bit")
+        dna = "ACGTacgtNNNNNacgTTGCAnnGT" * 7 + "A"
+        write_two_bit(path, [("first", "ACGT"), ("second", dna)])
+        with translate.TwoBitFile(path) as two_bit:
+            self.assertEqual(two_bit.names, ["first", "second"])
+            self.assertEqual(two_bit.length("second"), len(dna))
+            self.assertEqual(bytes(two_bit.fetch("first")), b"ACGT")
+            for start in range(0, 30):
+                for end in range(start, len(dna), 7):
+                    self.assertEqual(
+                            bytes(two_bit.fetch("second", start, end,
+                                    mask = True)),
+                            dna[start: end].encode())
+                    self.assertEqual(
+                            bytes(two_bit.fetch("second", start, end)),
+                            dna[start: end].upper().encode())
+            self.assertEqual(
+                    bytes(two_bit.fetch("second", 0, 8, alphabet = "rna")),
+                    b"ACGUACGU")
+            self.assertRaises(ValueError, two_bit.fetch, "second", 5, 1000)
+        not_two_bit = os.path.join(self.directory.name, "not.2bit")
+        with open(not_two_bit, "wb") as out:
+            out.write(b"\0" * 32)
+        self.assertRaises(ValueError, translate.TwoBitFile, not_two_bit)
+
+
+class TestPeptideIndex(TestTranslateBaseClass):
+
+    def setUp(self):
+        TestTranslateBaseClass.setUp(self)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "peptides.pep")
+        rng = random.Random(17)
+        self.records = [("seq{0}".format(i), "".join(rng.choice("ACGU")
+                for j in range(n))) for i, n in enumerate((0, 400, 2000))]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def scan(self, query, match):
+        # Hits found by translating every reading frame
+        hits = set()
+        for name, seq in self.records:
+            for orf in translate.find_orfs(seq, self.genetic_code):
+                peptide = orf.peptide
+                if match == "motif":
+                    offsets = [i for i in range(len(peptide))
+                            if peptide.startswith(query, i)]
+                elif peptide.startswith(query) and (match == "prefix" or
+                        peptide == query):
+                    offsets = [0]
+                else:
+                    continue
+                for offset in offsets:
+                    if orf.strand == "+":
+                        start = orf.start + 3 * offset
+                        end = start + 3 * len(query)
+                    else:
+                        end = orf.end - 3 * offset
+                        start = end - 3 * len(query)
+                    hit = (name, orf.strand, start % 3, start, end)
+                    if match != "motif":
+                        hit += (orf.start, orf.end)
+                    hits.add(hit)
+        return hits
+
+    def test_hits_match_scan(self):
+        rng = random.Random(5)
+        peptides = [orf.peptide for name, seq in self.records
+                for orf in translate.find_orfs(seq, self.genetic_code)]
+        with translate.PeptideIndex.build(self.records, self.genetic_code,
+                self.path) as index:
+            self.assertEqual(index.names, ["seq0", "seq1", "seq2"])
+            for i in range(40):
+                peptide = rng.choice(peptides)
+                offset = rng.randrange(len(peptide))
+                motif = peptide[offset: offset + rng.randrange(1, 4)]
+                hits = index.find(motif)
+                self.assertEqual(set(hit[:5] for hit in hits),
+                        self.scan(motif, "motif"))
+                self.assertEqual(index.count(motif), len(hits))
+                for hit in hits:
+                    self.assertTrue(hit.orf_start <= hit.start < hit.end
+                            <= hit.orf_end)
+                prefix = peptide[:rng.randrange(1, len(peptide) + 1)]
+                self.assertEqual(set(index.find_peptides(prefix,
+                        prefix = True)), self.scan(prefix, "prefix"))
+                self.assertEqual(set(index.find_peptides(peptide)),
+                        self.scan(peptide, "exact"))
+
+    def test_coordinates(self):
+        # MAW and a stop codon on '+' at 2-14, and MKVVTKPW with no stop
+        # codon on '-' over the whole sequence
+        seq = "CCAUGGCUUGGUAACCACUUUCAU"
+        with translate.PeptideIndex.build(seq, self.genetic_code,
+                self.path) as index:
+            self.assertEqual(index.find("aw"),
+                    [translate.PeptideHit(None, "+", 2, 5, 11, 2, 14)])
+            self.assertEqual(index.find("KV"),
+                    [translate.PeptideHit(None, "-", 0, 15, 21, 0, 24)])
+            self.assertEqual(index.find_peptides("MAW"),
+                    [translate.PeptideHit(None, "+", 2, 2, 11, 2, 14)])
+            self.assertEqual(index.find_peptides("MA"), [])
+            self.assertEqual(len(index.find_peptides("MA", prefix = True)),
+                    1)
+            self.assertEqual(index.find("AWM"), [])
+            self.assertRaises(ValueError, index.find, "")
+            self.assertRaises(ValueError, index.count, "M\nA")
+
+    def test_suffix_array_engines(self):
+        text = bytearray(b"MAMAMKMA\nMMMM\n\nKV\n" * 20)
+        expected = sorted(range(len(text)), key = lambda i: text[i:])
+        self.assertEqual(list(translate._suffix_array(text)), expected)
+        if translate.numpy is not None:
+            threshold = translate.NUMPY_THRESHOLD
+            translate.NUMPY_THRESHOLD = 1
+            try:
+                self.assertEqual(list(translate._suffix_array(text)),
+                        expected)
+            finally:
+                translate.NUMPY_THRESHOLD = threshold
+
+    def test_reopen(self):
+        translate.PeptideIndex.build(self.records, self.genetic_code,
+                self.path, min_length = 10).close()
+        with translate.PeptideIndex(self.path) as index:
+            self.assertEqual(index.min_length, 10)
+            self.assertEqual(set(hit[:5] for hit in index.find("M")),
+                    set(hit[:5] for hit in translate.PeptideIndex.build(
+                            self.records, self.genetic_code, self.path,
+                            min_length = 10).find("M")))
+        with open(self.path, "r+b") as index_file:
+            index_file.write(b"ORFI")
+        self.assertRaises(ValueError, translate.PeptideIndex, self.path)
+
+
+class TestTranslationServer(TestTranslateBaseClass):
+
+    def setUp(self):
+        TestTranslateBaseClass.setUp(self)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "translate.sock")
+        rng = random.Random(23)
+        self.seqs = ["".join(rng.choice("ACGU") for i in range(n))
+                for n in (0, 2, 60, 150, 150, 600)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_server(self, check, **options):
+        async def run():
+            async with translate.TranslationServer(self.genetic_code,
+                    **options) as server:
+                await server.start(self.path)
+                async with await translate.TranslationClient.connect(
+                        self.path) as client:
+                    await check(server, client)
+        asyncio.run(run())
+
+    def test_requests(self):
+        async def check(server, client):
+            for seq in self.seqs:
+                self.assertEqual(await client.translate_sequence(seq),
+                        translate.translate_sequence(seq, self.genetic_code))
+                self.assertEqual(await client.get_longest_peptide(seq),
+                        translate.get_longest_peptide(seq, self.genetic_code))
+                table = translate.find_orfs(seq, self.genetic_code,
+                        min_length = 2)
+                self.assertEqual(await client.find_orfs(seq, min_length = 2),
+                        [[orf.strand, orf.frame, orf.start, orf.end,
+                                orf.peptide] for orf in table])
+            with self.assertRaises(KeyError) as context:
+                await client.translate_sequence("AUGXUU")
+            self.assertEqual(context.exception.args, ("X",))
+            with self.assertRaises(ValueError):
+                await client.request("reverse", "AUG")
+            stats = await client.stats()
+            self.assertEqual(stats["requests"], 3 * len(self.seqs) + 2)
+            self.assertEqual(stats["errors"], 2)
+            self.assertGreater(stats["latency_seconds"]["p99"], 0.0)
+        self.run_server(check, processes = 1)
+
+    def test_batching_and_backpressure(self):
+        reads = self.seqs * 40
+        async def check(server, client):
+            results = await asyncio.gather(*(client.get_longest_peptide(read)
+                    for read in reads))
+            self.assertEqual(results, [translate.get_longest_peptide(read,
+                    self.genetic_code) for read in reads])
+            self.assertLessEqual(server.batched_requests / server.batches,
+                    4)
+        self.run_server(check, processes = 2, batch_size = 4, max_queue = 2,
+                max_pending = 3)
+        async def check(server, client):
+            await asyncio.gather(*(client.translate_sequence(read)
+                    for read in reads))
+            self.assertGreater(server.batched_requests / server.batches, 4)
+        self.run_server(check, processes = 1, batch_delay = 0.05)
+
+    def test_invalid_requests(self):
+        async def check(server, client):
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(b"not json\n[1]\n"
+                    b"{\"id\": 7, \"op\": \"translate\"}\n\n")
+            for request_id in (None, None, 7):
+                response = json.loads(await reader.readline())
+                self.assertEqual(response["id"], request_id)
+                self.assertEqual(response["error"]["type"], "ValueError")
+            writer.close()
+            self.assertEqual(await client.translate_sequence("AUGUAA"), "M")
+        self.run_server(check, processes = 1)
+        self.assertRaises(ValueError, translate.TranslationServer,
+                self.genetic_code, batch_size = 0)
+
+    def test_close_with_open_connection(self):
+        async def run():
+            server = translate.TranslationServer(self.genetic_code,
+                    processes = 1)
+            await server.start(self.path)
+            client = await translate.TranslationClient.connect(self.path)
+            self.assertEqual(await client.translate_sequence("AUGUAA"), "M")
+            await asyncio.wait_for(server.close(), 5)
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(client.translate_sequence("AUG"), 5)
+            await client.close()
+        asyncio.run(run())
+
+    def test_latency_percentiles(self):
+        server = translate.TranslationServer(self.genetic_code)
+        self.assertEqual(server.latency_percentiles((50,)), {"p50": None})
+        server.latencies.extend(range(1, 101))
+        self.assertEqual(server.latency_percentiles(),
+                {"p50": 50, "p90": 90, "p99": 99, "p100": 100})
+
+
+class TestPerformanceContracts(TestTranslateBaseClass):
+    """Check that time and memory grow linearly with the input.
+
+    Times are CPU times (so time spent waiting for other processes does not
+    count), per call, taking the best of a few runs at doubling sizes. Each
+    run repeats the call until it has taken at least `MIN_DURATION`, so that
+    even the smallest sizes are well above the resolution of the clock. Only
+    the slope of log(time) against log(size) is checked, with room for a
+    noisy shared machine: linear is 1, quadratic 2. Peak memory is measured
+    with `tracemalloc`, which does not depend on the load of the machine.
+
+    Scaling is checked for both engines: with NumPy (if installed) at
+    `SIZES`, and in pure Python, with `NUMPY_THRESHOLD` out of reach, at the
+    smaller `PYTHON_SIZES`.
+    """
+
+    SIZES = (100000, 200000, 400000, 800000)
+    PYTHON_SIZES = (20000, 40000, 80000, 160000)
+    MAX_TIME_EXPONENT = 1.4
+    MAX_MEMORY_EXPONENT = 1.2
+    BUDGET_SIZE = 10000000
+    MIN_DURATION = 0.05
+
+    def setUp(self):
+        TestTranslateBaseClass.setUp(self)
+        code = translate.compile_genetic_code(self.genetic_code)
+        # name: (function of a sequence, profile of the sequences, peak
+        # memory budget in bytes per base of a 10 Mb sequence, whether it is
+        # fast enough to measure at 10 Mb without NumPy)
+        self.contracts = {
+            "translate_sequence": (
+                    lambda seq: translate.translate_sequence(seq, code),
+                    "coding", 8, False),
+            "get_all_translations": (
+                    lambda seq: translate.get_all_translations(seq, code),
+                    "sparse", 8, False),
+            "reverse_and_complement": (
+                    translate.reverse_and_complement, "dense", 3, True),
+            "get_longest_peptide": (
+                    lambda seq: translate.get_longest_peptide(seq, code),
+                    "sparse", 8, False),
+        }
+
+    def best_time(self, function, seq, repeat = 3):
+        best = None
+        for i in range(repeat):
+            calls = 0
+            start = time.process_time()
+            while True:
+                function(seq)
+                calls += 1
+                elapsed = time.process_time() - start
+                if elapsed >= self.MIN_DURATION:
+                    break
+            if best is None or elapsed / calls < best:
+                best = elapsed / calls
+        return best
+
+    def peak_memory(self, function, seq):
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            function(seq)
+            return tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+
+    def engines(self):
+        # (engine, sizes, NumPy threshold) to check scaling with
+        engines = [("python", self.PYTHON_SIZES, sys.maxsize)]
+        if translate.numpy is not None:
+            engines.insert(0, ("numpy", self.SIZES,
+                    translate.NUMPY_THRESHOLD))
+        return engines
+
+    def check_scaling(self, measure, max_exponent, quantity):
+        threshold = translate.NUMPY_THRESHOLD
+        self.addCleanup(setattr, translate, "NUMPY_THRESHOLD", threshold)
+        for engine, sizes, engine_threshold in self.engines():
+            translate.NUMPY_THRESHOLD = engine_threshold
+            for name, (function, profile, budget, fast) in \
+                    self.contracts.items():
+                with self.subTest(name, engine = engine):
+                    seqs = [bench_translate.make_sequence(profile, size,
+                            "rna") for size in sizes]
+                    function(seqs[0])
+                    values = [measure(function, seq) for seq in seqs]
+                    exponent = bench_translate.scaling_exponent(sizes,
+                            values)
+                    self.assertLess(exponent, max_exponent,
+                            "{0} ({1}): {2} grows as n^{3:.2f} ({4})".format(
+                                    name, engine, quantity, exponent,
+                                    values))
+
+    def test_linear_time(self):
+        self.check_scaling(self.best_time, self.MAX_TIME_EXPONENT, "time")
+
+    def test_linear_memory(self):
+        self.check_scaling(self.peak_memory, self.MAX_MEMORY_EXPONENT,
+                "memory")
+
+    def test_memory_budgets(self):
+        for name, (function, profile, budget, fast) in self.contracts.items():
+            with self.subTest(name):
+                if translate.numpy is None and not fast:
+                    self.skipTest("too slow to trace at 10 Mb without NumPy")
+                seq = bench_translate.make_sequence(profile, self.BUDGET_SIZE,
+                        "rna")
+                peak = self.peak_memory(function, seq)
+                self.assertLessEqual(peak, budget * self.BUDGET_SIZE,
+                        "{0}: peak of {1:.2f} bytes per base, budget "
+                        "{2}".format(name, peak / self.BUDGET_SIZE, budget))
+
+
 if __name__ == '__main__':
     unittest.main() 
@@ -1,23 +1,676 @@
 #! /usr/bin/env python3
 
+import argparse
+import array
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import struct
 import sys
+import tempfile
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Bases in the order used to number codons: the codon b1 b2 b3 has index
+# 16 * i(b1) + 4 * i(b2) + i(b3).
+BASES = "ACGU"
+
+# Genetic codes published by NCBI, by translation table ID. Amino acids are
+# listed for the 64 codons with bases in NCBI's TCAG order.
+NCBI_TRANSLATION_TABLES = {
+    1: ("Standard",
+        "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"),
+    2: ("Vertebrate Mitochondrial",
+        "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSS**VVVVAAAADDEEGGGG"),
+    3: ("Yeast Mitochondrial",
+        "FFLLSSSSYY**CCWWTTTTPPPPHHQQRRRRIIMMTTTTNNKKSSRRVVVVAAAADDEEGGGG"),
+    4: ("Mold, Protozoan, and Coelenterate Mitochondrial",
+        "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"),
+    5: ("Invertebrate Mitochondrial",
+        "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSSSVVVVAAAADDEEGGGG"),
+    6: ("Ciliate, Dasycladacean and Hexamita Nuclear",
+        "FFLLSSSSYYQQCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"),
+    11: ("Bacterial, Archaeal and Plant Plastid",
+        "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"),
+}
+
+# Maps every byte to the index of the base it encodes, ignoring case and
+# reading T as U. Bytes that are not a base map to 64, which pushes the index
+# of any codon that contains them to 64 or more.
+_INVALID_BASE = 64
+_BASE_INDEX_TABLE = bytearray([_INVALID_BASE] * 256)
+for _base_index, _base in enumerate(BASES):
+    _BASE_INDEX_TABLE[ord(_base)] = _base_index
+    _BASE_INDEX_TABLE[ord(_base.lower())] = _base_index
+_BASE_INDEX_TABLE[ord("T")] = _BASE_INDEX_TABLE[ord("t")] = BASES.index("U")
+_BASE_INDEX_TABLE = bytes(_BASE_INDEX_TABLE)
+# Largest index a codon containing invalid bases can get.
+_MAX_CODON_INDEX = (_INVALID_BASE << 4) | (_INVALID_BASE << 2) | _INVALID_BASE
+# Maps the number of a codon to the number of its reverse complement. Codons
+# with invalid bases map to `_MAX_CODON_INDEX`.
+_REVERSE_COMPLEMENT_CODON = [_MAX_CODON_INDEX] * (_MAX_CODON_INDEX + 1)
+for _codon_index in range(64):
+    _REVERSE_COMPLEMENT_CODON[_codon_index] = (
+            ((3 - (_codon_index & 3)) << 4) |
+            ((3 - ((_codon_index >> 2) & 3)) << 2) |
+            (3 - (_codon_index >> 4)))
+
+# The complement of every base and IUPAC ambiguity code, for RNA and DNA
+# output. Both 'T' and 'U' are accepted as input either way.
+_COMPLEMENTS = {
+    "rna": {
+        "A": "U", "C": "G", "G": "C", "U": "A", "T": "A",
+        "R": "Y", "Y": "R", "K": "M", "M": "K", "S": "S", "W": "W",
+        "B": "V", "V": "B", "D": "H", "H": "D", "N": "N", "-": "-",
+    },
+}
+_COMPLEMENTS["dna"] = dict(_COMPLEMENTS["rna"], A = "T")
+_NUCLEOTIDE_CODES = "".join(_COMPLEMENTS["rna"])
+_NUCLEOTIDE_CODES = (_NUCLEOTIDE_CODES + _NUCLEOTIDE_CODES.lower()).encode(
+        "ascii")
+
+def _build_complement_tables(complements):
+    # Tables for str.translate and bytes.translate that map characters to
+    # their complement, ignoring case, and every other ASCII character to 0.
+    table = bytearray(256)
+    for base, complement in complements.items():
+        table[ord(base)] = ord(complement)
+        table[ord(base.lower())] = ord(complement)
+    return (dict(enumerate(table[:128].decode("ascii"))), bytes(table))
+
+_COMPLEMENT_TABLES = dict((alphabet, _build_complement_tables(complements))
+        for alphabet, complements in _COMPLEMENTS.items())
+
+# Maps every base and ambiguity code, in either case, to its upper-case RNA
+# form (T to U), and every other byte to 0.
+_NORMALIZE_TABLE = bytearray(256)
+for _code in _COMPLEMENTS["rna"]:
+    _NORMALIZE_TABLE[ord(_code)] = ord(_code)
+    _NORMALIZE_TABLE[ord(_code.lower())] = ord(_code)
+_NORMALIZE_TABLE[ord("T")] = _NORMALIZE_TABLE[ord("t")] = ord("U")
+_NORMALIZE_TABLE = bytes(_NORMALIZE_TABLE)
+
+class NormalizedSequence(bytes):
+    """A sequence in canonical form: upper-case RNA bases and ambiguity codes
+    as bytes, made by `normalize_sequence`.
+
+    Functions that check their input take these as they are. Slicing gives
+    plain bytes.
+    """
+
+def normalize_sequence(sequence):
+    """Get `sequence` as a `NormalizedSequence`.
+
+    Upper-cases the bases, reads T as U, and checks that every character is
+    a base or IUPAC ambiguity code (or '-') in a single `bytes.translate`.
+    `sequence` can be a string, any bytes-like object or a `PackedSequence`;
+    a `NormalizedSequence` is returned as it is.
+
+    Raises a `KeyError` for the first character that is not a base or
+    ambiguity code.
+    """
+    if isinstance(sequence, NormalizedSequence):
+        return sequence
+    if isinstance(sequence, str):
+        data = sequence.encode("ascii", "replace")
+    else:
+        data = bytes(sequence)
+    normalized = data.translate(_NORMALIZE_TABLE)
+    position = normalized.find(0)
+    if position >= 0:
+        character = sequence[position] if isinstance(sequence, str) else \
+                chr(data[position])
+        raise KeyError(character)
+    return NormalizedSequence(normalized)
+
+def _normalized(sequence, normalize):
+    # `sequence` normalized, unless `normalize` is false or it needs no
+    # normalizing
+    if not normalize or isinstance(sequence, (NormalizedSequence,
+            PackedSequence)):
+        return sequence
+    return normalize_sequence(sequence)
+
+def _check_bases(data, sequence, position = 0):
+    # Raise a `KeyError` for the first character of `data`, the bytes of
+    # `sequence` from `position` on, that is not a base or ambiguity code.
+    # Deleting the valid characters leaves nothing to copy in the usual
+    # case.
+    if not isinstance(data, (bytes, bytearray)):
+        data = bytes(data)
+    if data.translate(None, _NUCLEOTIDE_CODES):
+        offset = data.translate(_NORMALIZE_TABLE).find(0)
+        if isinstance(sequence, str):
+            raise KeyError(sequence[position + offset])
+        raise KeyError(chr(data[offset]))
+
+# Number of bases encoded at a time while walking a sequence.
+_BLOCK_SIZE = 3 * 4096
+
+# Number of bytes read at a time from FASTA files.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Sequences with at least this many bases are translated with NumPy, if it is
+# installed.
+NUMPY_THRESHOLD = 50000
+
+
+class TranslationStats:
+    """Counters and timings collected while stats are enabled.
+
+    Counts `codons_translated` (by `translate_sequence`), `codons_scanned`
+    and `start_codons` (by the reading frame scans), `orfs` found, and
+    `bytes_copied` into intermediate buffers. `stage_seconds` holds the wall
+    time spent in each stage ("translate", "scan", "reverse_complement",
+    "all_translations", "longest_peptides"), not counting the time of the
+    stages it calls, so the stages add up to the total; `stage_calls` counts
+    the calls to each stage.
+
+    If `callback` is given, it is called as `callback(stage, seconds,
+    stats)` every time a stage finishes.
+    """
+
+    COUNTERS = ("codons_translated", "codons_scanned", "start_codons",
+            "orfs", "bytes_copied")
+
+    def __init__(self, callback = None):
+        self.callback = callback
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        # [stage, start time, time spent in stages it called] of the stages
+        # running now
+        self._running = []
+
+    def start_stage(self, stage):
+        self._running.append([stage, time.perf_counter(), 0.0])
+
+    def end_stage(self):
+        stage, start, nested = self._running.pop()
+        seconds = time.perf_counter() - start
+        if self._running:
+            self._running[-1][2] += seconds
+        self.stage_seconds[stage] = (self.stage_seconds.get(stage, 0.0) +
+                seconds - nested)
+        self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+        if self.callback is not None:
+            self.callback(stage, seconds, self)
+
+    def as_dict(self):
+        """Get the counters and stage timings as a dict."""
+        result = dict((counter, getattr(self, counter)) for counter in
+                self.COUNTERS)
+        result["stage_seconds"] = dict(self.stage_seconds)
+        result["stage_calls"] = dict(self.stage_calls)
+        return result
+
+    def report(self):
+        """Get a table of the counters and stage timings, as text."""
+        lines = []
+        for counter in self.COUNTERS:
+            lines.append("{0:<20} {1:>15,}".format(
+                    counter.replace("_", " "), getattr(self, counter)))
+        total = sum(self.stage_seconds.values())
+        for stage, seconds in sorted(self.stage_seconds.items(),
+                key = lambda item: -item[1]):
+            lines.append("{0:<20} {1:>12.6f} s {2:>6.1%} {3:>9,} calls".format(
+                    stage, seconds, seconds / total if total else 0.0,
+                    self.stage_calls[stage]))
+        return "\n".join(lines) + "\n"
+
+# The `TranslationStats` being collected, or None when stats are disabled.
+_stats = None
+
+def enable_stats(callback = None):
+    """Start collecting `TranslationStats`, and return them.
+
+    Stats are off by default, and cost a single check per call while off.
+    """
+    global _stats
+    _stats = TranslationStats(callback)
+    return _stats
+
+def disable_stats():
+    """Stop collecting stats, and return the ones collected (or None)."""
+    global _stats
+    stats = _stats
+    _stats = None
+    return stats
+
+def get_stats():
+    """Get the `TranslationStats` being collected, or None."""
+    return _stats
+
+@contextlib.contextmanager
+def collect_stats(callback = None):
+    """Collect `TranslationStats` for the duration of a `with` block."""
+    stats = enable_stats(callback)
+    try:
+        yield stats
+    finally:
+        disable_stats()
+
+def _stage(stage):
+    # Decorator that times calls to a function as `stage` while stats are
+    # enabled.
+    def decorate(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            stats = _stats
+            if stats is None:
+                return function(*args, **kwargs)
+            stats.start_stage(stage)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.end_stage()
+        return timed
+    return decorate
+
+
+DEFAULT_CACHE_ENTRIES = 4096
+
+class TranslationCache:
+    """A thread-safe LRU cache of translation results.
+
+    Results are keyed on the kind of call, a 128-bit BLAKE2 digest of the
+    sequence, and the `GeneticCode` (and any other argument that changes the
+    result). Once there are more than `max_entries` results, or their sizes
+    add up to more than `max_bytes`, the least recently used ones are
+    evicted. Either limit can be None.
+
+    `hits` and `misses` count the lookups. Two threads missing the same key
+    at once both compute the result; the lock is not held while computing.
+    """
+
+    def __init__(self, max_entries = DEFAULT_CACHE_ENTRIES, max_bytes = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        # key: (result, size)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, kind, sequence, key, compute):
+        """Get the cached result of `compute()`, computing it on a miss.
+
+        `kind` and `key` (a hashable of the arguments other than
+        `sequence`) are part of the cache key.
+        """
+        cache_key = (kind, sequence_digest(sequence), key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        result = compute()
+        size = _result_size(result)
+        with self._lock:
+            if cache_key not in self._entries:
+                self._entries[cache_key] = (result, size)
+                self.size_bytes += size
+                self._evict()
+        return result
+
+    def _evict(self):
+        while self._entries and (
+                (self.max_entries is not None and
+                        len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and
+                        self.size_bytes > self.max_bytes)):
+            result, size = self._entries.popitem(last = False)[1]
+            self.size_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached result (the counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def as_dict(self):
+        """Get the counters and sizes of the cache as a dict."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+def sequence_digest(sequence):
+    """Get a 128-bit digest of the bases of `sequence`.
+
+    Strings, bytes-like objects and `PackedSequence`s with the same bases
+    have the same digest.
+    """
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii", "replace")
+    elif isinstance(sequence, PackedSequence):
+        sequence = bytes(sequence)
+    return hashlib.blake2b(sequence, digest_size = 16).digest()
+
+def _result_size(result):
+    # Approximate memory held by a cached result, in bytes
+    if isinstance(result, list):
+        return sys.getsizeof(result) + sum(sys.getsizeof(item) for item in
+                result)
+    return sys.getsizeof(result)
+
+# The `TranslationCache` in use, or None when caching is off.
+_cache = None
+
+def enable_cache(max_entries = DEFAULT_CACHE_ENTRIES, max_bytes = None):
+    """Start caching the results of `translate_sequence` and
+    `get_longest_peptide`, and return the new `TranslationCache`.
+
+    Caching is off by default.
+    """
+    global _cache
+    _cache = TranslationCache(max_entries, max_bytes)
+    return _cache
+
+def disable_cache():
+    """Stop caching, and return the cache that was in use (or None)."""
+    global _cache
+    cache = _cache
+    _cache = None
+    return cache
+
+def get_cache():
+    """Get the `TranslationCache` in use, or None."""
+    return _cache
+
+
+class GeneticCode:
+    """A genetic code compiled for fast translation.
+
+    Built once from a dict that maps codons (RNA or DNA) to amino acids
+    (with '*' for stop codons), or from an NCBI translation table with
+    `from_ncbi_table`.
+    Codons are numbered 0 to 63 from their bases (see `BASES`), and
+    `amino_acids` holds the amino acid of every codon by number, so
+    translating a codon is a list lookup instead of hashing a string.
+    Codons missing from the dict are `None`. `stop_codons` and
+    `start_codons` are sets of codon strings.
+
+    Every function in this module that takes a `genetic_code` accepts a
+    `GeneticCode`, a dict (compiled and cached by `compile_genetic_code`), or
+    an NCBI translation table ID.
+    """
+
+    def __init__(self, genetic_code, start_codons = ("AUG",), name = None):
+        amino_acids = [None] * 64
+        for codon, aa in genetic_code.items():
+            amino_acids[codon_index(codon)] = aa
+        self.name = name
+        self.amino_acids = tuple(amino_acids)
+        # Codon strings are kept as upper-case RNA, whatever the dict uses
+        self.stop_codons = frozenset(_rna_codon(codon) for codon, aa in
+                genetic_code.items() if aa == "*")
+        self.start_codons = frozenset(_rna_codon(codon) for codon in
+                start_codons)
+        self._stop_indices = frozenset(codon_index(codon) for codon in
+                self.stop_codons)
+        self._start_indices = frozenset(codon_index(codon) for codon in
+                self.start_codons)
+        # Padded so that codons with invalid bases look up `None` instead of
+        # running off the end.
+        self._lookup = list(amino_acids) + (
+                [None] * (_MAX_CODON_INDEX + 1 - 64))
+
+    @classmethod
+    def from_ncbi_table(cls, table_id, start_codons = ("AUG",)):
+        """Get the genetic code of NCBI translation table `table_id`."""
+        try:
+            name, amino_acids = NCBI_TRANSLATION_TABLES[table_id]
+        except KeyError:
+            raise ValueError(
+                    "Unknown NCBI translation table: {0!r}".format(table_id))
+        ncbi_bases = "UCAG"
+        codons = [b1 + b2 + b3 for b1 in ncbi_bases for b2 in ncbi_bases
+                for b3 in ncbi_bases]
+        return cls(dict(zip(codons, amino_acids)),
+                start_codons = start_codons,
+                name = name)
+
+    def as_dict(self):
+        """Return the genetic code as a dict of codons to amino acids."""
+        return dict((codon, aa) for codon, aa in zip(all_codons(),
+                self.amino_acids) if aa is not None)
+
+    def _key(self):
+        return (self.amino_acids, self.start_codons)
+
+    def __eq__(self, other):
+        if not isinstance(other, GeneticCode):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        if self.name:
+            return "GeneticCode({0!r})".format(self.name)
+        return "GeneticCode({0!r})".format("".join(aa or "-" for aa in
+                self.amino_acids))
+
+    def encoded_blocks(self, sequence, frame = 0):
+        """Iterate over `sequence` as blocks of base indices.
+
+        Yields tuples `(position, block)`, where `block` is a `bytes` object
+        holding the base index (see `BASES`) of each base of `sequence` from
+        `position` on. Bases are read in either case and T as U, and
+        ambiguity codes are 64. Blocks start at `frame` and hold whole
+        codons, except maybe the last one. Only one block is held in memory
+        at a time.
+
+        Raises a `KeyError`, when its block is reached, for the first
+        character that is not a base or ambiguity code.
+        """
+        if isinstance(sequence, PackedSequence):
+            for position in range(frame, len(sequence) - 2, _BLOCK_SIZE):
+                block = sequence.base_indices(position,
+                        position + _BLOCK_SIZE)
+                if _stats is not None:
+                    _stats.bytes_copied += 2 * len(block)
+                yield position, block
+            return
+        checked = isinstance(sequence, NormalizedSequence)
+        for position in range(frame, len(sequence) - 2, _BLOCK_SIZE):
+            block = sequence[position: position + _BLOCK_SIZE]
+            if isinstance(block, str):
+                block = block.encode("ascii", "replace")
+            elif not isinstance(block, bytes):
+                block = bytes(block)
+            if not checked:
+                _check_bases(block, sequence, position)
+            if _stats is not None:
+                # the slice, its encoding and the translated block
+                _stats.bytes_copied += 3 * len(block)
+            yield position, block.translate(_BASE_INDEX_TABLE)
+
+    def dicodon_table(self):
+        """Get the table used to translate two codons at a time.
+
+        Returns a dict that maps each pair of codons, written as six base
+        indices in a `bytes` object (as in `encoded_blocks`), to the two
+        amino acids they encode. Pairs that include a stop codon or a codon
+        missing from the genetic code are left out, so a failed lookup means
+        the pair has to be translated one codon at a time. The table is built
+        the first time it is needed.
+        """
+        return self._get_dicodon_tables()[0]
+
+    def _get_dicodon_tables(self):
+        # The dicodon table, and the set of pairs (keyed the same way) that
+        # hold neither a start nor a stop codon.
+        tables = self.__dict__.get("_dicodon_tables")
+        if tables is None:
+            amino_acid_pairs = {}
+            plain_pairs = set()
+            for first, first_aa in enumerate(self.amino_acids):
+                for second, second_aa in enumerate(self.amino_acids):
+                    key = bytes(((first >> 4) & 3, (first >> 2) & 3,
+                            first & 3, (second >> 4) & 3, (second >> 2) & 3,
+                            second & 3))
+                    if (first_aa is not None and second_aa is not None and
+                            first_aa != "*" and second_aa != "*"):
+                        amino_acid_pairs[key] = first_aa + second_aa
+                    if not (set((first, second)) & (self._start_indices |
+                            self._stop_indices)):
+                        plain_pairs.add(key)
+            tables = (amino_acid_pairs, frozenset(plain_pairs))
+            self._dicodon_tables = tables
+        return tables
+
+    def numpy_tables(self):
+        """Get the NumPy arrays used to translate with this code.
+
+        Returns a tuple `(base_index, amino_acids, is_stop, is_start)` of
+        arrays: `base_index` maps bytes to base indices like
+        `encoded_blocks`, and the others are indexed by codon number
+        (including the numbers of codons with invalid bases). Amino acids are
+        stored as bytes, with 0 for codons that have no amino acid.
+        """
+        tables = self.__dict__.get("_numpy_tables")
+        if tables is None:
+            size = _MAX_CODON_INDEX + 1
+            amino_acids = numpy.zeros(size, dtype = numpy.uint8)
+            for index, aa in enumerate(self.amino_acids):
+                if aa is not None:
+                    amino_acids[index] = ord(aa)
+            is_stop = numpy.zeros(size, dtype = bool)
+            is_stop[list(self._stop_indices)] = True
+            is_start = numpy.zeros(size, dtype = bool)
+            is_start[list(self._start_indices)] = True
+            tables = (
+                    numpy.frombuffer(_BASE_INDEX_TABLE, dtype = numpy.uint8),
+                    amino_acids,
+                    is_stop,
+                    is_start)
+            self._numpy_tables = tables
+        return tables
+
+    def __getstate__(self):
+        # Lookup tables are rebuilt on demand rather than pickled
+        state = self.__dict__.copy()
+        state.pop("_numpy_tables", None)
+        state.pop("_dicodon_tables", None)
+        return state
+
+    def invalid_codon(self, sequence, position):
+        """Raise a `KeyError` for the codon of `sequence` at `position`."""
+        codon = sequence[position: position + 3]
+        if not isinstance(codon, str):
+            codon = bytes(codon).decode("ascii", "replace")
+        raise KeyError(codon)
+
+
+def codon_index(codon):
+    """Get the number (0 to 63) of `codon` in a `GeneticCode`.
+
+    T is numbered like U, so DNA and RNA codons get the same number. Raises a
+    `KeyError` if `codon` is not three bases long.
+    """
+    if len(codon) != 3:
+        raise KeyError(codon)
+    index = 0
+    for base in codon.upper().replace("T", "U"):
+        base_index = BASES.find(base)
+        if base_index < 0:
+            raise KeyError(codon)
+        index = (index << 2) | base_index
+    return index
+
+def _rna_codon(codon):
+    return codon.upper().replace("T", "U")
+
+def all_codons():
+    """Get a list of the 64 codons, ordered by their number."""
+    return [b1 + b2 + b3 for b1 in BASES for b2 in BASES for b3 in BASES]
+
+@functools.lru_cache(maxsize = 64)
+def _compile_genetic_code_items(items):
+    return GeneticCode(dict(items))
+
+def compile_genetic_code(genetic_code):
+    """Get a `GeneticCode` for `genetic_code`.
+
+    `genetic_code` can be a `GeneticCode` (which is returned as is), a dict
+    mapping codons to amino acids, or an NCBI translation table ID. Dicts are
+    compiled once and cached, so passing the same dict over and over again
+    is cheap.
+    """
+    if isinstance(genetic_code, GeneticCode):
+        return genetic_code
+    if isinstance(genetic_code, int):
+        return _compile_ncbi_table(genetic_code)
+    return _compile_genetic_code_items(frozenset(genetic_code.items()))
+
+@functools.lru_cache(maxsize = None)
+def _compile_ncbi_table(table_id):
+    return GeneticCode.from_ncbi_table(table_id)
 
 def pop_next_codon(sequence):
+    """Split the first codon off of `sequence`.
+
+    Returns a tuple of the first three bases of `sequence` and the rest of
+    `sequence`. Because the rest is a copy, walking a whole sequence this way
+    takes quadratic time; use `iter_codons` instead.
+    """
 
     codon = sequence[0:3]
     remaining_seq = sequence[3:]
     return codon, remaining_seq
 
-def translate_sequence(rna_sequence, genetic_code):
+def translate_sequence(rna_sequence, genetic_code, normalize = True):
     """Translates a sequence of RNA into a sequence of amino acids.
 
     Translates `rna_sequence` into string of amino acids, according to the
-    `genetic_code` given as a dict. Translation begins at the first position of
-    the `rna_sequence` and continues until the first stop codon is encountered
-    or the end of `rna_sequence` is reached.
+    `genetic_code` given as a dict (or a `GeneticCode`). Translation begins
+    at the first position of the `rna_sequence` and continues until the
+    first stop codon is encountered or the end of `rna_sequence` is reached.
 
     If `rna_sequence` is less than 3 bases long, or starts with a stop codon,
     an empty string is returned.
+
+    Bases can be in either case, and T is read as U. A character that is
+    not a base or ambiguity code raises a `KeyError` once the block of bases
+    that holds it is encoded, so `rna_sequence` is never copied up front and
+    bases after the first stop codon are not looked at. `normalize` is kept
+    for compatibility: this is done either way. Results are cached while a
+    cache is enabled (see `enable_cache`).
     """
 
 #    if len(rna_sequence) < 3:
@@ -32,21 +685,83 @@ def translate_sequence(rna_sequence, genetic_code):
 #            else:
 #                return ''
 
-    rna_sequence = rna_sequence.upper()
+    code = compile_genetic_code(genetic_code)
+    cache = _cache
+    if cache is not None:
+        return cache.get_or_compute("translate", rna_sequence, code,
+                lambda: _translate_sequence(rna_sequence, code))
+    return _translate_sequence(rna_sequence, code)
+
+@_stage("translate")
+def _translate_sequence(rna_sequence, code):
+    # `translate_sequence` without the cache, for a compiled genetic code
+    if _use_numpy(rna_sequence):
+        peptide = _numpy_translate_sequence(rna_sequence, code)
+    else:
+        peptide = _translate_by_dicodon(rna_sequence, code)
+    if _stats is not None:
+        # Every amino acid, plus the stop codon if translation stopped early
+        _stats.codons_translated += len(peptide) + (
+                3 * len(peptide) + 3 <= len(rna_sequence))
+        _stats.bytes_copied += len(peptide)
+    return peptide
+
+def _translate_by_dicodon(rna_sequence, code):
+    # Translate two codons per step with `GeneticCode.dicodon_table`, falling
+    # back to one codon at a time around stop and invalid codons.
+    lookup = code._lookup
+    get_amino_acids = code.dicodon_table().get
     amino_acid_list = []
-    while True:
-        if len(rna_sequence) < 3:
-            break
-        codon, remaining_seq = pop_next_codon(rna_sequence)
-        rna_sequence = remaining_seq
-        aa = genetic_code[codon]
-        if aa == "*":
-            break
-        amino_acid_list.append(aa)
+    append = amino_acid_list.append
+    for position, block in code.encoded_blocks(rna_sequence):
+        end = len(block) - len(block) % 3
+        for offset in range(0, end, 6):
+            amino_acids = get_amino_acids(block[offset: offset + 6])
+            if amino_acids is not None:
+                append(amino_acids)
+                continue
+            for codon_offset in range(offset, min(offset + 6, end), 3):
+                aa = lookup[(block[codon_offset] << 4) |
+                        (block[codon_offset + 1] << 2) |
+                        block[codon_offset + 2]]
+                if aa is None:
+                    code.invalid_codon(rna_sequence, position + codon_offset)
+                if aa == "*":
+                    return "".join(amino_acid_list)
+                append(aa)
+    return "".join(amino_acid_list)
+
+def _translate_by_codon(rna_sequence, code):
+    # Translate one codon per step; kept to benchmark the dicodon path.
+    lookup = code._lookup
+    amino_acid_list = []
+    for position, block in code.encoded_blocks(rna_sequence):
+        for offset in range(0, len(block) - 2, 3):
+            aa = lookup[(block[offset] << 4) | (block[offset + 1] << 2) |
+                    block[offset + 2]]
+            if aa is None:
+                code.invalid_codon(rna_sequence, position + offset)
+            if aa == "*":
+                return "".join(amino_acid_list)
+            amino_acid_list.append(aa)
     return "".join(amino_acid_list)
-    
 
-def get_all_translations(rna_sequence, genetic_code):
+def iter_codons(sequence, frame = 0):
+    """Iterate over the codons of `sequence`.
+
+    Yields every complete codon of `sequence`, starting at index `frame` and
+    moving three bases at a time. Trailing bases that do not make a full
+    codon are skipped. Only the current codon is copied out of `sequence`, so
+    walking a sequence takes linear time and constant extra memory.
+
+    If `sequence` has fewer than `frame` + 3 bases, nothing is yielded.
+    """
+    for index in range(frame, len(sequence) - 2, 3):
+        yield sequence[index: index + 3]
+
+@_stage("all_translations")
+def get_all_translations(rna_sequence, genetic_code, processes = 1,
+        orf_index = None, normalize = True):
     """Get a list of all amino acid sequences encoded by an RNA sequence.
 
     All three reading frames of `rna_sequence` are scanned from 'left' to
@@ -60,22 +775,608 @@ def get_all_translations(rna_sequence, genetic_code):
 
     If no amino acids can be translated from `rna_sequence`, an empty list is
     returned.
+
+    With `processes` other than 1, `rna_sequence` is scanned in shards by a
+    pool of worker processes (see `scan_reading_frames_parallel`). With an
+    `orf_index` (an `OrfIndex`), the reading frames are loaded from it if
+    they were saved, and scanned and saved otherwise. `normalize` is as in
+    `translate_sequence`.
     """
-    rna_sequence = rna_sequence.upper()
-    number_of_bases = len(rna_sequence)
-    last_codon_index = number_of_bases - 3
-    if last_codon_index < 0:
-        return[]
-    amino_acid_seq_list = []
-    for base_index in range(last_codon_index + 1):
-        codon = rna_sequence[base_index: base_index + 3]
-        if codon == "AUG":
-            aa_seq = translate_sequence(
-                rna_sequence = rna_sequence[base_index:],
-                genetic_code = genetic_code)
-            if aa_seq:
-                amino_acid_seq_list.append(aa_seq)
-    return amino_acid_seq_list
+    if orf_index is not None:
+        orfs = orf_index.find_orfs(
+                rna_sequence = rna_sequence,
+                genetic_code = genetic_code,
+                strands = "+",
+                normalize = normalize)
+        return list(orfs.peptides())
+    if processes == 1:
+        orfs = find_orfs(
+                rna_sequence = rna_sequence,
+                genetic_code = genetic_code,
+                strands = "+",
+                normalize = normalize)
+        return list(orfs.peptides())
+    orfs = list(scan_reading_frames_parallel(
+            rna_sequence = rna_sequence,
+            genetic_code = genetic_code,
+            processes = processes))
+    orfs.sort(key = lambda orf: orf[0])
+    return [peptide for start, end, peptide in orfs]
+
+def scan_reading_frame(rna_sequence, frame, genetic_code, min_length = 1):
+    """Scan one reading frame of an RNA sequence for open reading frames.
+
+    Walks the codons of `rna_sequence` that begin at `frame`, `frame` + 3,
+    `frame` + 6, ... exactly once. Every start codon (just 'AUG', unless
+    `genetic_code` is a `GeneticCode` with other start codons) opens a reading
+    frame that stays open until the next in-frame stop codon (or the end of
+    `rna_sequence`). Nested start codons share the translation of the
+    outermost one, so no codon is translated more than once.
+
+    Yields a tuple `(start, end, peptide)` for every start codon that encodes
+    at least `min_length` amino acids, where `start` is the index of the start
+    codon and `end` is the index just past the last codon read (including the
+    stop codon, if one was found). Tuples are yielded in order of `end`.
+    Shorter peptides are never built, and the scan stops as soon as the rest
+    of the frame is too short to hold a peptide of `min_length` amino acids.
+    """
+    code = compile_genetic_code(genetic_code)
+    lookup = code._lookup
+    start_indices = code._start_indices
+    min_length = max(min_length, 1)
+    frame_end = frame + max(len(rna_sequence) - frame, 0) // 3 * 3
+    # Start codons after this cannot encode `min_length` amino acids
+    last_start = frame_end - 3 * min_length
+    amino_acid_list = []
+    # (start index, offset into amino_acid_list) of every open start codon
+    open_starts = []
+    for position, block in code.encoded_blocks(rna_sequence, frame):
+        if position > last_start and not open_starts:
+            return
+        for offset in range(0, len(block) - 2, 3):
+            index = ((block[offset] << 4) | (block[offset + 1] << 2) |
+                    block[offset + 2])
+            if index in start_indices and position + offset <= last_start:
+                open_starts.append((position + offset, len(amino_acid_list)))
+            if open_starts:
+                aa = lookup[index]
+                if aa is None:
+                    code.invalid_codon(rna_sequence, position + offset)
+                if aa == "*":
+                    for orf in _close_reading_frame(open_starts,
+                            amino_acid_list, position + offset + 3,
+                            min_length):
+                        yield orf
+                    open_starts = []
+                    amino_acid_list = []
+                else:
+                    amino_acid_list.append(aa)
+    if open_starts:
+        for orf in _close_reading_frame(open_starts, amino_acid_list,
+                frame_end, min_length):
+            yield orf
+
+def scan_reading_frames(rna_sequence, genetic_code, engine = None,
+        min_length = 1):
+    """Scan all three reading frames of an RNA sequence.
+
+    Yields the `(start, end, peptide)` tuples of `scan_reading_frame` for
+    frames 0, 1 and 2, frame by frame. `engine` picks how the frames are
+    scanned: "python" walks the codons with `scan_reading_frame`, and "numpy"
+    translates each frame with NumPy array operations. By default, NumPy is
+    used when it is installed and `rna_sequence` has at least
+    `NUMPY_THRESHOLD` bases. Both engines find the same reading frames.
+    """
+    return _scan_frames(rna_sequence, compile_genetic_code(genetic_code),
+            engine, (0, 1, 2), min_length)
+
+def _scan_frames(rna_sequence, code, engine, frames, min_length):
+    if engine is None:
+        engine = "numpy" if _use_numpy(rna_sequence) else "python"
+    if engine == "numpy":
+        if numpy is None:
+            raise ValueError("The numpy engine needs NumPy to be installed")
+        orfs = _numpy_scan_reading_frames(rna_sequence, code, frames,
+                min_length)
+    elif engine == "python":
+        orfs = (orf for frame in frames for orf in scan_reading_frame(
+                rna_sequence = rna_sequence,
+                frame = frame,
+                genetic_code = code,
+                min_length = min_length))
+    else:
+        raise ValueError("Unknown engine: {0!r}".format(engine))
+    for orf in orfs:
+        yield orf
+
+def _use_numpy(sequence):
+    return numpy is not None and len(sequence) >= NUMPY_THRESHOLD
+
+def _numpy_codon_indices(sequence, code, frame):
+    # Codon numbers of `sequence` read from `frame`, as an array.
+    base_index = code.numpy_tables()[0]
+    if isinstance(sequence, PackedSequence):
+        bases = numpy.frombuffer(sequence.base_indices(0, len(sequence)),
+                dtype = numpy.uint8)
+    else:
+        data = sequence
+        if isinstance(data, str):
+            data = data.encode("ascii", "replace")
+        if not isinstance(sequence, NormalizedSequence):
+            _check_bases(data, sequence)
+        bases = base_index[numpy.frombuffer(data, dtype = numpy.uint8)]
+    number_of_codons = max(len(bases) - frame, 0) // 3
+    codons = bases[frame: frame + 3 * number_of_codons].reshape(-1, 3)
+    codons = codons.astype(numpy.uint16)
+    return (codons[:, 0] << 4) | (codons[:, 1] << 2) | codons[:, 2]
+
+# Largest block of bases `_numpy_translate_sequence` encodes at a time
+_NUMPY_MAX_BLOCK_SIZE = 3 * (1 << 20)
+
+def _numpy_translate_sequence(rna_sequence, code):
+    # Translate in blocks up to the first stop codon. Blocks start small and
+    # double in size, so an early stop codon costs about as much as in the
+    # Python path, and a long peptide takes few blocks.
+    amino_acids, is_stop = code.numpy_tables()[1:3]
+    pieces = []
+    start = 0
+    block_size = _BLOCK_SIZE
+    while start + 3 <= len(rna_sequence):
+        end = min(start + block_size, len(rna_sequence))
+        indices = _numpy_codon_indices(rna_sequence[start: end], code, 0)
+        stops = numpy.flatnonzero(is_stop[indices])
+        stop = stops[0] if len(stops) else len(indices)
+        peptide = amino_acids[indices[:stop]]
+        invalid = numpy.flatnonzero(peptide == 0)
+        if len(invalid):
+            code.invalid_codon(rna_sequence, start + 3 * int(invalid[0]))
+        pieces.append(peptide.tobytes())
+        if len(stops):
+            break
+        start = end
+        block_size = min(2 * block_size, _NUMPY_MAX_BLOCK_SIZE)
+    return b"".join(pieces).decode("ascii")
+
+def _numpy_scan_reading_frames(rna_sequence, code, frames, min_length):
+    amino_acids, is_stop, is_start = code.numpy_tables()[1:]
+    min_length = max(min_length, 1)
+    for frame in frames:
+        indices = _numpy_codon_indices(rna_sequence, code, frame)
+        starts = numpy.flatnonzero(is_start[indices])
+        if not len(starts):
+            continue
+        number_of_codons = len(indices)
+        peptide_bytes = amino_acids[indices]
+        # Next stop at or after each start, or the end of the frame
+        stops = numpy.flatnonzero(is_stop[indices])
+        stops = numpy.append(stops, number_of_codons)
+        ends = stops[numpy.searchsorted(stops, starts)]
+        # Codons with no amino acid are only an error inside a reading frame
+        invalid = numpy.flatnonzero(peptide_bytes == 0)
+        if len(invalid):
+            invalid = numpy.append(invalid, number_of_codons)
+            next_invalid = invalid[numpy.searchsorted(invalid, starts)]
+            bad = numpy.flatnonzero(next_invalid < ends)
+            if len(bad):
+                code.invalid_codon(rna_sequence,
+                        frame + 3 * int(next_invalid[bad[0]]))
+        long_enough = numpy.flatnonzero(ends - starts >= min_length)
+        starts = starts[long_enough]
+        ends = ends[long_enough]
+        frame_peptide = peptide_bytes.tobytes().decode("ascii", "replace")
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if end > start:
+                yield (frame + 3 * start,
+                        frame + 3 * min(end + 1, number_of_codons),
+                        frame_peptide[start: end])
+
+class OrfTable:
+    """Open reading frames of a sequence, stored as coordinates.
+
+    Every reading frame is a row of five parallel arrays: `strands` (0 for
+    the sequence as given, 1 for its reverse complement), `frames`,
+    `starts`, `ends` and `lengths` (in amino acids, stop codon excluded).
+    Coordinates follow `Orf`: `start` and `end` are positions on `sequence`
+    whichever strand the reading frame is on, and `frame` is `start` % 3.
+
+    Peptides are not stored. Indexing a table gives an `OrfView`, which
+    translates its peptide when asked for it, and `peptides` translates
+    nested reading frames just once.
+    """
+
+    def __init__(self, sequence, genetic_code):
+        self.sequence = sequence
+        self.genetic_code = compile_genetic_code(genetic_code)
+        self.strands = array.array("b")
+        self.frames = array.array("b")
+        self.starts = array.array("q")
+        self.ends = array.array("q")
+        self.lengths = array.array("q")
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("OrfTable index out of range")
+        return OrfView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield OrfView(self, index)
+
+    def append(self, strand, start, end, length):
+        """Add a reading frame to the table."""
+        self.strands.append(strand)
+        self.frames.append(start % 3)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lengths.append(length)
+
+    def peptide(self, index):
+        """Translate the peptide of the reading frame at `index`."""
+        start = self.starts[index]
+        end = self.ends[index]
+        orf_sequence = self.sequence[start: end]
+        if _stats is not None:
+            _stats.bytes_copied += end - start
+        if self.strands[index]:
+            orf_sequence = reverse_and_complement(orf_sequence)
+        return _translate_sequence(orf_sequence, self.genetic_code)
+
+    def peptides(self):
+        """Iterate over the peptides of all reading frames, in order.
+
+        Reading frames that share a stop codon are suffixes of one another,
+        so only the longest one seen so far is translated and the others are
+        sliced from it.
+        """
+        # Per (strand, frame): the position of the stop codon end of the last
+        # reading frame translated, and its peptide
+        translated = {}
+        for index in range(len(self)):
+            strand = self.strands[index]
+            stop_side = self.starts[index] if strand else self.ends[index]
+            length = self.lengths[index]
+            key = (strand, self.frames[index])
+            last = translated.get(key)
+            if last is None or last[0] != stop_side or len(last[1]) < length:
+                last = (stop_side, self.peptide(index))
+                translated[key] = last
+            yield last[1][len(last[1]) - length:]
+
+class OrfView:
+    """One reading frame of an `OrfTable`.
+
+    Gives the table's columns for the reading frame as attributes; `peptide`
+    is translated each time it is read.
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def strand(self):
+        return "-" if self.table.strands[self.index] else "+"
+
+    @property
+    def frame(self):
+        return self.table.frames[self.index]
+
+    @property
+    def start(self):
+        return self.table.starts[self.index]
+
+    @property
+    def end(self):
+        return self.table.ends[self.index]
+
+    @property
+    def length(self):
+        return self.table.lengths[self.index]
+
+    @property
+    def peptide(self):
+        return self.table.peptide(self.index)
+
+    def as_orf(self, record = None):
+        """Get the reading frame as an `Orf`, peptide included."""
+        return Orf(record, self.strand, self.frame, self.start, self.end,
+                self.peptide)
+
+    def __repr__(self):
+        return "OrfView(strand={0!r}, frame={1}, start={2}, end={3}, " \
+                "length={4})".format(self.strand, self.frame, self.start,
+                        self.end, self.length)
+
+@_stage("scan")
+def find_orfs(rna_sequence, genetic_code, strands = "+-", min_length = 1,
+        engine = None, normalize = True):
+    """Find the open reading frames of an RNA sequence, without translating.
+
+    Scans the three reading frames of each strand in `strands` ('+' for
+    `rna_sequence` as given, '-' for its reverse complement) and returns an
+    `OrfTable` of every start codon that encodes at least `min_length` amino
+    acids. Rows are ordered by strand, then by the position of the start
+    codon along its strand. `engine` is as in `scan_reading_frames`.
+
+    Only start and stop codons are looked at, so codons that are not in
+    `genetic_code` do not raise a `KeyError` until a peptide that includes
+    them is translated, but codons with bases other than A, C, G and U raise
+    one as soon as they are found inside a reading frame. `normalize` is as
+    in `translate_sequence`.
+    """
+    code = compile_genetic_code(genetic_code)
+    table = OrfTable(rna_sequence, code)
+    length = len(rna_sequence)
+    if "+" in strands:
+        for start, end, orf_length in _scan_strand_coordinates(rna_sequence,
+                code, engine, min_length):
+            table.append(0, start, end, orf_length)
+    if "-" in strands:
+        for start, end, orf_length in _scan_strand_coordinates(
+                _reverse_strand(rna_sequence), code, engine, min_length):
+            table.append(1, length - end, length - start, orf_length)
+    return table
+
+def _atomic_write(path, write, mode = "wb"):
+    # Call `write` with a temporary file next to `path`, and move the file to
+    # `path` once it is on disk, so that readers never see a partial file.
+    # The temporary file is removed if anything fails.
+    handle, temporary_path = tempfile.mkstemp(
+            dir = os.path.dirname(os.path.abspath(path)), suffix = ".tmp")
+    try:
+        with os.fdopen(handle, mode) as temporary_file:
+            write(temporary_file)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+class OrfIndex:
+    """A directory of `find_orfs` results saved on disk.
+
+    Every result is a file named after a digest of the sequence (see
+    `sequence_digest`), the genetic code, the strands and `min_length`, so a
+    changed sequence or genetic code never loads stale reading frames. A file
+    holds a small header followed by the columns of the `OrfTable` as raw
+    little-endian arrays, and is loaded with a single read.
+
+    Files are written to a temporary file in `directory` and renamed into
+    place, so readers (in other threads or processes) see either the whole
+    file or none of it, and concurrent writers of the same result simply
+    replace each other's identical file.
+    """
+
+    MAGIC = b"ORFI"
+    VERSION = 1
+    # magic, version, sequence length, sequence digest, number of rows
+    _HEADER = struct.Struct("<4sHxxq16sq")
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+
+    def path(self, digest, genetic_code, strands = "+-", min_length = 1):
+        """Get the path of the file for a sequence with `digest`."""
+        key = hashlib.blake2b(digest, digest_size = 16)
+        key.update(_genetic_code_digest(compile_genetic_code(genetic_code)))
+        key.update("{0}:{1}".format("".join(sorted(strands)),
+                min_length).encode("ascii"))
+        return os.path.join(self.directory, key.hexdigest() + ".orfs")
+
+    def load(self, rna_sequence, genetic_code, strands = "+-",
+            min_length = 1, digest = None):
+        """Get the saved `OrfTable` of `rna_sequence`, or None if there is
+        none (or it does not match the sequence).
+        """
+        if digest is None:
+            digest = sequence_digest(rna_sequence)
+        path = self.path(digest, genetic_code, strands, min_length)
+        try:
+            with open(path, "rb") as index_file:
+                data = index_file.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < self._HEADER.size:
+            return None
+        magic, version, length, saved_digest, rows = \
+                self._HEADER.unpack_from(data)
+        if (magic != self.MAGIC or version != self.VERSION or
+                length != len(rna_sequence) or saved_digest != digest or
+                len(data) != self._HEADER.size + 26 * rows):
+            return None
+        table = OrfTable(rna_sequence, genetic_code)
+        offset = self._HEADER.size
+        for column in (table.strands, table.frames, table.starts,
+                table.ends, table.lengths):
+            end = offset + column.itemsize * rows
+            column.frombytes(data[offset: end])
+            if sys.byteorder == "big":
+                column.byteswap()
+            offset = end
+        return table
+
+    def save(self, table, strands = "+-", min_length = 1, digest = None):
+        """Save `table`, the result of `find_orfs` with `strands` and
+        `min_length`, and return the path of its file.
+        """
+        if digest is None:
+            digest = sequence_digest(table.sequence)
+        path = self.path(digest, table.genetic_code, strands, min_length)
+        def write(index_file):
+            index_file.write(self._HEADER.pack(self.MAGIC, self.VERSION,
+                    len(table.sequence), digest, len(table)))
+            for column in (table.strands, table.frames, table.starts,
+                    table.ends, table.lengths):
+                if sys.byteorder == "big":
+                    column = array.array(column.typecode, column)
+                    column.byteswap()
+                column.tofile(index_file)
+        _atomic_write(path, write)
+        return path
+
+    def find_orfs(self, rna_sequence, genetic_code, strands = "+-",
+            min_length = 1, engine = None, normalize = True):
+        """Like `find_orfs`, but load the result if it was saved, and save it
+        otherwise.
+        """
+        digest = sequence_digest(rna_sequence)
+        table = self.load(rna_sequence, genetic_code, strands, min_length,
+                digest)
+        if table is None:
+            table = find_orfs(rna_sequence, genetic_code, strands,
+                    min_length, engine, normalize)
+            self.save(table, strands, min_length, digest)
+        return table
+
+def _genetic_code_digest(code):
+    # The same genetic code gives the same digest in every process
+    text = "{0!r}{1!r}".format(code.amino_acids, sorted(code.start_codons))
+    return hashlib.blake2b(text.encode("ascii"), digest_size = 16).digest()
+
+def _reverse_strand(rna_sequence):
+    # The reverse complement of `rna_sequence` in a new bytearray (or a view,
+    # for a `PackedSequence`).
+    if isinstance(rna_sequence, PackedSequence):
+        return rna_sequence.reverse_complement()
+    if isinstance(rna_sequence, str):
+        reverse_strand = bytearray(rna_sequence, "ascii", "replace")
+    else:
+        reverse_strand = bytearray(rna_sequence)
+    if _stats is not None:
+        _stats.bytes_copied += len(reverse_strand)
+    if isinstance(rna_sequence, NormalizedSequence):
+        # Already checked
+        return _reverse_and_complement_blocks(reverse_strand,
+                _COMPLEMENT_TABLES["rna"][1])
+    return reverse_and_complement_in_place(reverse_strand)
+
+def _scan_strand_coordinates(rna_sequence, code, engine, min_length):
+    # (start, end, length) of the reading frames in all three frames of
+    # `rna_sequence`, ordered by start.
+    return heapq.merge(*[_scan_frame_coordinates(rna_sequence, frame, code,
+            engine, min_length) for frame in range(3)])
+
+def _scan_frame_coordinates(rna_sequence, frame, code, engine, min_length):
+    # (start, end, length) of the reading frames in one frame, ordered by
+    # start (and by end, since the reading frames of a frame only nest).
+    if engine is None:
+        engine = "numpy" if _use_numpy(rna_sequence) else "python"
+    if engine == "numpy":
+        if numpy is None:
+            raise ValueError("The numpy engine needs NumPy to be installed")
+        starts, ends, lengths = _numpy_frame_coordinates(rna_sequence, code,
+                frame, min_length)
+        return zip(starts.tolist(), ends.tolist(), lengths.tolist())
+    if engine != "python":
+        raise ValueError("Unknown engine: {0!r}".format(engine))
+    return _python_frame_coordinates(rna_sequence, frame, code, min_length)
+
+def _python_frame_coordinates(rna_sequence, frame, code, min_length):
+    start_indices = code._start_indices
+    stop_indices = code._stop_indices
+    min_length = max(min_length, 1)
+    frame_end = frame + max(len(rna_sequence) - frame, 0) // 3 * 3
+    last_start = frame_end - 3 * min_length
+    # Pairs of codons that hold neither a start nor a stop are skipped in one
+    # step.
+    plain_pairs = code._get_dicodon_tables()[1]
+    stats = _stats
+    open_starts = []
+    for position, block in code.encoded_blocks(rna_sequence, frame):
+        if position > last_start and not open_starts:
+            return
+        end = len(block) - len(block) % 3
+        if stats is not None:
+            stats.codons_scanned += end // 3
+        for pair_offset in range(0, end, 6):
+            if block[pair_offset: pair_offset + 6] in plain_pairs:
+                continue
+            for offset in range(pair_offset, min(pair_offset + 6, end), 3):
+                index = ((block[offset] << 4) | (block[offset + 1] << 2) |
+                        block[offset + 2])
+                if index > 63:
+                    # Bases other than A, C, G and U, inside a reading frame
+                    if open_starts:
+                        code.invalid_codon(rna_sequence, position + offset)
+                    continue
+                if (index in start_indices and
+                        position + offset <= last_start):
+                    open_starts.append(position + offset)
+                if open_starts and index in stop_indices:
+                    stop_end = position + offset + 3
+                    if stats is not None:
+                        stats.start_codons += len(open_starts)
+                    for start in open_starts:
+                        orf_length = (stop_end - start) // 3 - 1
+                        if orf_length >= min_length:
+                            if stats is not None:
+                                stats.orfs += 1
+                            yield start, stop_end, orf_length
+                    open_starts = []
+    if stats is not None:
+        stats.start_codons += len(open_starts)
+    for start in open_starts:
+        orf_length = (frame_end - start) // 3
+        if orf_length >= min_length:
+            if stats is not None:
+                stats.orfs += 1
+            yield start, frame_end, orf_length
+
+def _numpy_frame_coordinates(rna_sequence, code, frame, min_length):
+    # Arrays of the starts, ends and lengths of the reading frames in one
+    # frame.
+    is_stop, is_start = code.numpy_tables()[2:]
+    indices = _numpy_codon_indices(rna_sequence, code, frame)
+    number_of_codons = len(indices)
+    starts = numpy.flatnonzero(is_start[indices])
+    stops = numpy.append(numpy.flatnonzero(is_stop[indices]),
+            number_of_codons)
+    # Next stop at or after each start, or the end of the frame
+    stop_codons = stops[numpy.searchsorted(stops, starts)]
+    # Codons with bases other than A, C, G and U are an error inside a
+    # reading frame that could be long enough, as in the Python scanner
+    invalid = numpy.flatnonzero(indices > 63)
+    if len(invalid):
+        invalid = numpy.append(invalid, number_of_codons)
+        open_starts = numpy.flatnonzero(starts <= number_of_codons -
+                max(min_length, 1))
+        next_invalid = invalid[numpy.searchsorted(invalid,
+                starts[open_starts])]
+        bad = numpy.flatnonzero(next_invalid < stop_codons[open_starts])
+        if len(bad):
+            code.invalid_codon(rna_sequence,
+                    frame + 3 * int(next_invalid[bad[0]]))
+    lengths = stop_codons - starts
+    keep = numpy.flatnonzero(lengths >= max(min_length, 1))
+    if _stats is not None:
+        _stats.codons_scanned += number_of_codons
+        _stats.start_codons += len(starts)
+        _stats.orfs += len(keep)
+        # base indices, codon numbers and their flags
+        _stats.bytes_copied += 2 * len(rna_sequence) + 4 * number_of_codons
+    starts = starts[keep]
+    stop_codons = stop_codons[keep]
+    ends = numpy.minimum(stop_codons + 1, number_of_codons)
+    return frame + 3 * starts, frame + 3 * ends, lengths[keep]
+
+def _close_reading_frame(open_starts, amino_acid_list, end, min_length = 1):
+    # Nested reading frames are suffixes of the first one, so if it is too
+    # short, all of them are.
+    if len(amino_acid_list) - open_starts[0][1] < min_length:
+        return
+    peptide = "".join(amino_acid_list)
+    for start, offset in open_starts:
+        if len(peptide) - offset >= min_length:
+            yield start, end, peptide[offset:]
 
 def get_reverse(sequence):
     """Reverse orientation of `sequence`.
@@ -99,17 +1400,19 @@ def get_reverse(sequence):
 #        rev_seq = c + rev_seq
 #    return rev_seq
 
-    seq_list = list(sequence.upper())
-    seq_list.reverse()
-    rev_seq = "".join(seq_list)
-    return rev_seq
+    return sequence[::-1].upper()
 
-def get_complement(sequence):
+def get_complement(sequence, alphabet = "rna"):
     """Get the complement of `sequence`.
 
     Returns a string with the complementary sequence of `sequence`.
+    `sequence` can hold RNA or DNA bases and IUPAC ambiguity codes, in either
+    case. The complement is upper case and, by default, RNA (so both 'T' and
+    'U' pair with 'A', and 'A' pairs with 'U'); pass `alphabet` = "dna" to get
+    DNA instead. If `sequence` is `bytes` or a `bytearray`, so is the result.
 
-    If `sequence` is empty, an empty string is returned.
+    A `KeyError` is raised for characters that are not bases or ambiguity
+    codes. If `sequence` is empty, an empty string is returned.
     """
 
 #    sequence = sequence.upper()
@@ -130,23 +1433,15 @@ def get_complement(sequence):
 #        comp_seq += comp_bases[c]
 #    return comp_seq
 
-    rna_complement = {
-        'A': 'U',
-        'C': 'G',
-        'G': 'C',
-        'U': 'A',
-        }
-    complementary_seq_list = []
-    for character in sequence:
-        complementary_seq_list.append(rna_complement[character.upper()])
-    complementary_seq = "".join(complementary_seq_list)
-    return complementary_seq
+    return _translate_complement(sequence, alphabet)
 
-def reverse_and_complement(sequence):
+@_stage("reverse_complement")
+def reverse_and_complement(sequence, alphabet = "rna"):
     """Get the reversed and complemented form of `sequence`.
 
     Returns a string that is the reversed and complemented sequence
-    of `sequence`.
+    of `sequence`. Bases are complemented as in `get_complement`, in a single
+    table-driven pass.
 
     If `sequence` is empty, an empty string is returned.
     """
@@ -157,12 +1452,228 @@ def reverse_and_complement(sequence):
 #    return reverse_complement
 
 #    return get_reverse(get_complement(sequence))
-    
-    reverse_seq = get_reverse(sequence)
-    reverse_complement_seq = get_complement(reverse_seq)
-    return reverse_complement_seq
 
-def get_longest_peptide(rna_sequence, genetic_code):
+    if isinstance(sequence, PackedSequence):
+        return sequence.reverse_complement()
+    if _stats is not None:
+        _stats.bytes_copied += 2 * len(sequence)
+    return _translate_complement(sequence, alphabet)[::-1]
+
+def reverse_and_complement_in_place(buffer, alphabet = "rna"):
+    """Reverse and complement the bases in a `bytearray`, in place.
+
+    Works like `reverse_and_complement`, but overwrites `buffer` instead of
+    allocating a new sequence; only a small block of `buffer` is copied at a
+    time. `buffer` is left unchanged if it holds characters that are not
+    bases or ambiguity codes. Returns `buffer`.
+    """
+    str_table, bytes_table = _complement_tables(alphabet)
+    if buffer.translate(None, _NUCLEOTIDE_CODES):
+        _invalid_nucleotide(buffer, bytes_table)
+    return _reverse_and_complement_blocks(buffer, bytes_table)
+
+@_stage("reverse_complement")
+def _reverse_and_complement_blocks(buffer, bytes_table):
+    buffer.reverse()
+    if _stats is not None:
+        _stats.bytes_copied += len(buffer)
+    for start in range(0, len(buffer), _BLOCK_SIZE):
+        end = start + _BLOCK_SIZE
+        buffer[start: end] = buffer[start: end].translate(bytes_table)
+    return buffer
+
+def _complement_tables(alphabet):
+    try:
+        return _COMPLEMENT_TABLES[alphabet]
+    except KeyError:
+        raise ValueError("Unknown alphabet: {0!r}".format(alphabet))
+
+def _translate_complement(sequence, alphabet):
+    str_table, bytes_table = _complement_tables(alphabet)
+    if isinstance(sequence, str):
+        complement = sequence.translate(str_table)
+        if "\0" in complement or not complement.isascii():
+            _invalid_nucleotide(sequence, bytes_table)
+        return complement
+    complement = bytes(sequence).translate(bytes_table)
+    if b"\0" in complement:
+        _invalid_nucleotide(sequence, bytes_table)
+    if isinstance(sequence, bytearray):
+        return bytearray(complement)
+    return complement
+
+def _invalid_nucleotide(sequence, bytes_table):
+    for character in sequence:
+        code = character if isinstance(character, int) else ord(character)
+        if code > 127 or bytes_table[code] == 0:
+            if isinstance(character, int):
+                character = chr(character)
+            raise KeyError(character)
+
+# Maps bytes to base-4 digits for packing: A, C, G, U (or T) in either case
+# are '0' to '3', and everything else is '0' (and kept aside).
+_PACK_DIGIT_TABLE = bytearray(b"0" * 256)
+for _base_index, _base in enumerate(BASES):
+    _PACK_DIGIT_TABLE[ord(_base)] = ord("0") + _base_index
+    _PACK_DIGIT_TABLE[ord(_base.lower())] = ord("0") + _base_index
+_PACK_DIGIT_TABLE[ord("T")] = _PACK_DIGIT_TABLE[ord("t")] = ord("3")
+_PACK_DIGIT_TABLE = bytes(_PACK_DIGIT_TABLE)
+# Runs of characters that cannot be packed into 2 bits
+_UNPACKABLE_RUN = re.compile(b"[^ACGUTacgut]+")
+# The base indices of the four bases in each packed byte
+_UNPACK_TABLE = [bytes(((byte >> 6) & 3, (byte >> 4) & 3, (byte >> 2) & 3,
+        byte & 3)) for byte in range(256)]
+# Complements base indices, leaving invalid bases (64) alone
+_COMPLEMENT_INDEX_TABLE = bytes([3 - index if index < 4 else index
+        for index in range(256)])
+_BASE_TEXT_TABLE = bytes(ord(BASES[index]) if index < 4 else ord("N")
+        for index in range(256))
+
+class PackedSequence:
+    """An RNA sequence stored with 2 bits per base.
+
+    Bases are packed four to a byte in a `bytearray`, so a sequence takes a
+    quarter of the memory of a `str`. Characters other than A, C, G, U and T
+    (such as runs of N) are kept aside as runs of text. Bases come back upper
+    case, and T comes back as U.
+
+    Slicing (with a step of 1) and `reverse_complement` give views that
+    share the packed bases instead of copying them. All functions in this
+    module that translate or scan a sequence accept a `PackedSequence` and
+    read the packed bases directly.
+    """
+
+    def __init__(self, sequence = ""):
+        if isinstance(sequence, str):
+            sequence = sequence.encode("ascii", "replace")
+        data = bytearray()
+        for position in range(0, len(sequence), _BLOCK_SIZE):
+            digits = sequence[position: position + _BLOCK_SIZE].translate(
+                    _PACK_DIGIT_TABLE)
+            digits += b"0" * (-len(digits) % 4)
+            data += int(digits, 4).to_bytes(len(digits) // 4, "big")
+        self._data = data
+        self._run_starts = array.array("q")
+        self._run_texts = []
+        for match in _UNPACKABLE_RUN.finditer(sequence):
+            self._run_starts.append(match.start())
+            self._run_texts.append(match.group().decode("ascii",
+                    "replace").upper())
+        self._start = 0
+        self._stop = len(sequence)
+        self._reverse = False
+
+    def _view(self, start, stop, reverse):
+        view = PackedSequence.__new__(PackedSequence)
+        view._data = self._data
+        view._run_starts = self._run_starts
+        view._run_texts = self._run_texts
+        view._start = start
+        view._stop = stop
+        view._reverse = reverse
+        return view
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("PackedSequence slices need a step of 1")
+            stop = max(start, stop)
+            if self._reverse:
+                return self._view(self._stop - stop, self._stop - start, True)
+            return self._view(self._start + start, self._start + stop, False)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("PackedSequence index out of range")
+        return str(self[index: index + 1])
+
+    def reverse_complement(self):
+        """Get a view of the reverse complement of the sequence."""
+        return self._view(self._start, self._stop, not self._reverse)
+
+    def base_indices(self, start, stop):
+        """Get bases `start` to `stop` of the sequence as base indices.
+
+        Returns `bytes` with the index (see `BASES`) of each base, and 64 for
+        characters that are not bases, like `GeneticCode.encoded_blocks`.
+        """
+        start, stop, step = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        if self._reverse:
+            indices = self._forward_indices(self._stop - stop,
+                    self._stop - start)
+            return indices[::-1].translate(_COMPLEMENT_INDEX_TABLE)
+        return self._forward_indices(self._start + start, self._start + stop)
+
+    def _forward_indices(self, start, stop):
+        first_byte = start // 4
+        indices = b"".join(map(_UNPACK_TABLE.__getitem__,
+                self._data[first_byte: (stop + 3) // 4]))
+        indices = indices[start - 4 * first_byte: stop - 4 * first_byte]
+        runs = list(self._runs(start, stop))
+        if runs:
+            indices = bytearray(indices)
+            for run_start, run_text in runs:
+                run_stop = min(run_start + len(run_text), stop)
+                run_start = max(run_start, start)
+                indices[run_start - start: run_stop - start] = bytes(
+                        [_INVALID_BASE]) * (run_stop - run_start)
+            indices = bytes(indices)
+        return indices
+
+    def _runs(self, start, stop):
+        # The (start, text) of unpacked runs that overlap [start, stop)
+        index = max(bisect.bisect_right(self._run_starts, start) - 1, 0)
+        while index < len(self._run_starts):
+            run_start = self._run_starts[index]
+            if run_start >= stop:
+                break
+            run_text = self._run_texts[index]
+            if run_start + len(run_text) > start:
+                yield run_start, run_text
+            index += 1
+
+    def _forward_text(self, start, stop):
+        text = bytearray(self._forward_indices(start, stop).translate(
+                _BASE_TEXT_TABLE))
+        for run_start, run_text in self._runs(start, stop):
+            run_stop = min(run_start + len(run_text), stop)
+            text[max(run_start, start) - start: run_stop - start] = (
+                    run_text[max(start - run_start, 0):
+                            run_stop - run_start].encode("ascii"))
+        return text.decode("ascii")
+
+    def __str__(self):
+        text = self._forward_text(self._start, self._stop)
+        if self._reverse:
+            return reverse_and_complement(text)
+        return text
+
+    def __bytes__(self):
+        return str(self).encode("ascii")
+
+    def __eq__(self, other):
+        if isinstance(other, PackedSequence):
+            return len(self) == len(other) and str(self) == str(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        if len(self) > 40:
+            return "PackedSequence({0!r}...)".format(str(self[:37]))
+        return "PackedSequence({0!r})".format(str(self))
+
+    def __reduce__(self):
+        # Pickle only the bases of the view, not the whole buffer
+        return (PackedSequence, (str(self),))
+
+def get_longest_peptide(rna_sequence, genetic_code, processes = 1,
+        orf_index = None, normalize = True):
     """Get the longest peptide encoded by an RNA sequence.
 
     Explore six reading frames of `rna_sequence` (three reading frames of the
@@ -172,49 +1683,2303 @@ def get_longest_peptide(rna_sequence, genetic_code):
 
     If no amino acids can be translated from `rna_sequence` nor its reverse and
     complement, an empty list is returned.
+
+    With `processes` other than 1, each strand is scanned in shards by a pool
+    of worker processes (see `scan_reading_frames_parallel`). Results are
+    cached while a cache is enabled (see `enable_cache`), and reading frames
+    are saved in `orf_index` if one is given (see `get_longest_peptides`).
+    `normalize` is as in `translate_sequence`.
     """
-    peptides = get_all_translations(rna_sequence = rna_sequence, genetic_code = genetic_code)
-    rev_comp_seq = reverse_and_complement(rna_sequence)
-    rev_comp_peptides = get_all_translations(rna_sequence = rev_comp_seq, genetic_code = genetic_code)
-    peptides += rev_comp_peptides
+    cache = _cache
+    if cache is not None:
+        code = compile_genetic_code(genetic_code)
+        return cache.get_or_compute("longest_peptide", rna_sequence, code,
+                lambda: _get_longest_peptide(rna_sequence, code, processes,
+                        orf_index, normalize))
+    return _get_longest_peptide(rna_sequence, genetic_code, processes,
+            orf_index, normalize)
+
+def _get_longest_peptide(rna_sequence, genetic_code, processes, orf_index,
+        normalize):
+    peptides = get_longest_peptides(
+            rna_sequence = rna_sequence,
+            genetic_code = genetic_code,
+            top_k = 1,
+            processes = processes,
+            orf_index = orf_index,
+            normalize = normalize)
     if not peptides:
         return ""
-    if len(peptides) < 2:
-        return peptides[0]
-    most_number_of_bases = -1
-    longest_peptide_index = -1
-    for peptide_index, aa_seq in enumerate(peptides):
-        if len(aa_seq) > most_number_of_bases:
-            longest_peptide_index = peptide_index
-            most_number_of_bases = len(aa_seq)
-    return peptides[longest_peptide_index]
+    return peptides[0]
+
+@_stage("longest_peptides")
+def get_longest_peptides(rna_sequence, genetic_code, top_k = 10,
+        min_length = 1, processes = 1, orf_index = None, normalize = True):
+    """Get the longest peptides encoded by an RNA sequence.
+
+    Explores the six reading frames of `rna_sequence` like
+    `get_longest_peptide`, and returns a list of the `top_k` longest peptides
+    with at least `min_length` amino acids, longest first. Ties go to the
+    peptide whose start codon comes first, checking the given orientation
+    before the reverse complement.
+
+    Reading frames are found with their coordinates only (see `find_orfs`),
+    the best `top_k` found so far are kept in a heap, and only the winners are
+    translated. Once there are `top_k` of them, the ends of frames too short
+    to hold a better one are not scanned.
+
+    With an `orf_index` (an `OrfIndex`), all reading frames of at least
+    `min_length` amino acids are loaded from it if they were saved, and
+    scanned and saved otherwise, and the best are picked from them.
+    `normalize` is as in `translate_sequence`.
+    """
+    genetic_code = compile_genetic_code(genetic_code)
+    if orf_index is not None:
+        table = orf_index.find_orfs(rna_sequence, genetic_code,
+                min_length = min_length, normalize = normalize)
+        # Rows are in the order ties are broken in
+        lengths = table.lengths
+        best = heapq.nsmallest(top_k, range(len(table)),
+                key = lambda index: (-lengths[index], index))
+        return [table.peptide(index) for index in best]
+    strands = (rna_sequence, _reverse_strand(rna_sequence))
+    if processes != 1:
+        return _longest_peptides_in_shards(strands, genetic_code, top_k,
+                min_length, processes)
+    return [_translate_sequence(strands[-strand_index][-start: end],
+            genetic_code) for orf_length, strand_index, start, end in
+            _scan_longest_orfs(strands, genetic_code, top_k, min_length)]
+
+@_stage("scan")
+def _scan_longest_orfs(strands, genetic_code, top_k, min_length):
+    # The `top_k` longest reading frames of `strands`, longest first, as
+    # (length, -strand index, -start, end). Peptides are only translated for
+    # the winners, by the caller.
+    # Heap of the same tuples, so the root is the worst reading frame kept.
+    heap = []
+    for strand_index, sequence in enumerate(strands):
+        # Frames are scanned lazily, so each one starts with the bound left
+        # by the last
+        frames = (_scan_frame_coordinates(sequence, frame, genetic_code, None,
+                _min_length(heap, top_k, min_length)) for frame in range(3))
+        for orfs in frames:
+            for start, end, orf_length in orfs:
+                item = (orf_length, -strand_index, -start, end)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+    return sorted(heap, reverse = True)
+
+def _longest_peptides_in_shards(strands, genetic_code, top_k, min_length,
+        processes):
+    heap = []
+    for strand_index, sequence in enumerate(strands):
+        for start, end, peptide in _scan_shards(sequence, genetic_code,
+                processes, top_k = top_k):
+            if len(peptide) < min_length:
+                continue
+            item = (len(peptide), -strand_index, -start, peptide)
+            if len(heap) < top_k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    return [item[-1] for item in sorted(heap, reverse = True)]
+
+def _min_length(heap, top_k, min_length):
+    # Shortest peptide that can still make it into a full heap. Equal lengths
+    # can win ties, so they are kept.
+    if len(heap) < top_k:
+        return min_length
+    return max(min_length, heap[0][0])
+
+VariantEffect = collections.namedtuple("VariantEffect",
+        ["longest_peptide", "removed", "added"])
+
+class OrfModel:
+    """The reading frames of a sequence, ready for edits to be screened.
+
+    Finds the start and stop codons on both strands of `rna_sequence` once.
+    Then `edit` (or `substitute`, `insert` and `delete`) gives the
+    `VariantEffect` of an edit by looking only at the codons the edit changes
+    and the reading frames through them, so its cost depends on the length
+    of those reading frames rather than of the sequence. The model itself is
+    not changed: every edit is applied to `rna_sequence`.
+
+    A `VariantEffect` holds the `longest_peptide` of the edited sequence (as
+    `get_longest_peptide` would find it), the `Orf`s of `rna_sequence` that
+    the edit `removed`, and the `Orf`s of the edited sequence it `added`, in
+    the coordinates of the edited sequence. A reading frame whose peptide is
+    changed is both removed and added; the others are the same, moved by the
+    change in length if they are after the edit.
+
+    Only reading frames of at least `min_length` amino acids are counted,
+    and `normalize` is as in `translate_sequence`.
+    """
+
+    def __init__(self, rna_sequence, genetic_code, min_length = 1,
+            normalize = True):
+        rna_sequence = _normalized(rna_sequence, normalize)
+        if isinstance(rna_sequence, str):
+            sequence = rna_sequence
+        elif isinstance(rna_sequence, PackedSequence):
+            sequence = str(rna_sequence)
+        else:
+            sequence = bytes(rna_sequence).decode("ascii", "replace")
+        self.sequence = sequence
+        self.genetic_code = compile_genetic_code(genetic_code)
+        self.min_length = max(min_length, 1)
+        self.normalize = normalize
+        self._strands = (
+                _StrandOrfs(sequence, self.genetic_code, self.min_length),
+                _StrandOrfs(reverse_and_complement(sequence),
+                        self.genetic_code, self.min_length))
+
+    def __len__(self):
+        return len(self.sequence)
+
+    @property
+    def longest_peptide(self):
+        """The longest peptide of the unedited sequence."""
+        best = None
+        for strand_index, strand in enumerate(self._strands):
+            orf = strand.best_from(0)
+            if orf is not None:
+                key = (orf[0], -strand_index, -orf[1])
+                if best is None or key > best[0]:
+                    best = (key, strand, orf[1])
+        if best is None:
+            return ""
+        return best[1].peptide(best[2])
+
+    def substitute(self, position, bases):
+        """Get the effect of replacing the bases from `position` on with
+        `bases`."""
+        return self.edit(position, position + len(bases), bases)
+
+    def insert(self, position, bases):
+        """Get the effect of inserting `bases` before `position`."""
+        return self.edit(position, position, bases)
+
+    def delete(self, start, end):
+        """Get the effect of deleting the bases from `start` to `end`."""
+        return self.edit(start, end, "")
+
+    def edit(self, start, end, bases):
+        """Get the `VariantEffect` of replacing the bases from `start` to
+        `end` (0-based, end excluded) with `bases`.
+
+        Raises a `ValueError` if the region is not within the sequence, and a
+        `KeyError` if a changed reading frame has a codon missing from the
+        genetic code.
+        """
+        length = len(self.sequence)
+        if not 0 <= start <= end <= length:
+            raise ValueError("Cannot edit bases {0} to {1} of a sequence of "
+                    "{2} bases".format(start, end, length))
+        bases = _normalized(bases, self.normalize)
+        if not isinstance(bases, str):
+            bases = bytes(bases).decode("ascii", "replace")
+        delta = len(bases) - (end - start)
+        edits = ((start, end, bases),
+                (length - end, length - start, reverse_and_complement(bases)))
+        # ((length, -strand index, -start), strand, start) of an unchanged
+        # reading frame, or (key, None, peptide) of a new one
+        best = None
+        removed = []
+        added = []
+        for strand_index, strand in enumerate(self._strands):
+            edit_start, edit_end, edit_bases = edits[strand_index]
+            removed.extend(_forward_orfs(strand_index, length,
+                    strand.affected(edit_start, edit_end)))
+            new_orfs = strand.edited(edit_start, edit_end, edit_bases)
+            added.extend(_forward_orfs(strand_index, length + delta,
+                    new_orfs))
+            for orf_start, orf_end, orf_length, peptide in new_orfs:
+                key = (orf_length, -strand_index, -orf_start)
+                if best is None or key > best[0]:
+                    best = (key, None, peptide)
+            for orf, shift in ((strand.best_before(edit_start), 0),
+                    (strand.best_from(edit_end), delta)):
+                if orf is not None:
+                    key = (orf[0], -strand_index, -(orf[1] + shift))
+                    if best is None or key > best[0]:
+                        best = (key, strand, orf[1])
+        if best is None:
+            longest_peptide = ""
+        elif best[1] is None:
+            longest_peptide = best[2]
+        else:
+            longest_peptide = best[1].peptide(best[2])
+        # Reading frames that only moved are not changes
+        moved = [_moved_orf(orf, start, end, delta) for orf in removed]
+        kept = set(moved).intersection(added)
+        return VariantEffect(longest_peptide,
+                [orf for orf, moved_orf in zip(removed, moved) if
+                        moved_orf not in kept],
+                [orf for orf in added if orf not in kept])
+
+def _forward_orfs(strand_index, length, orfs):
+    # `Orf`s from (start, end, length, peptide) on strand `strand_index` of
+    # a sequence of `length` bases
+    for orf_start, orf_end, orf_length, peptide in orfs:
+        if strand_index:
+            orf_start, orf_end = length - orf_end, length - orf_start
+        yield Orf(None, "-" if strand_index else "+", orf_start % 3,
+                orf_start, orf_end, peptide)
+
+def _moved_orf(orf, start, end, delta):
+    # Where `orf` is after replacing `start` to `end` with `delta` more
+    # bases, or None if it overlaps the bases replaced
+    if orf.start < start:
+        orf_start = orf.start
+    elif orf.start >= end:
+        orf_start = orf.start + delta
+    else:
+        return None
+    if orf.end <= start:
+        orf_end = orf.end
+    elif orf.end > end:
+        orf_end = orf.end + delta
+    else:
+        return None
+    return orf._replace(frame = orf_start % 3, start = orf_start,
+            end = orf_end)
+
+class _StrandOrfs:
+    # Start and stop codons and reading frames of one strand of an
+    # `OrfModel`. Positions and reading frames are on the strand.
+
+    def __init__(self, sequence, code, min_length):
+        self.sequence = sequence
+        self.code = code
+        self.min_length = min_length
+        self.start_codons = frozenset(codon.upper() for codon in
+                code.start_codons)
+        self.stop_codons = frozenset(codon.upper() for codon in
+                code.stop_codons)
+        # Positions of the start and stop codons, by position % 3
+        self.starts = ([], [], [])
+        self.stops = ([], [], [])
+        for codons, positions in ((self.start_codons, self.starts),
+                (self.stop_codons, self.stops)):
+            for position in _codon_positions(sequence, codons):
+                positions[position % 3].append(position)
+        # (start, end, length) of every reading frame
+        orfs = []
+        for frame in range(3):
+            for start in self.starts[frame]:
+                end, stopped = self._orf_end(frame, start)
+                orf_length = (end - start) // 3 - stopped
+                if orf_length >= min_length:
+                    orfs.append((start, end, orf_length, stopped))
+        # Best (length, -start) of the reading frames that end with a stop
+        # codon by each end, and of all reading frames from each start
+        ends = sorted((end, orf_length, -start) for start, end, orf_length,
+                stopped in orfs if stopped)
+        self._ends = [end for end, orf_length, start in ends]
+        self._best_before = list(itertools.accumulate(
+                ((orf_length, start) for end, orf_length, start in ends),
+                max))
+        orfs.sort()
+        self._starts = [start for start, end, orf_length, stopped in orfs]
+        self._best_from = list(itertools.accumulate(
+                ((orf_length, -start) for start, end, orf_length, stopped in
+                        reversed(orfs)), max))[::-1]
+        self._peptides = {}
+
+    def frame_end(self, frame, length):
+        return frame + max(length - frame, 0) // 3 * 3
+
+    def _orf_end(self, frame, start):
+        # (end, whether it ends with a stop codon) of the reading frame from
+        # `start`
+        stops = self.stops[frame]
+        index = bisect.bisect_left(stops, start)
+        if index < len(stops):
+            return stops[index] + 3, 1
+        return self.frame_end(frame, len(self.sequence)), 0
+
+    def best_before(self, position):
+        # (length, start) of the best reading frame that ends with a stop
+        # codon before `position`, or None
+        index = bisect.bisect_right(self._ends, position)
+        if not index:
+            return None
+        orf_length, start = self._best_before[index - 1]
+        return orf_length, -start
+
+    def best_from(self, position):
+        # (length, start) of the best reading frame from `position` on, or
+        # None
+        index = bisect.bisect_left(self._starts, position)
+        if index == len(self._starts):
+            return None
+        orf_length, start = self._best_from[index]
+        return orf_length, -start
+
+    def peptide(self, start):
+        # Peptide of the reading frame from `start`
+        peptide = self._peptides.get(start)
+        if peptide is None:
+            end = self._orf_end(start % 3, start)[0]
+            peptide = _translate_sequence(self.sequence[start: end],
+                    self.code)
+            self._peptides[start] = peptide
+        return peptide
+
+    def _open_starts(self, frame, position):
+        # Start codons in `frame` before `position` with no stop codon
+        # between them and `position`
+        starts = self.starts[frame]
+        stops = self.stops[frame]
+        index = bisect.bisect_left(stops, position)
+        first = 0
+        if index:
+            first = bisect.bisect_right(starts, stops[index - 1])
+        return starts[first: bisect.bisect_left(starts, position)]
+
+    def affected(self, start, end):
+        # Reading frames as (start, end, length, peptide) that replacing
+        # `start` to `end` changes: the ones through a changed codon
+        orfs = []
+        for frame in range(3):
+            # Codons from `start` - 2 to `end` overlap the edit
+            starts = self.starts[frame]
+            changed_starts = starts[bisect.bisect_left(starts, start - 2):
+                    bisect.bisect_left(starts, end)]
+            for orf_start in (self._open_starts(frame, start - 2) +
+                    changed_starts):
+                orf_end, stopped = self._orf_end(frame, orf_start)
+                orf_length = (orf_end - orf_start) // 3 - stopped
+                if orf_length >= self.min_length:
+                    orfs.append((orf_start, orf_end, orf_length))
+        return self._with_peptides(orfs, lambda orf_start, orf_end:
+                self.sequence[orf_start: orf_end])
+
+    def edited(self, start, end, bases):
+        # Reading frames as (start, end, length, peptide) of the edited
+        # strand that go through a changed codon
+        delta = len(bases) - (end - start)
+        new_length = len(self.sequence) + delta
+        bases_end = start + len(bases)
+        window_start = max(start - 2, 0)
+        window = (self.sequence[window_start: start] + bases +
+                self.sequence[end: end + 2]).upper()
+        orfs = []
+        for frame in range(3):
+            open_starts = self._open_starts(frame, start - 2)
+            position = window_start + (frame - window_start) % 3
+            while position < bases_end and position + 3 <= new_length:
+                codon = window[position - window_start:
+                        position - window_start + 3]
+                if codon in self.start_codons:
+                    open_starts.append(position)
+                if open_starts and codon in self.stop_codons:
+                    orfs.extend(self._closed(open_starts, position + 3, 1))
+                    open_starts = []
+                position += 3
+            if not open_starts:
+                continue
+            # Codons after the edit are the same, in another frame if the
+            # length changed
+            stops = self.stops[(frame - delta) % 3]
+            index = bisect.bisect_left(stops, end)
+            if index < len(stops):
+                orfs.extend(self._closed(open_starts,
+                        stops[index] + 3 + delta, 1))
+            else:
+                orfs.extend(self._closed(open_starts,
+                        self.frame_end(frame, new_length), 0))
+        return self._with_peptides(orfs, lambda orf_start, orf_end:
+                self._edited_bases(start, end, bases, orf_start, orf_end))
+
+    def _closed(self, open_starts, end, stopped):
+        for start in open_starts:
+            orf_length = (end - start) // 3 - stopped
+            if orf_length >= self.min_length:
+                yield start, end, orf_length
+
+    def _edited_bases(self, start, end, bases, from_position, to_position):
+        # Bases `from_position` to `to_position` of the edited strand
+        delta = len(bases) - (end - start)
+        bases_end = start + len(bases)
+        parts = []
+        if from_position < start:
+            parts.append(self.sequence[from_position: min(to_position,
+                    start)])
+        if from_position < bases_end and to_position > start:
+            parts.append(bases[max(from_position - start, 0):
+                    to_position - start])
+        if to_position > bases_end:
+            parts.append(self.sequence[max(from_position, bases_end) -
+                    delta: to_position - delta])
+        return "".join(parts)
+
+    def _with_peptides(self, orfs, get_bases):
+        # Reading frames that end together share a peptide, so only the
+        # longest is translated
+        result = []
+        peptide = None
+        for orf_start, orf_end, orf_length in sorted(orfs,
+                key = lambda orf: (orf[1], orf[0])):
+            if peptide is None or peptide[0] != orf_end:
+                peptide = (orf_end, _translate_sequence(
+                        get_bases(orf_start, orf_end), self.code))
+            result.append((orf_start, orf_end, orf_length,
+                    peptide[1][len(peptide[1]) - orf_length:]))
+        return result
+
+def _codon_positions(sequence, codons):
+    # Positions of every (possibly overlapping) occurrence of `codons`
+    if not codons:
+        return []
+    pattern = re.compile("(?=(?:{0}))".format("|".join(
+            re.escape(codon) for codon in sorted(codons))), re.IGNORECASE)
+    return [match.start() for match in pattern.finditer(sequence)]
+
+# Number of sequences sent to a worker process at a time.
+DEFAULT_BATCH_SIZE = 256
+
+# The genetic code of a worker process started by `_map_in_pool` (or a
+# `TranslationServer`). Only ever set in worker processes: work done in the
+# calling process is given its genetic code explicitly, so that generators
+# with different genetic codes can run side by side.
+_worker_genetic_code = None
+
+def _init_worker(genetic_code):
+    global _worker_genetic_code
+    _worker_genetic_code = genetic_code
+
+def _in_worker(worker_function, argument):
+    # Run `worker_function(code, argument)` with the code of this worker
+    return worker_function(_worker_genetic_code, argument)
+
+def _worker_translate_sequence(code, rna_sequence):
+    return translate_sequence(rna_sequence, code)
+
+def _worker_get_longest_peptide(code, rna_sequence):
+    return get_longest_peptide(rna_sequence, code)
+
+def _map_in_pool(worker_function, sequences, genetic_code, processes,
+        batch_size):
+    # Yields `worker_function(code, sequence)` for each of `sequences`
+    code = compile_genetic_code(genetic_code)
+    if processes == 1:
+        for sequence in sequences:
+            yield worker_function(code, sequence)
+        return
+    # The genetic code is sent to each worker once, when it starts.
+    with multiprocessing.Pool(processes,
+            initializer = _init_worker,
+            initargs = (code,)) as pool:
+        for result in pool.imap(functools.partial(_in_worker,
+                        worker_function),
+                (_picklable(sequence) for sequence in sequences),
+                batch_size):
+            yield result
+
+def _picklable(sequence):
+    # Memory views (of mapped files, say) are copied to be sent to workers
+    if isinstance(sequence, memoryview):
+        return sequence.tobytes()
+    return sequence
+
+def iter_translate_many(sequences, genetic_code, processes = None,
+        batch_size = DEFAULT_BATCH_SIZE):
+    """Translate many RNA sequences in parallel.
+
+    Runs `translate_sequence` on every sequence in the iterable `sequences`
+    in a pool of `processes` worker processes (by default, one per CPU), and
+    yields the amino acid sequences in the same order as `sequences`.
+    Sequences are sent to the workers `batch_size` at a time, and results
+    are yielded as soon as they are ready, so `sequences` can be a lazy
+    iterable. With `processes` = 1, no worker processes are started.
+    """
+    return _map_in_pool(_worker_translate_sequence, sequences, genetic_code,
+            processes, batch_size)
+
+def translate_many(sequences, genetic_code, processes = None,
+        batch_size = DEFAULT_BATCH_SIZE):
+    """Get a list of the translations of many RNA sequences.
+
+    Same as `iter_translate_many`, but returns a list.
+    """
+    return list(iter_translate_many(sequences, genetic_code,
+            processes = processes,
+            batch_size = batch_size))
+
+def iter_longest_peptides_many(sequences, genetic_code, processes = None,
+        batch_size = DEFAULT_BATCH_SIZE):
+    """Get the longest peptides of many RNA sequences in parallel.
+
+    Runs `get_longest_peptide` on every sequence in the iterable `sequences`
+    and yields the results in order, in the same way as
+    `iter_translate_many`.
+    """
+    return _map_in_pool(_worker_get_longest_peptide, sequences, genetic_code,
+            processes, batch_size)
+
+def longest_peptides_many(sequences, genetic_code, processes = None,
+        batch_size = DEFAULT_BATCH_SIZE):
+    """Get a list of the longest peptides of many RNA sequences.
+
+    Same as `iter_longest_peptides_many`, but returns a list.
+    """
+    return list(iter_longest_peptides_many(sequences, genetic_code,
+            processes = processes,
+            batch_size = batch_size))
+
+
+# Largest number of bases scanned by a worker process at a time.
+DEFAULT_SHARD_SIZE = 1 << 22
+
+def scan_reading_frames_parallel(rna_sequence, genetic_code, processes = None,
+        shard_size = None):
+    """Scan all three reading frames of an RNA sequence in parallel.
+
+    Splits `rna_sequence` into shards of at most `shard_size` bases (by
+    default, enough shards to keep every process busy, each at most
+    `DEFAULT_SHARD_SIZE` bases) and scans them with `scan_reading_frames` in
+    a pool of `processes` worker processes (one per CPU by default).
+    Reading frames that run past the end of a shard are carried over and
+    finished with the start of the next shards, so the same `(start, end,
+    peptide)` tuples are yielded as by `scan_reading_frames`, though not in
+    the same order.
+    """
+    return _scan_shards(rna_sequence, genetic_code, processes,
+            shard_size = shard_size)
+
+def _scan_shards(rna_sequence, genetic_code, processes, shard_size = None,
+        top_k = None):
+    # With `top_k`, workers only send back the `top_k` longest reading frames
+    # they finish, which is all `get_longest_peptides` needs.
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    length = len(rna_sequence)
+    if shard_size is None:
+        shard_size = min(DEFAULT_SHARD_SIZE,
+                max(length // (4 * processes), _BLOCK_SIZE))
+    shard_size = max(shard_size, 1)
+    # Each shard holds the codons that start in [start, start + shard_size).
+    tasks = ((_picklable(rna_sequence[start: start + shard_size + 2]),
+            start, top_k) for start in range(0, length, shard_size))
+    # Per frame: open starts as (position, offset into the peptide), and the
+    # pieces of the peptide of the first open start.
+    carried = [([], []) for frame in range(3)]
+    for closed, open_frames, prefixes in _map_in_pool(_worker_scan_shard,
+            tasks, genetic_code, processes, 1):
+        for orf in closed:
+            yield orf
+        for frame in range(3):
+            open_starts, pieces = carried[frame]
+            prefix, stop_end, invalid_codon = prefixes[frame]
+            if open_starts:
+                if invalid_codon is not None:
+                    raise KeyError(invalid_codon)
+                if stop_end is None:
+                    # No stop in the whole shard, so the shard's own open
+                    # reading frames end with the carried ones.
+                    pieces.append(prefix)
+                    carried_length = sum(len(piece) for piece in pieces)
+                    starts, tail = open_frames[frame]
+                    for start, offset in starts:
+                        open_starts.append(
+                                (start, carried_length - len(tail) + offset))
+                    continue
+                peptide = "".join(pieces) + prefix
+                for orf in _close_carried(open_starts, peptide, stop_end,
+                        top_k):
+                    yield orf
+            starts, tail = open_frames[frame]
+            carried[frame] = (list(starts), [tail])
+    for frame, (open_starts, pieces) in enumerate(carried):
+        if open_starts:
+            end = frame + max(length - frame, 0) // 3 * 3
+            for orf in _close_carried(open_starts, "".join(pieces), end,
+                    top_k):
+                yield orf
+
+def _close_carried(open_starts, peptide, end, top_k):
+    orfs = [(start, end, peptide[offset:]) for start, offset in open_starts
+            if offset < len(peptide)]
+    if top_k is not None:
+        orfs = _longest_orfs(orfs, top_k)
+    return orfs
+
+def _longest_orfs(orfs, top_k):
+    # The `top_k` longest of `orfs`, the first to start winning ties.
+    return heapq.nsmallest(top_k, orfs, key = lambda orf: (-len(orf[2]),
+            orf[0]))
+
+def _worker_scan_shard(code, task):
+    shard, offset, top_k = task
+    closed = []
+    open_frames = [([], "") for frame in range(3)]
+    for start, end, peptide in scan_reading_frames(shard, code):
+        frame = (offset + start) % 3
+        if end - start == 3 * len(peptide):
+            # Ran into the end of the shard without a stop codon
+            starts, tail = open_frames[frame]
+            if not tail:
+                tail = peptide
+            starts.append((offset + start, len(tail) - len(peptide)))
+            open_frames[frame] = (starts, tail)
+        else:
+            closed.append((offset + start, offset + end, peptide))
+    if top_k is not None:
+        closed = _longest_orfs(closed, top_k)
+    prefixes = [None] * 3
+    for local_frame in range(3):
+        frame = (offset + local_frame) % 3
+        prefix, stop_end, invalid_codon = _translate_to_stop(shard,
+                local_frame, code)
+        if stop_end is not None:
+            stop_end += offset
+        prefixes[frame] = (prefix, stop_end, invalid_codon)
+    return closed, open_frames, prefixes
+
+def _translate_to_stop(sequence, frame, code):
+    # Translate `sequence` from `frame` up to the first stop codon. Returns
+    # the peptide, the end of the stop codon (None if there is none), and the
+    # first invalid codon before the stop (None if there is none).
+    lookup = code._lookup
+    amino_acid_list = []
+    for position, block in code.encoded_blocks(sequence, frame):
+        for offset in range(0, len(block) - 2, 3):
+            aa = lookup[(block[offset] << 4) | (block[offset + 1] << 2) |
+                    block[offset + 2]]
+            if aa == "*":
+                return ("".join(amino_acid_list), position + offset + 3,
+                        None)
+            if aa is None:
+                codon = sequence[position + offset: position + offset + 3]
+                if not isinstance(codon, str):
+                    codon = bytes(codon).decode("ascii", "replace")
+                return "".join(amino_acid_list), None, codon
+            amino_acid_list.append(aa)
+    return "".join(amino_acid_list), None, None
+
+
+# An open reading frame found by `ChunkedOrfScanner`. `record` is the name of
+# the sequence it was found in, and `strand` is '+' or '-'. `start` and `end`
+# are 0-based, end-exclusive positions of the reading frame (stop codon
+# included) on the sequence as given, whichever strand it is on, and `frame`
+# is `start` % 3.
+Orf = collections.namedtuple("Orf",
+        ["record", "strand", "frame", "start", "end", "peptide"])
+
+class ChunkedOrfScanner:
+    """Find the open reading frames of a sequence that arrives in chunks.
+
+    Feed the sequence to `feed` one chunk at a time and call `finish` after
+    the last one. Both return lists of the `Orf`s that were completed, on
+    both strands. Only the last few bases of the previous chunk and the
+    codons of reading frames that are still open are kept between chunks, so
+    memory does not grow with the length of the sequence.
+
+    Reading frames on the reverse strand are found without building the
+    reverse complement: they are read right to left, so each one is complete
+    as soon as its start codon arrives.
+
+    A codon with bases other than A, C, G and U (such as N) cannot be
+    translated, so it ends the reading frames through it on both strands, as
+    the ends of the sequence do.
+    """
+
+    def __init__(self, genetic_code, record = None):
+        self.code = compile_genetic_code(genetic_code)
+        self.record = record
+        self._buffer = ""
+        # Position of `_buffer` in the sequence
+        self._offset = 0
+        # Position of the next codon of each frame
+        self._next_codon = [0, 1, 2]
+        # Per frame: open starts as (position, offset into amino acids), and
+        # the amino acids read since the first open start
+        self._forward = [([], []) for frame in range(3)]
+        # Per frame: where the reverse reading frames start (the position of
+        # the last stop codon or after the last ambiguous codon, or None), the
+        # amino acids read since then, and the first invalid codon among them
+        self._reverse = [[None, [], None] for frame in range(3)]
+
+    @_stage("scan")
+    def feed(self, chunk):
+        """Scan the next `chunk` of the sequence."""
+        orfs = []
+        buffer = self._buffer + chunk
+        encoded = buffer.encode("ascii", "replace").translate(
+                _BASE_INDEX_TABLE)
+        for frame in range(3):
+            self._scan_frame(frame, buffer, encoded, orfs)
+        keep = min(self._next_codon) - self._offset
+        self._buffer = buffer[keep:]
+        self._offset += keep
+        if _stats is not None:
+            # the joined buffer, its encoding and its translation
+            _stats.bytes_copied += 3 * len(buffer)
+            _stats.orfs += len(orfs)
+        return orfs
+
+    @_stage("scan")
+    def finish(self):
+        """Close the reading frames still open at the end of the sequence."""
+        orfs = []
+        for frame, (open_starts, amino_acid_list) in enumerate(self._forward):
+            end = self._next_codon[frame]
+            peptide = "".join(amino_acid_list)
+            for start, offset in open_starts:
+                if offset < len(peptide):
+                    orfs.append(Orf(self.record, "+", frame, start, end,
+                            peptide[offset:]))
+        self.__init__(self.code, self.record)
+        if _stats is not None:
+            _stats.orfs += len(orfs)
+        return orfs
+
+    def _scan_frame(self, frame, buffer, encoded, orfs):
+        code = self.code
+        lookup = code._lookup
+        start_indices = code._start_indices
+        reverse_codon = _REVERSE_COMPLEMENT_CODON
+        record = self.record
+        offset = self._offset
+        open_starts, amino_acid_list = self._forward[frame]
+        reverse_state = self._reverse[frame]
+        last_stop, reverse_aa_list, reverse_invalid = reverse_state
+        first = self._next_codon[frame] - offset
+        last = first
+        start_codons = 0
+        for index in range(first, len(encoded) - 2, 3):
+            codon = ((encoded[index] << 4) | (encoded[index + 1] << 2) |
+                    encoded[index + 2])
+            position = offset + index
+            if codon >= 64:
+                # Ambiguous bases: close the forward reading frames before
+                # this codon, and start the reverse ones after it
+                if open_starts:
+                    peptide = "".join(amino_acid_list)
+                    for start, aa_offset in open_starts:
+                        if aa_offset < len(peptide):
+                            orfs.append(Orf(record, "+", frame, start,
+                                    position, peptide[aa_offset:]))
+                    del open_starts[:]
+                    del amino_acid_list[:]
+                last_stop = position + 3
+                reverse_aa_list = []
+                reverse_invalid = None
+                last = index + 3
+                continue
+            if codon in start_indices:
+                open_starts.append((position, len(amino_acid_list)))
+                start_codons += 1
+            if open_starts:
+                aa = lookup[codon]
+                if aa is None:
+                    code.invalid_codon(buffer, index)
+                if aa == "*":
+                    peptide = "".join(amino_acid_list)
+                    for start, aa_offset in open_starts:
+                        if aa_offset < len(peptide):
+                            orfs.append(Orf(record, "+", frame, start,
+                                    position + 3, peptide[aa_offset:]))
+                    del open_starts[:]
+                    del amino_acid_list[:]
+                else:
+                    amino_acid_list.append(aa)
+            reverse_index = reverse_codon[codon]
+            aa = lookup[reverse_index]
+            if aa == "*":
+                last_stop = position
+                reverse_aa_list = []
+                reverse_invalid = None
+            else:
+                reverse_aa_list.append(aa)
+                if aa is None and reverse_invalid is None:
+                    reverse_invalid = buffer[index: index + 3]
+                if reverse_index in start_indices:
+                    start_codons += 1
+                    if reverse_invalid is not None:
+                        raise KeyError(reverse_invalid)
+                    orfs.append(Orf(record, "-", frame,
+                            frame if last_stop is None else last_stop,
+                            position + 3,
+                            "".join(reversed(reverse_aa_list))))
+            last = index + 3
+        reverse_state[:] = [last_stop, reverse_aa_list, reverse_invalid]
+        self._next_codon[frame] = offset + last
+        if _stats is not None:
+            # Each codon is read once for each strand, as by `find_orfs`
+            _stats.codons_scanned += 2 * (last - first) // 3
+            _stats.start_codons += start_codons
+
+def open_sequence_file(source):
+    """Open a sequence file for reading bytes.
+
+    `source` can be a path, '-' for standard input, or a file object opened
+    for reading. Gzip-compressed input is detected and decompressed on the
+    fly.
+    """
+    if source == "-":
+        handle = sys.stdin.buffer
+    elif isinstance(source, str):
+        handle = open(source, "rb")
+    else:
+        handle = source
+    peek = getattr(handle, "peek", None)
+    if peek is not None and peek(2)[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj = handle, mode = "rb")
+    return handle
+
+def iter_fasta_chunks(source, chunk_size = DEFAULT_CHUNK_SIZE,
+        normalize = False):
+    """Read FASTA formatted sequences a chunk at a time.
+
+    Reads `source` (anything `open_sequence_file` accepts) `chunk_size` bytes
+    at a time, and yields tuples `(name, chunk)`. Every record starts with a
+    tuple whose `chunk` is `None`, followed by the record's sequence in
+    chunks with whitespace removed. With `normalize`, chunks are also
+    normalized like `normalize_sequence` does, in the same pass, but given
+    as strings.
+
+    Raises a `ValueError` if there is sequence data before the first header,
+    and a `KeyError` for invalid characters if normalizing.
+    """
+    handle = open_sequence_file(source)
+    try:
+        name = None
+        header = None
+        at_line_start = True
+        while True:
+            data = handle.read(chunk_size)
+            if not data:
+                break
+            if isinstance(data, str):
+                data = data.encode("ascii", "replace")
+            parts = []
+            position = 0
+            while position < len(data):
+                if header is not None:
+                    newline = data.find(b"\n", position)
+                    if newline < 0:
+                        header += data[position:]
+                        break
+                    name = (header + data[position: newline]).decode(
+                            "utf-8", "replace").strip()
+                    header = None
+                    position = newline + 1
+                    at_line_start = True
+                    yield name, None
+                    continue
+                if at_line_start and data[position] == ord(">"):
+                    if parts:
+                        yield name, _join_fasta_parts(parts, normalize)
+                        parts = []
+                    header = b""
+                    position += 1
+                    continue
+                newline = data.find(b"\n", position)
+                end = len(data) if newline < 0 else newline + 1
+                if name is None and data[position: end].strip():
+                    raise ValueError(
+                            "Sequence found before the first FASTA header")
+                parts.append(data[position: end])
+                at_line_start = newline >= 0
+                position = end
+            if parts and name is not None:
+                chunk = _join_fasta_parts(parts, normalize)
+                if chunk:
+                    yield name, chunk
+        if header is not None:
+            yield header.decode("utf-8", "replace").strip(), None
+    finally:
+        if handle is not sys.stdin.buffer and handle is not source:
+            handle.close()
+
+def _join_fasta_parts(parts, normalize = False):
+    if not normalize:
+        return b"".join(parts).translate(None, b" \t\r\n").decode(
+                "ascii", "replace")
+    chunk = b"".join(parts).translate(_NORMALIZE_TABLE, b" \t\r\n")
+    position = chunk.find(0)
+    if position >= 0:
+        # The character that was there
+        raise KeyError(chr(b"".join(parts).translate(None,
+                b" \t\r\n")[position]))
+    return chunk.decode("ascii")
+
+def read_fasta(source, chunk_size = DEFAULT_CHUNK_SIZE):
+    """Read FASTA formatted sequences.
+
+    Yields a tuple `(name, sequence)` for every record in `source` (anything
+    `open_sequence_file` accepts). Each sequence is read into memory whole;
+    use `iter_fasta_chunks` or `iter_fasta_orfs` for large sequences.
+    """
+    name = None
+    parts = None
+    for record_name, chunk in iter_fasta_chunks(source, chunk_size):
+        if chunk is None:
+            if parts is not None:
+                yield name, "".join(parts)
+            name = record_name
+            parts = []
+        else:
+            parts.append(chunk)
+    if parts is not None:
+        yield name, "".join(parts)
+
+def iter_fasta_orfs(source, genetic_code, chunk_size = DEFAULT_CHUNK_SIZE,
+        normalize = True):
+    """Find the open reading frames of every sequence in a FASTA file.
+
+    Streams `source` (anything `open_sequence_file` accepts) through a
+    `ChunkedOrfScanner` and yields the `Orf`s found on both strands of each
+    record as soon as they are complete. Memory use depends on `chunk_size`
+    and the longest open reading frame, not on the length of the sequences.
+    Sequences are normalized as they are read (see `iter_fasta_chunks`)
+    unless `normalize` is false.
+    """
+    scanner = None
+    for name, chunk in iter_fasta_chunks(source, chunk_size, normalize):
+        if chunk is None:
+            if scanner is not None:
+                for orf in scanner.finish():
+                    yield orf
+            scanner = ChunkedOrfScanner(genetic_code, record = name)
+        else:
+            for orf in scanner.feed(chunk):
+                yield orf
+    if scanner is not None:
+        for orf in scanner.finish():
+            yield orf
+
+
+# Formats `OrfWriter` can write
+ORF_FORMATS = ("fasta", "tsv", "bed")
+# Bytes of output collected before each write
+DEFAULT_WRITE_BUFFER = 1 << 20
+_FASTA_LINE_LENGTH = 60
+
+def open_output_file(destination, compress = None):
+    """Open a file for writing bytes.
+
+    `destination` can be a path, '-' for standard output, or a file object
+    opened for writing bytes. Output is gzip-compressed if `compress` is
+    true, or if it is None and `destination` is a path ending with ".gz".
+    Returns the file object and whether closing it is up to the caller (it
+    is not for standard output and file objects, but is for the gzip file
+    wrapping them).
+    """
+    if destination == "-":
+        handle = sys.stdout.buffer
+        owned = False
+    elif isinstance(destination, str):
+        if compress is None:
+            compress = destination.endswith(".gz")
+        handle = open(destination, "wb")
+        owned = True
+    else:
+        handle = destination
+        owned = False
+    if compress:
+        return gzip.GzipFile(fileobj = handle, mode = "wb"), True
+    return handle, owned
+
+class OrfWriter:
+    """Write `Orf`s to a file in FASTA, TSV or BED format as they come.
+
+    `destination` and `compress` are as in `open_output_file`. Formatted
+    reading frames are collected until there are `buffer_size` bytes of
+    them, and then written at once, so memory use does not grow with the
+    output. Reading frames are named "orf1", "orf2" and so on, in the order
+    they are written:
+
+    -   "fasta": the peptides, with a header line giving the name, the
+        record, the coordinates, the frame and the length;
+    -   "tsv": a header line and a line per reading frame of name, record,
+        strand, frame, start, end (0-based, end excluded) and length in
+        amino acids;
+    -   "bed": BED6 lines of record, start, end, name, score and strand.
+        The score is always 0, since BED scores only go up to 1000; the
+        length is in the other formats.
+
+    Use as a context manager, or `close` when done.
+    """
+
+    def __init__(self, destination, format = "tsv", compress = None,
+            buffer_size = DEFAULT_WRITE_BUFFER):
+        if format not in ORF_FORMATS:
+            raise ValueError("Unknown ORF format {0!r}; expected one of "
+                    "{1}".format(format, ", ".join(ORF_FORMATS)))
+        self.format = format
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._format_orf = getattr(self, "_format_" + format)
+        self._parts = []
+        self._buffered = 0
+        self._handle, self._owned = open_output_file(destination, compress)
+        if format == "tsv":
+            self._add("name\trecord\tstrand\tframe\tstart\tend\tlength\n")
+
+    def write(self, orf):
+        """Write one `Orf`."""
+        self.count += 1
+        self._add(self._format_orf(orf, "orf{0}".format(self.count)))
+
+    def write_all(self, orfs):
+        """Write every `Orf` in `orfs`, and return how many were written."""
+        count = self.count
+        for orf in orfs:
+            self.write(orf)
+        return self.count - count
+
+    def _add(self, text):
+        self._parts.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write out the reading frames collected so far."""
+        if self._parts:
+            self._handle.write("".join(self._parts).encode("utf-8"))
+            self._parts = []
+            self._buffered = 0
+        self._handle.flush()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _format_fasta(self, orf, name):
+        lines = [">{0} {1}:{2}-{3}({4}) frame={5} length={6}\n".format(name,
+                _record_name(orf), orf.start, orf.end, orf.strand, orf.frame,
+                len(orf.peptide))]
+        for start in range(0, len(orf.peptide), _FASTA_LINE_LENGTH):
+            lines.append(orf.peptide[start: start + _FASTA_LINE_LENGTH] +
+                    "\n")
+        return "".join(lines)
+
+    def _format_tsv(self, orf, name):
+        return "{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\n".format(name,
+                _record_name(orf), orf.strand, orf.frame, orf.start, orf.end,
+                len(orf.peptide))
+
+    def _format_bed(self, orf, name):
+        return "{0}\t{1}\t{2}\t{3}\t0\t{4}\n".format(_record_name(orf),
+                orf.start, orf.end, name, orf.strand)
+
+def _record_name(orf):
+    # First word of the record name, or "sequence" for unnamed sequences
+    if orf.record is None:
+        return "sequence"
+    words = orf.record.split()
+    return words[0] if words else "sequence"
+
+class FastaFile:
+    """Random access to the sequences of a FASTA file, through `mmap`.
+
+    Uses a samtools-style `.fai` index next to the file (`path + ".fai"`),
+    which is built and saved on first use if it is missing or older than the
+    file. Records are named after the first word of their header, and the
+    lines of a record must all be the same length except the last.
+
+    `fetch` returns a `memoryview` of the bases of a region. Regions within a
+    single line are views of the mapping itself, and other regions copy only
+    their own lines, so only the pages of the region are read from disk.
+    Use as a context manager, or `close` when done; views of the mapping
+    stay valid after `close`, and keep it open until they are released.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                    access = mmap.ACCESS_READ)
+        else:
+            self._map = b""
+        # name: (length, offset, line bases, line width)
+        self.index = self._load_index()
+        if self.index is None:
+            self.index = self._build_index()
+            self._save_index()
+
+    @property
+    def names(self):
+        return list(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def length(self, name):
+        """Get the number of bases of record `name`."""
+        return self.index[name][0]
+
+    def fetch(self, name, start = 0, end = None):
+        """Get the bases of record `name` from `start` to `end` (0-based, end
+        excluded) as a `memoryview`.
+        """
+        length, offset, line_bases, line_width = self.index[name]
+        start, end = _check_region(name, length, start, end)
+        if start == end:
+            return memoryview(b"")
+        first = (offset + start // line_bases * line_width +
+                start % line_bases)
+        last = (offset + (end - 1) // line_bases * line_width +
+                (end - 1) % line_bases + 1)
+        if start // line_bases == (end - 1) // line_bases:
+            return memoryview(self._map)[first: last]
+        return memoryview(self._map[first: last].translate(None, b"\r\n"))
+
+    def _load_index(self):
+        try:
+            if (os.path.getmtime(self.path + ".fai") <
+                    os.path.getmtime(self.path)):
+                return None
+            with open(self.path + ".fai") as index_file:
+                index = {}
+                for line in index_file:
+                    fields = line.split("\t")
+                    index[fields[0]] = tuple(int(field) for field in
+                            fields[1:5])
+                return index
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _build_index(self):
+        data = self._map
+        index = {}
+        position = 0
+        while position < len(data):
+            if data[position] != ord(">"):
+                raise ValueError("{0}: expected a FASTA header at byte "
+                        "{1}".format(self.path, position))
+            header_end = data.find(b"\n", position)
+            if header_end < 0:
+                header_end = len(data)
+            words = data[position + 1: header_end].split()
+            name = words[0].decode("utf-8", "replace") if words else ""
+            offset = header_end + 1
+            next_record = data.find(b"\n>", header_end)
+            record_end = len(data) if next_record < 0 else next_record + 1
+            line_end = data.find(b"\n", offset, record_end)
+            if line_end < 0:
+                line_end = record_end
+                line_width = line_end - offset
+            else:
+                line_width = line_end + 1 - offset
+            line_bases = len(data[offset: line_end].rstrip(b"\r"))
+            length = self._check_lines(name, offset, record_end,
+                    line_bases, line_width)
+            index[name] = (length, offset, line_bases or 1, line_width or 1)
+            position = record_end
+        return index
+
+    def _check_lines(self, name, offset, record_end, line_bases,
+            line_width):
+        # Check that every line of a record but the last is `line_width`
+        # bytes long and ends in the same line terminator (like samtools
+        # faidx does), and return the number of bases of the record.
+        data = self._map
+        terminator = data[offset + line_bases: offset + line_width]
+        body_end = record_end
+        if data[body_end - 1: body_end] == b"\n":
+            body_end -= 1
+            if data[body_end - 1: body_end] == b"\r":
+                body_end -= 1
+        body_end = max(body_end, offset)
+        interior_lines = (body_end - offset) // line_width if line_width \
+                else 0
+        # The last line is never a full line followed by nothing
+        if interior_lines and offset + interior_lines * line_width == \
+                body_end:
+            interior_lines -= 1
+        chunk_lines = max(DEFAULT_CHUNK_SIZE // max(line_width, 1), 1)
+        for first in range(0, interior_lines, chunk_lines):
+            count = min(chunk_lines, interior_lines - first)
+            chunk = data[offset + first * line_width: offset + (first +
+                    count) * line_width]
+            for column, byte in enumerate(terminator):
+                if (chunk[line_bases + column:: line_width] !=
+                        bytes((byte,)) * count):
+                    self._uneven_lines(name)
+            if chunk.count(b"\n") != count:
+                self._uneven_lines(name)
+        last_line = data[offset + interior_lines * line_width: body_end]
+        if len(last_line) > line_bases or b"\n" in last_line:
+            self._uneven_lines(name)
+        return interior_lines * line_bases + len(last_line)
+
+    def _uneven_lines(self, name):
+        raise ValueError("{0}: the lines of {1!r} are not all the same "
+                "length".format(self.path, name))
+
+    def _save_index(self):
+        def write(index_file):
+            for name, fields in self.index.items():
+                index_file.write("\t".join([name] + [str(field) for field in
+                        fields]) + "\n")
+        try:
+            _atomic_write(self.path + ".fai", write, "w")
+        except OSError:
+            # Read-only directory: keep the index in memory only
+            pass
+
+    def close(self):
+        _close_map(self._map)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _close_map(data):
+    # Views returned by `fetch` keep the mapping open until they are gone
+    if isinstance(data, mmap.mmap):
+        try:
+            data.close()
+        except BufferError:
+            pass
+
+def _check_region(name, length, start, end):
+    if end is None:
+        end = length
+    if not 0 <= start <= end <= length:
+        raise ValueError("Region {0}:{1}-{2} is outside the {3} bases of "
+                "the sequence".format(name, start, end, length))
+    return start, end
+
+_DNA_TO_RNA_TABLE = bytes.maketrans(b"Tt", b"Uu")
+# Bases of UCSC 2bit files, by 2-bit number
+_TWO_BIT_BASES = b"TCAG"
+# Byte of packed bases to its base at each of the 4 positions, first base in
+# the high bits
+_TWO_BIT_TABLES = tuple(bytes(_TWO_BIT_BASES[(byte >> shift) & 3] for byte
+        in range(256)) for shift in (6, 4, 2, 0))
+
+class TwoBitFile:
+    """Random access to the sequences of a UCSC 2bit file, through `mmap`.
+
+    `fetch` unpacks only the bytes of the region asked for, so only their
+    pages are read from disk. Use as a context manager, or `close` when done.
+    """
+
+    SIGNATURE = 0x1A412743
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0,
+                access = mmap.ACCESS_READ)
+        for byte_order in "<>":
+            signature, version, count = struct.unpack_from(
+                    byte_order + "III", self._map)
+            if signature == self.SIGNATURE:
+                break
+        else:
+            self.close()
+            raise ValueError("{0} is not a 2bit file".format(path))
+        self._byte_order = byte_order
+        offset_format = byte_order + ("Q" if version else "I")
+        # name: offset of the record
+        self._offsets = {}
+        position = 16
+        for index in range(count):
+            name_size = self._map[position]
+            name = self._map[position + 1: position + 1 + name_size].decode(
+                    "utf-8", "replace")
+            position += 1 + name_size
+            self._offsets[name] = struct.unpack_from(offset_format,
+                    self._map, position)[0]
+            position += struct.calcsize(offset_format)
+        # name: (length, N blocks, mask blocks, offset of the packed bases)
+        self._records = {}
+
+    @property
+    def names(self):
+        return list(self._offsets)
+
+    def __contains__(self, name):
+        return name in self._offsets
+
+    def length(self, name):
+        """Get the number of bases of record `name`."""
+        return self._record(name)[0]
+
+    def _record(self, name):
+        record = self._records.get(name)
+        if record is None:
+            position = self._offsets[name]
+            length = self._unpack_int(position)
+            position += 4
+            blocks = []
+            for kind in ("N", "mask"):
+                count = self._unpack_int(position)
+                position += 4
+                columns = []
+                for column in range(2):
+                    values = array.array("I")
+                    values.frombytes(self._map[position: position + 4 *
+                            count])
+                    if (self._byte_order == "<") != (sys.byteorder ==
+                            "little"):
+                        values.byteswap()
+                    columns.append(values)
+                    position += 4 * count
+                blocks.append(columns)
+            # reserved word
+            position += 4
+            record = (length, blocks[0], blocks[1], position)
+            self._records[name] = record
+        return record
+
+    def _unpack_int(self, position):
+        return struct.unpack_from(self._byte_order + "I", self._map,
+                position)[0]
+
+    def fetch(self, name, start = 0, end = None, alphabet = "dna",
+            mask = False):
+        """Get the bases of record `name` from `start` to `end` (0-based, end
+        excluded) as a `memoryview`.
+
+        With `alphabet` "rna", T is given as U. With `mask`, soft-masked
+        regions are lower case.
+        """
+        length, n_blocks, mask_blocks, offset = self._record(name)
+        start, end = _check_region(name, length, start, end)
+        packed = self._map[offset + start // 4: offset + (end + 3) // 4]
+        bases = bytearray(4 * len(packed))
+        for position, table in enumerate(_TWO_BIT_TABLES):
+            bases[position::4] = packed.translate(table)
+        del bases[end - start + start % 4:]
+        del bases[:start % 4]
+        for block_start, block_end in _blocks_in_region(n_blocks, start,
+                end):
+            bases[block_start - start: block_end - start] = b"N" * (
+                    block_end - block_start)
+        if mask:
+            for block_start, block_end in _blocks_in_region(mask_blocks,
+                    start, end):
+                bases[block_start - start: block_end - start] = bases[
+                        block_start - start: block_end - start].lower()
+        if alphabet == "rna":
+            bases = bases.translate(_DNA_TO_RNA_TABLE)
+        elif alphabet != "dna":
+            raise ValueError("Unknown alphabet: {0!r}".format(alphabet))
+        return memoryview(bases)
+
+    def close(self):
+        _close_map(self._map)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _blocks_in_region(blocks, start, end):
+    # The parts of (sorted, disjoint) 2bit blocks that are within start-end
+    block_starts, block_sizes = blocks
+    first = max(bisect.bisect_right(block_starts, start) - 1, 0)
+    for block in range(first, len(block_starts)):
+        if block_starts[block] >= end:
+            break
+        block_start = max(block_starts[block], start)
+        block_end = min(block_starts[block] + block_sizes[block], end)
+        if block_start < block_end:
+            yield block_start, block_end
+
+# A motif found by `PeptideIndex`. `start` and `end` are the positions of the
+# codons that encode it, and `orf_start` and `orf_end` those of the open
+# reading frame it was found in (stop codon included), as in `Orf`.
+PeptideHit = collections.namedtuple("PeptideHit", ["record", "strand",
+        "frame", "start", "end", "orf_start", "orf_end"])
+
+class PeptideIndex:
+    """A suffix array of the peptides of every open reading frame of a set of
+    sequences, saved on disk and read through `mmap`.
+
+    `build` scans both strands of each sequence with `find_orfs`. Open
+    reading frames that end at the same stop codon are suffixes of the
+    longest of them, so only that one is translated and indexed, and the
+    others are remembered by where they start in it. `count` and `find` look
+    for a motif anywhere in the peptides, and `find_peptides` for peptides
+    that are (or start with) a query, in time that grows with the log of the
+    size of the index. Hits are `PeptideHit`s.
+
+    The file holds a header, the suffix array and the reading frame columns
+    as raw little-endian arrays, the peptides, and the record names. Opening
+    an index maps the file without reading it, so only the pages a query
+    touches are read from disk. Use as a context manager, or `close` when
+    done.
+    """
+
+    MAGIC = b"PEPI"
+    VERSION = 1
+    # magic, version, min_length, peptide bytes, reading frames, starts,
+    # name bytes
+    _HEADER = struct.Struct("<4sHxxqqqqq")
+    # Follows every peptide, and is never part of a query
+    SEPARATOR = b"\n"
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._views = []
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < self._HEADER.size:
+                raise ValueError("{0}: not a peptide index".format(path))
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                    access = mmap.ACCESS_READ)
+            magic, version, self.min_length, text_length, orfs, starts, \
+                    names_length = self._HEADER.unpack_from(self._map)
+            if (magic != self.MAGIC or version != self.VERSION or
+                    size != self._HEADER.size + 8 * text_length +
+                    29 * orfs + 8 * starts + text_length + names_length):
+                raise ValueError("{0}: not a peptide index".format(path))
+            self._offset = self._HEADER.size
+            self.suffixes = self._column("q", text_length)
+            self.offsets = self._column("q", orfs)
+            self.starts = self._column("q", orfs)
+            self.ends = self._column("q", orfs)
+            self.orf_starts = self._column("q", starts)
+            self.records = self._column("i", orfs)
+            self.strands = self._column("b", orfs)
+            self._text = self._offset
+            self._text_length = text_length
+            names = self._map[self._text + text_length:].decode("utf-8")
+            self.names = [name or None for name in names.split("\n")]
+        except BaseException:
+            self.close()
+            raise
+
+    @classmethod
+    def build(cls, sequences, genetic_code, path, min_length = 1,
+            normalize = True):
+        """Index the open reading frames of `sequences`, save the index to
+        `path` and open it.
+
+        `sequences` is an iterable of `(name, sequence)` tuples, like the
+        output of `read_fasta`, or a single sequence with no name.
+        `min_length` and `normalize` are as in `find_orfs`.
+        """
+        if isinstance(sequences, (str, bytes, bytearray, memoryview,
+                PackedSequence)):
+            sequences = [(None, sequences)]
+        code = compile_genetic_code(genetic_code)
+        text = bytearray()
+        names = []
+        offsets = array.array("q")
+        starts = array.array("q")
+        ends = array.array("q")
+        orf_starts = array.array("q")
+        records = array.array("i")
+        strands = array.array("b")
+        for record, (name, sequence) in enumerate(sequences):
+            names.append(name or "")
+            table = find_orfs(sequence, code, min_length = min_length,
+                    normalize = normalize)
+            # (strand, frame, stop codon position): rows ending there
+            shared_stops = {}
+            for index in range(len(table)):
+                strand = table.strands[index]
+                stop_side = table.starts[index] if strand else \
+                        table.ends[index]
+                shared_stops.setdefault((strand, table.frames[index],
+                        stop_side), []).append(index)
+            longest = sorted((max(rows, key = table.lengths.__getitem__),
+                    rows) for rows in shared_stops.values())
+            for index, rows in longest:
+                length = table.lengths[index]
+                offset = len(text)
+                text += table.peptide(index).encode("ascii")
+                text += cls.SEPARATOR
+                offsets.append(offset)
+                starts.append(table.starts[index])
+                ends.append(table.ends[index])
+                records.append(record)
+                strands.append(table.strands[index])
+                orf_starts.extend(offset + length - table.lengths[row]
+                        for row in rows)
+        orf_starts = array.array("q", sorted(orf_starts))
+        suffixes = _suffix_array(text)
+        names = "\n".join(names).encode("utf-8")
+        def write(index_file):
+            index_file.write(cls._HEADER.pack(cls.MAGIC, cls.VERSION,
+                    min_length, len(text), len(offsets), len(orf_starts),
+                    len(names)))
+            for column in (suffixes, offsets, starts, ends, orf_starts,
+                    records, strands):
+                if sys.byteorder == "big":
+                    column = array.array(column.typecode, column)
+                    column.byteswap()
+                column.tofile(index_file)
+            index_file.write(text)
+            index_file.write(names)
+        _atomic_write(path, write)
+        return cls(path)
+
+    def __len__(self):
+        # Number of indexed (longest) open reading frames
+        return len(self.offsets)
+
+    def count(self, motif):
+        """Count the occurrences of `motif` in the indexed peptides."""
+        first, last = self._suffix_range(self._query(motif))
+        return last - first
+
+    def find(self, motif):
+        """Find every occurrence of `motif` in the indexed peptides.
+
+        Returns a list of `PeptideHit`s, in the order of the records and the
+        reading frames. The reading frame of a hit is the longest one that
+        contains it.
+        """
+        query = self._query(motif)
+        first, last = self._suffix_range(query)
+        return [self._hit(position, len(query), None) for position in
+                sorted(self.suffixes[first: last])]
+
+    def find_peptides(self, query, prefix = False):
+        """Find the open reading frames whose peptide is `query`, or starts
+        with it if `prefix` is true.
+
+        Returns a list of `PeptideHit`s for the codons of `query` in each of
+        them, in the order of the records and the reading frames.
+        """
+        query = self._query(query)
+        first, last = self._suffix_range(query)
+        hits = []
+        for position in sorted(self.suffixes[first: last]):
+            start = bisect.bisect_left(self.orf_starts, position)
+            if (start == len(self.orf_starts) or
+                    self.orf_starts[start] != position):
+                continue
+            end = self._text + position + len(query)
+            if prefix or self._map[end: end + 1] == self.SEPARATOR:
+                hits.append(self._hit(position, len(query), position))
+        return hits
+
+    def _query(self, motif):
+        if isinstance(motif, str):
+            motif = motif.encode("ascii", "replace")
+        motif = bytes(motif).upper()
+        if not motif or self.SEPARATOR in motif:
+            raise ValueError("Invalid peptide: {0!r}".format(motif))
+        return motif
+
+    def _suffix_range(self, query):
+        # First and last (excluded) rows of the suffix array that start with
+        # `query`. Every peptide ends with a separator, so comparisons never
+        # run past the peptides.
+        data = self._map
+        text = self._text
+        suffixes = self.suffixes
+        length = len(query)
+        low, high = 0, len(suffixes)
+        while low < high:
+            middle = (low + high) // 2
+            position = text + suffixes[middle]
+            if data[position: position + length] < query:
+                low = middle + 1
+            else:
+                high = middle
+        first = low
+        high = len(suffixes)
+        while low < high:
+            middle = (low + high) // 2
+            position = text + suffixes[middle]
+            if data[position: position + length] <= query:
+                low = middle + 1
+            else:
+                high = middle
+        return first, low
+
+    def _hit(self, position, length, orf_position):
+        # The hit of `length` amino acids at `position` of the peptides, in
+        # the reading frame starting at `orf_position` (or the longest one,
+        # if None)
+        orf = bisect.bisect_right(self.offsets, position) - 1
+        amino_acids = position - self.offsets[orf]
+        shift = 0
+        if orf_position is not None:
+            shift = 3 * (orf_position - self.offsets[orf])
+        orf_start = self.starts[orf]
+        orf_end = self.ends[orf]
+        if self.strands[orf]:
+            start = orf_end - 3 * (amino_acids + length)
+            end = orf_end - 3 * amino_acids
+            return PeptideHit(self.names[self.records[orf]], "-", start % 3,
+                    start, end, orf_start, orf_end - shift)
+        start = orf_start + 3 * amino_acids
+        return PeptideHit(self.names[self.records[orf]], "+", start % 3,
+                start, start + 3 * length, orf_start + shift, orf_end)
+
+    def _column(self, typecode, count):
+        size = array.array(typecode).itemsize * count
+        data = memoryview(self._map)[self._offset: self._offset + size]
+        self._offset += size
+        if sys.byteorder == "big":
+            column = array.array(typecode, data.tobytes())
+            column.byteswap()
+            data.release()
+            return column
+        column = data.cast(typecode)
+        data.release()
+        self._views.append(column)
+        return column
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        _close_map(getattr(self, "_map", None))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _suffix_array(text):
+    # Start positions of the suffixes of `text` in sorted order, by prefix
+    # doubling: after each round, suffixes are ranked by their first `span`
+    # bytes.
+    length = len(text)
+    if length == 0:
+        return array.array("q")
+    if _use_numpy(text):
+        ranks = numpy.frombuffer(bytes(text), dtype = numpy.uint8).astype(
+                numpy.int64)
+        span = 1
+        while True:
+            next_ranks = numpy.full(length, -1, dtype = numpy.int64)
+            next_ranks[:length - span] = ranks[span:]
+            order = numpy.lexsort((next_ranks, ranks))
+            sorted_ranks = ranks[order]
+            sorted_next = next_ranks[order]
+            changed = numpy.empty(length, dtype = numpy.int64)
+            changed[0] = 0
+            changed[1:] = ((sorted_ranks[1:] != sorted_ranks[:-1]) |
+                    (sorted_next[1:] != sorted_next[:-1]))
+            ranks = numpy.empty(length, dtype = numpy.int64)
+            ranks[order] = numpy.cumsum(changed)
+            if ranks[order[-1]] == length - 1:
+                return array.array("q", order.astype(numpy.int64).tobytes())
+            span *= 2
+    ranks = list(text)
+    order = list(range(length))
+    span = 1
+    while True:
+        def key(position):
+            return (ranks[position], ranks[position + span]
+                    if position + span < length else -1)
+        order.sort(key = key)
+        new_ranks = [0] * length
+        rank = 0
+        previous = key(order[0])
+        for position in order:
+            current = key(position)
+            if current != previous:
+                rank += 1
+                previous = current
+            new_ranks[position] = rank
+        ranks = new_ranks
+        if rank == length - 1:
+            return array.array("q", order)
+        span *= 2
+
+# Requests a `TranslationServer` answers, besides "stats"
+SERVER_OPERATIONS = ("translate", "orfs", "longest_peptide")
+DEFAULT_SERVER_BATCH_SIZE = 64
+DEFAULT_BATCH_DELAY = 0.002
+DEFAULT_MAX_QUEUE = 4096
+DEFAULT_MAX_PENDING = 256
+# Longest request line, in bytes
+DEFAULT_MAX_REQUEST_SIZE = 1 << 26
+# Latencies kept for `TranslationServer.latency_percentiles`
+_LATENCY_SAMPLES = 100000
+
+def _worker_run_batch(code, requests):
+    # Answer a batch of (operation, sequence, min_length) requests with
+    # (error type, result or message) pairs, so that one bad sequence does
+    # not fail the batch
+    results = []
+    for operation, sequence, min_length in requests:
+        try:
+            if operation == "translate":
+                result = translate_sequence(sequence, code)
+            elif operation == "longest_peptide":
+                result = get_longest_peptide(sequence, code)
+            else:
+                table = find_orfs(sequence, code, min_length = min_length)
+                result = [[view.strand, view.frame, view.start, view.end,
+                        peptide] for view, peptide in zip(table,
+                                table.peptides())]
+            results.append((None, result))
+        except KeyError as error:
+            results.append(("KeyError", error.args[0]))
+        except ValueError as error:
+            results.append(("ValueError", str(error)))
+    return results
+
+class TranslationServer:
+    """A long-lived server answering translation requests over a local
+    socket, so that callers do not pay interpreter startup and genetic code
+    compilation for every sequence.
+
+    The protocol is one JSON object per line each way. A request is
+    `{"id": ..., "op": ..., "sequence": ..., "min_length": ...}` with an `op`
+    in `SERVER_OPERATIONS` ("translate" for `translate_sequence`, "orfs" for
+    the `[strand, frame, start, end, peptide]` of every reading frame on both
+    strands, "longest_peptide" for `get_longest_peptide`), or `{"op":
+    "stats"}`. The response carries the same `id` and either a `result` or
+    an `error` of the form `{"type": ..., "message": ...}`. Responses on one
+    connection may come out of order.
+
+    Requests from all connections wait in one queue of at most `max_queue`
+    requests, and are sent to a pool of `processes` workers (by default, one
+    per CPU; with 1, a single thread) in batches of up to `batch_size`,
+    waiting `batch_delay` seconds after the first request of a batch for
+    others to join it. When the queue is full, or a connection has
+    `max_pending` requests unanswered, the server stops reading from the
+    connection until there is room, so clients are slowed down instead of
+    filling memory.
+    """
+
+    def __init__(self, genetic_code, processes = None,
+            batch_size = DEFAULT_SERVER_BATCH_SIZE,
+            batch_delay = DEFAULT_BATCH_DELAY, max_queue = DEFAULT_MAX_QUEUE,
+            max_pending = DEFAULT_MAX_PENDING,
+            max_request_size = DEFAULT_MAX_REQUEST_SIZE):
+        if batch_size < 1 or max_queue < 1 or max_pending < 1:
+            raise ValueError("batch_size, max_queue and max_pending must be "
+                    "at least 1")
+        self.genetic_code = compile_genetic_code(genetic_code)
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_queue = max_queue
+        self.max_pending = max_pending
+        self.max_request_size = max_request_size
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        # Requests sent to the workers
+        self.batched_requests = 0
+        self.latencies = collections.deque(maxlen = _LATENCY_SAMPLES)
+        self._server = None
+        self._executor = None
+        self._tasks = []
+        # Tasks handling the open connections
+        self._connections = set()
+
+    async def start(self, path = None, host = "127.0.0.1", port = None):
+        """Start listening on the Unix socket `path`, or on TCP `host` and
+        `port` (0 for any free port; see `address`).
+        """
+        if (path is None) == (port is None):
+            raise ValueError("Give either a socket path or a port")
+        if self.processes == 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(1)
+            self._run_batch = functools.partial(_worker_run_batch,
+                    self.genetic_code)
+        else:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.processes, initializer = _init_worker,
+                    initargs = (self.genetic_code,))
+            self._run_batch = functools.partial(_in_worker,
+                    _worker_run_batch)
+        self._queue = asyncio.Queue(self.max_queue)
+        # Batches sent to the workers and not answered yet
+        self._slots = asyncio.Semaphore(self.processes)
+        self._tasks.append(asyncio.ensure_future(self._batch_requests()))
+        if path is not None:
+            self._server = await asyncio.start_unix_server(
+                    self._handle_connection, path,
+                    limit = self.max_request_size)
+        else:
+            self._server = await asyncio.start_server(
+                    self._handle_connection, host, port,
+                    limit = self.max_request_size)
+        return self
+
+    @property
+    def address(self):
+        """The socket path, or `(host, port)`, the server listens on."""
+        address = self._server.sockets[0].getsockname()
+        return address if isinstance(address, str) else address[:2]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stop listening, close the connections, cancel queued requests and
+        stop the workers."""
+        if self._server is not None:
+            self._server.close()
+            # `wait_closed` also waits for the open connections (since
+            # Python 3.12.1), so they are closed first
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections,
+                    return_exceptions = True)
+            await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions = True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait = True, cancel_futures = True)
+            self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def latency_percentiles(self, percentiles = (50, 90, 99, 100)):
+        """Get the given percentiles of the latency of recent requests, from
+        the moment they were read to the moment they were answered, in
+        seconds, as a dict like `{"p50": ...}`.
+        """
+        latencies = sorted(self.latencies)
+        result = {}
+        for percentile in percentiles:
+            if latencies:
+                rank = min(len(latencies) - 1, max(0, int(math.ceil(
+                        percentile / 100.0 * len(latencies))) - 1))
+                result["p{0:g}".format(percentile)] = latencies[rank]
+            else:
+                result["p{0:g}".format(percentile)] = None
+        return result
+
+    def as_dict(self):
+        """Get the request counters and latency percentiles as a dict."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_requests / self.batches
+                    if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._server else 0,
+            "latency_seconds": self.latency_percentiles(),
+        }
+
+    def report(self):
+        """Get the request counters and latency percentiles, as text."""
+        stats = self.as_dict()
+        lines = ["{0:<20} {1:>15,}".format(counter, stats[counter])
+                for counter in ("requests", "errors", "batches")]
+        lines.append("{0:<20} {1:>15.1f}".format("mean batch size",
+                stats["mean_batch_size"]))
+        for percentile, seconds in stats["latency_seconds"].items():
+            if seconds is not None:
+                lines.append("{0:<20} {1:>12.3f} ms".format(
+                        "latency " + percentile, 1000 * seconds))
+        return "\n".join(lines) + "\n"
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        pending = asyncio.Semaphore(self.max_pending)
+        write_lock = asyncio.Lock()
+        responses = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than `max_request_size`: the stream cannot be
+                    # resynchronized
+                    await self._respond(writer, write_lock, None, None,
+                            ("ValueError", "Request too long"))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await pending.acquire()
+                received = time.perf_counter()
+                request_id, request, error = self._parse(line)
+                if error is not None:
+                    await self._respond(writer, write_lock, request_id,
+                            received, error)
+                    pending.release()
+                    continue
+                if request is None:
+                    await self._respond(writer, write_lock, request_id,
+                            received, (None, self.as_dict()))
+                    pending.release()
+                    continue
+                future = asyncio.get_running_loop().create_future()
+                # Waits while the queue is full, which stops reading
+                await self._queue.put((request, future))
+                response = asyncio.ensure_future(self._respond_when_done(
+                        writer, write_lock, request_id, received, future,
+                        pending))
+                responses.add(response)
+                response.add_done_callback(responses.discard)
+            if responses:
+                await asyncio.gather(*responses, return_exceptions = True)
+        except (ConnectionError, asyncio.CancelledError):
+            for response in responses:
+                response.cancel()
+        finally:
+            writer.close()
+            self._connections.discard(task)
+
+    def _parse(self, line):
+        # (id, (operation, sequence, min_length) or None for "stats",
+        # error pair or None)
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return None, None, ("ValueError", "Invalid JSON")
+        if not isinstance(message, dict):
+            return None, None, ("ValueError", "Invalid request")
+        request_id = message.get("id")
+        operation = message.get("op")
+        if operation == "stats":
+            return request_id, None, None
+        if operation not in SERVER_OPERATIONS:
+            return request_id, None, ("ValueError",
+                    "Unknown operation: {0!r}".format(operation))
+        sequence = message.get("sequence")
+        min_length = message.get("min_length", 1)
+        if not isinstance(sequence, str) or not isinstance(min_length, int):
+            return request_id, None, ("ValueError", "Invalid request")
+        return request_id, (operation, sequence, min_length), None
+
+    async def _respond_when_done(self, writer, write_lock, request_id,
+            received, future, pending):
+        try:
+            answer = await future
+        except Exception as error:
+            answer = (type(error).__name__, str(error))
+        try:
+            await self._respond(writer, write_lock, request_id, received,
+                    answer)
+        finally:
+            pending.release()
+
+    async def _respond(self, writer, write_lock, request_id, received,
+            answer):
+        error, result = answer
+        if error is None:
+            response = {"id": request_id, "result": result}
+        else:
+            self.errors += 1
+            response = {"id": request_id, "error": {"type": error,
+                    "message": result}}
+        async with write_lock:
+            writer.write(json.dumps(response, separators = (",", ":"))
+                    .encode("utf-8") + b"\n")
+            await writer.drain()
+        if received is not None:
+            self.requests += 1
+            self.latencies.append(time.perf_counter() - received)
+
+    async def _batch_requests(self):
+        loop = asyncio.get_running_loop()
+        batch_tasks = set()
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                if self._queue.qsize() < self.batch_size - 1:
+                    # Give other requests a chance to join the batch
+                    await asyncio.sleep(self.batch_delay)
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await self._slots.acquire()
+                self.batches += 1
+                self.batched_requests += len(batch)
+                task = loop.run_in_executor(self._executor,
+                        self._run_batch, [request for request, future in
+                                batch])
+                batch_tasks.add(task)
+                task.add_done_callback(functools.partial(
+                        self._batch_done, batch, batch_tasks))
+        finally:
+            for task in batch_tasks:
+                task.cancel()
+
+    def _batch_done(self, batch, batch_tasks, task):
+        batch_tasks.discard(task)
+        self._slots.release()
+        if task.cancelled():
+            for request, future in batch:
+                future.cancel()
+            return
+        error = task.exception()
+        for index, (request, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(task.result()[index])
+
+class TranslationClient:
+    """A client of a `TranslationServer`.
+
+    Requests can be made concurrently from many tasks over one connection;
+    they are answered as soon as the server has their result. Errors for a
+    request are raised as `KeyError` (invalid nucleotides or codons),
+    `ValueError` (invalid requests) or `RuntimeError` (anything else).
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._waiting = {}
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, path = None, host = "127.0.0.1", port = None,
+            max_response_size = DEFAULT_MAX_REQUEST_SIZE):
+        """Connect to the server on the Unix socket `path`, or on TCP `host`
+        and `port`.
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path,
+                    limit = max_response_size)
+        else:
+            reader, writer = await asyncio.open_connection(host, port,
+                    limit = max_response_size)
+        return cls(reader, writer)
+
+    async def request(self, operation, sequence = None, min_length = 1):
+        """Send a request and wait for its result."""
+        self._next_id += 1
+        request_id = self._next_id
+        message = {"id": request_id, "op": operation}
+        if sequence is not None:
+            if not isinstance(sequence, str):
+                sequence = bytes(sequence).decode("ascii", "replace")
+            message["sequence"] = sequence
+            message["min_length"] = min_length
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        self._writer.write(json.dumps(message, separators = (",", ":"))
+                .encode("utf-8") + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def translate_sequence(self, rna_sequence):
+        return await self.request("translate", rna_sequence)
+
+    async def find_orfs(self, rna_sequence, min_length = 1):
+        return await self.request("orfs", rna_sequence, min_length)
+
+    async def get_longest_peptide(self, rna_sequence):
+        return await self.request("longest_peptide", rna_sequence)
+
+    async def stats(self):
+        return await self.request("stats")
+
+    async def _receive(self):
+        error = ConnectionError("Connection to the server closed")
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._waiting.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    exception = {"KeyError": KeyError,
+                            "ValueError": ValueError}.get(
+                                    response["error"]["type"], RuntimeError)
+                    future.set_exception(exception(
+                            response["error"]["message"]))
+                else:
+                    future.set_result(response["result"])
+        except Exception as receive_error:
+            error = receive_error
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._waiting.clear()
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._receiver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+def serve(genetic_code, path = None, host = "127.0.0.1", port = None,
+        log = None, **options):
+    """Run a `TranslationServer` until interrupted (by SIGINT or SIGTERM).
+
+    `options` are passed to `TranslationServer`. Once stopped, the server
+    `report` is written to `log`, if given.
+    """
+    async def run():
+        async with TranslationServer(genetic_code, **options) as server:
+            await server.start(path, host, port)
+            loop = asyncio.get_running_loop()
+            stopped = loop.create_future()
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signal_number, stopped.set_result,
+                        None)
+            if log is not None:
+                log.write("Listening on {0}\n".format(server.address))
+                log.flush()
+            try:
+                await stopped
+            finally:
+                for signal_number in (signal.SIGINT, signal.SIGTERM):
+                    loop.remove_signal_handler(signal_number)
+            if log is not None:
+                log.write(server.report())
+    try:
+        asyncio.run(run())
+    finally:
+        if path is not None and os.path.exists(path):
+            os.unlink(path)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+            description = "Find the open reading frames of the sequences in "
+                    "FASTA files, or, with no files, the longest peptide of "
+                    "an example RNA sequence.")
+    parser.add_argument("inputs", nargs = "*", metavar = "FASTA",
+            help = "FASTA files (possibly gzip-compressed) to read, or '-' "
+                    "for standard input")
+    parser.add_argument("--format", choices = ORF_FORMATS, default = "fasta",
+            help = "output format (default: %(default)s)")
+    parser.add_argument("--output", default = "-",
+            help = "file to write, compressed if it ends with .gz "
+                    "(default: standard output)")
+    parser.add_argument("--gzip", action = "store_true",
+            help = "compress the output with gzip")
+    parser.add_argument("--min-length", type = int, default = 1,
+            help = "shortest peptide to write, in amino acids "
+                    "(default: %(default)d)")
+    parser.add_argument("--table", type = int, default = 1,
+            choices = sorted(NCBI_TRANSLATION_TABLES),
+            help = "NCBI translation table (default: %(default)d)")
+    parser.add_argument("--chunk-size", type = int,
+            default = DEFAULT_CHUNK_SIZE,
+            help = "bytes of input read at a time (default: %(default)d)")
+    parser.add_argument("--profile", action = "store_true",
+            help = "print counters and the time spent in each stage to "
+                    "standard error")
+    server = parser.add_argument_group("server",
+            "Answer requests over a socket instead (see TranslationServer)")
+    server.add_argument("--serve", action = "store_true",
+            help = "run a translation server until interrupted")
+    server.add_argument("--socket", metavar = "PATH",
+            help = "Unix socket to listen on")
+    server.add_argument("--host", default = "127.0.0.1",
+            help = "address to listen on with --port (default: "
+                    "%(default)s)")
+    server.add_argument("--port", type = int,
+            help = "TCP port to listen on")
+    server.add_argument("--processes", type = int,
+            help = "worker processes (default: one per CPU)")
+    server.add_argument("--batch-size", type = int,
+            default = DEFAULT_SERVER_BATCH_SIZE,
+            help = "most requests sent to a worker at once "
+                    "(default: %(default)d)")
+    server.add_argument("--batch-delay", type = float,
+            default = DEFAULT_BATCH_DELAY,
+            help = "seconds to wait for requests to join a batch "
+                    "(default: %(default)s)")
+    server.add_argument("--max-queue", type = int,
+            default = DEFAULT_MAX_QUEUE,
+            help = "most requests waiting for a worker before clients are "
+                    "slowed down (default: %(default)d)")
+    server.add_argument("--max-pending", type = int,
+            default = DEFAULT_MAX_PENDING,
+            help = "most unanswered requests per connection "
+                    "(default: %(default)d)")
+    args = parser.parse_args(argv)
+    if args.serve:
+        if (args.socket is None) == (args.port is None):
+            parser.error("--serve needs either --socket or --port")
+        serve(GeneticCode.from_ncbi_table(args.table), path = args.socket,
+                host = args.host, port = args.port, log = sys.stderr,
+                processes = args.processes, batch_size = args.batch_size,
+                batch_delay = args.batch_delay, max_queue = args.max_queue,
+                max_pending = args.max_pending)
+        return 0
+    if args.profile:
+        enable_stats()
+    if args.inputs:
+        genetic_code = GeneticCode.from_ncbi_table(args.table)
+        with OrfWriter(args.output, args.format,
+                compress = True if args.gzip else None) as writer:
+            for source in args.inputs:
+                try:
+                    writer.write_all(orf for orf in iter_fasta_orfs(source,
+                            genetic_code, args.chunk_size)
+                            if len(orf.peptide) >= args.min_length)
+                except KeyError as error:
+                    sys.stderr.write("{0}: error: {1}: not a base or codon: "
+                            "{2!r}\n".format(parser.prog, source,
+                                    error.args[0]))
+                    return 1
+    else:
+        genetic_code = {'GUC': 'V', 'ACC': 'T', 'GUA': 'V', 'GUG': 'V', 'ACU': 'T', 'AAC': 'N', 'CCU': 'P', 'UGG': 'W', 'AGC': 'S', 'AUC': 'I', 'CAU': 'H', 'AAU': 'N', 'AGU': 'S', 'GUU': 'V', 'CAC': 'H', 'ACG': 'T', 'CCG': 'P', 'CCA': 'P', 'ACA': 'T', 'CCC': 'P', 'UGU': 'C', 'GGU': 'G', 'UCU': 'S', 'GCG': 'A', 'UGC': 'C', 'CAG': 'Q', 'GAU': 'D', 'UAU': 'Y', 'CGG': 'R', 'UCG': 'S', 'AGG': 'R', 'GGG': 'G', 'UCC': 'S', 'UCA': 'S', 'UAA': '*', 'GGA': 'G', 'UAC': 'Y', 'GAC': 'D', 'UAG': '*', 'AUA': 'I', 'GCA': 'A', 'CUU': 'L', 'GGC': 'G', 'AUG': 'M', 'CUG': 'L', 'GAG': 'E', 'CUC': 'L', 'AGA': 'R', 'CUA': 'L', 'GCC': 'A', 'AAA': 'K', 'AAG': 'K', 'CAA': 'Q', 'UUU': 'F', 'CGU': 'R', 'CGC': 'R', 'CGA': 'R', 'GCU': 'A', 'GAA': 'E', 'AUU': 'I', 'UUG': 'L', 'UUA': 'L', 'UGA': '*', 'UUC': 'F'}
+        rna_seq = ("AUG"
+                "UAC"
+                "UGG"
+                "CAC"
+                "GCU"
+                "ACU"
+                "GCU"
+                "CCA"
+                "UAU"
+                "ACU"
+                "CAC"
+                "CAG"
+                "AAU"
+                "AUC"
+                "AGU"
+                "ACA"
+                "GCG")
+        longest_peptide = get_longest_peptide(rna_sequence = rna_seq,
+                genetic_code = genetic_code)
+        assert isinstance(longest_peptide, str), "Oops: the longest peptide is {0}, not a string".format(longest_peptide)
+        message = "The longest peptide encoded by\n\t'{0}'\nis\n\t'{1}'\n".format(
+                rna_seq,
+                longest_peptide)
+        sys.stdout.write(message)
+        if longest_peptide == "MYWHATAPYTHQNISTA":
+            sys.stdout.write("Indeed.\n")
+    if args.profile:
+        sys.stderr.write(disable_stats().report())
+    return 0
 
 
 if __name__ == '__main__':
-    genetic_code = {'GUC': 'V', 'ACC': 'T', 'GUA': 'V', 'GUG': 'V', 'ACU': 'T', 'AAC': 'N', 'CCU': 'P', 'UGG': 'W', 'AGC': 'S', 'AUC': 'I', 'CAU': 'H', 'AAU': 'N', 'AGU': 'S', 'GUU': 'V', 'CAC': 'H', 'ACG': 'T', 'CCG': 'P', 'CCA': 'P', 'ACA': 'T', 'CCC': 'P', 'UGU': 'C', 'GGU': 'G', 'UCU': 'S', 'GCG': 'A', 'UGC': 'C', 'CAG': 'Q', 'GAU': 'D', 'UAU': 'Y', 'CGG': 'R', 'UCG': 'S', 'AGG': 'R', 'GGG': 'G', 'UCC': 'S', 'UCA': 'S', 'UAA': '*', 'GGA': 'G', 'UAC': 'Y', 'GAC': 'D', 'UAG': '*', 'AUA': 'I', 'GCA': 'A', 'CUU': 'L', 'GGC': 'G', 'AUG': 'M', 'CUG': 'L', 'GAG': 'E', 'CUC': 'L', 'AGA': 'R', 'CUA': 'L', 'GCC': 'A', 'AAA': 'K', 'AAG': 'K', 'CAA': 'Q', 'UUU': 'F', 'CGU': 'R', 'CGC': 'R', 'CGA': 'R', 'GCU': 'A', 'GAA': 'E', 'AUU': 'I', 'UUG': 'L', 'UUA': 'L', 'UGA': '*', 'UUC': 'F'}
-    rna_seq = ("AUG"
-            "UAC"
-            "UGG"
-            "CAC"
-            "GCU"
-            "ACU"
-            "GCU"
-            "CCA"
-            "UAU"
-            "ACU"
-            "CAC"
-            "CAG"
-            "AAU"
-            "AUC"
-            "AGU"
-            "ACA"
-            "GCG")
-    longest_peptide = get_longest_peptide(rna_sequence = rna_seq,
-            genetic_code = genetic_code)
-    assert isinstance(longest_peptide, str), "Oops: the longest peptide is {0}, not a string".format(longest_peptide)
-    message = "The longest peptide encoded by\n\t'{0}'\nis\n\t'{1}'\n".format(
-            rna_seq,
-            longest_peptide)
-    sys.stdout.write(message)
-    if longest_peptide == "MYWHATAPYTHQNISTA":
-        sys.stdout.write("Indeed.\n")
+    sys.exit(main())